@@ -5,4 +5,13 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'email_scheduler.settings')
 
 app = Celery('email_scheduler')
 app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# Send batches pick their queue per priority (emails.high / emails.default /
+# emails.bulk, see emails.routing); the dispatcher and Telex replies are
+# latency sensitive and share the high queue. Each queue has its own workers.
+app.conf.task_default_queue = 'emails.default'
+app.conf.task_routes = {
+    'emails.tasks.dispatch_due_emails': {'queue': 'emails.high'},
+    'emails.tasks.process_telex_message': {'queue': 'emails.high'},
+}
 app.autodiscover_tasks()
\ No newline at end of file
@@ -9,8 +9,10 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import json
 import os
 from pathlib import Path
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -158,12 +160,144 @@ EMAIL_HOST_USER = os.getenv('GMAIL_EMAIL')
 EMAIL_HOST_PASSWORD = os.getenv('GMAIL_APP_PASSWORD')
 
 
-CELERY_BROKER_URL = 'redis://localhost:6379'
+# Shared cache: idempotency keys, metrics, the Telex /list cache and the
+# timing wheel's invalidation log. gunicorn, Celery and the wheel must all see
+# the same entries, so it defaults to the Redis the Celery broker needs anyway.
+# CACHE_URL=locmem:// keeps a per-process cache, only for running everything
+# in one process (tests, local experiments).
+CACHE_URL = os.getenv('CACHE_URL', os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379'))
+if CACHE_URL.startswith('locmem://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+
+# API authentication: login issues a signed bearer token; verified tokens
+# are cached per process so requests skip the password hash and user query
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'emails.authentication.SignedTokenAuthentication',
+    ],
+}
+API_TOKEN_MAX_AGE = int(os.getenv('API_TOKEN_MAX_AGE', str(7 * 86400)))
+API_TOKEN_CACHE_SIZE = int(os.getenv('API_TOKEN_CACHE_SIZE', '10000'))
+API_TOKEN_CACHE_TTL = int(os.getenv('API_TOKEN_CACHE_TTL', '300'))
+# Bearer token for Prometheus to scrape /api/metrics/; staff users may read it too
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Retried /schedule and webhook calls replay the first response
+IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv('IDEMPOTENCY_WINDOW_SECONDS', '300'))
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+
+
+# Telex sender -> user id cache
+SENDER_CACHE_SIZE = int(os.getenv('SENDER_CACHE_SIZE', '10000'))
+SENDER_CACHE_TTL = int(os.getenv('SENDER_CACHE_TTL', '3600'))
+SENDER_CACHE_NEGATIVE_TTL = int(os.getenv('SENDER_CACHE_NEGATIVE_TTL', '60'))
+# How long a process trusts its own copy before checking the shared cache again
+SENDER_CACHE_LOCAL_TTL = int(os.getenv('SENDER_CACHE_LOCAL_TTL', '30'))
+
+
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379')
 CELERY_RESULT_BACKEND = 'redis://localhost:6379'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Africa/Lagos'
+# Batches are long-running; don't let one worker hoard a queue's backlog
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Due-email dispatcher (run by the beat process)
+EMAIL_DISPATCH_INTERVAL = float(os.getenv('EMAIL_DISPATCH_INTERVAL', '15'))
+EMAIL_DISPATCH_BATCH_SIZE = int(os.getenv('EMAIL_DISPATCH_BATCH_SIZE', '500'))
+EMAIL_DISPATCH_LEASE_SECONDS = int(os.getenv('EMAIL_DISPATCH_LEASE_SECONDS', '300'))
+EMAIL_SEND_BATCH_SIZE = int(os.getenv('EMAIL_SEND_BATCH_SIZE', '50'))
+# Failed sends are retried EMAIL_RETRY_BACKOFF_SECONDS * 2**n later, at most
+# EMAIL_MAX_ATTEMPTS times per occurrence; 5xx rejections of a message or its
+# recipients are not retried, login and connection failures are
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '5'))
+EMAIL_RETRY_BACKOFF_SECONDS = int(os.getenv('EMAIL_RETRY_BACKOFF_SECONDS', '60'))
+# Multi-recipient schedules: addresses per schedule, and per message
+# (packed as BCC; Gmail accepts up to 100 recipients per message)
+EMAIL_MAX_RECIPIENTS_PER_SCHEDULE = int(os.getenv('EMAIL_MAX_RECIPIENTS_PER_SCHEDULE', '1000'))
+EMAIL_MAX_RECIPIENTS_PER_MESSAGE = int(os.getenv('EMAIL_MAX_RECIPIENTS_PER_MESSAGE', '100'))
+# 'batch' sends each batch over one connection; 'pool' hands messages to a
+# per-process pool of EMAIL_POOL_SIZE threads with persistent connections
+# (run pool-mode workers with a low --concurrency, the threads do the I/O)
+EMAIL_DELIVERY_MODE = os.getenv('EMAIL_DELIVERY_MODE', 'batch')
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', '32'))
+EMAIL_POOL_QUEUE_SIZE = int(os.getenv('EMAIL_POOL_QUEUE_SIZE', '64'))
+EMAIL_POOL_HEALTH_CHECK_SECONDS = float(os.getenv('EMAIL_POOL_HEALTH_CHECK_SECONDS', '30'))
+# One-off sends due within this many seconds of scheduling get high priority
+EMAIL_URGENT_HORIZON_SECONDS = int(os.getenv('EMAIL_URGENT_HORIZON_SECONDS', '3600'))
+
+# In-memory timing wheel (python manage.py run_timing_wheel): fires emails
+# due within the horizon on time, refilling the window periodically
+EMAIL_WHEEL_TICK = float(os.getenv('EMAIL_WHEEL_TICK', '0.1'))
+EMAIL_WHEEL_HORIZON_SECONDS = int(os.getenv('EMAIL_WHEEL_HORIZON_SECONDS', '300'))
+EMAIL_WHEEL_REFILL_SECONDS = int(os.getenv('EMAIL_WHEEL_REFILL_SECONDS', '60'))
+
+# Send throttling: '*' limits the whole sending account, a domain key limits
+# sends to that recipient domain and 'default' covers all other domains.
+# Windows are per_second, per_minute, per_hour and per_day. Buckets are shared
+# through THROTTLE_REDIS_URL (the cache's Redis by default), otherwise kept
+# per process.
+EMAIL_RATE_LIMITS = json.loads(os.getenv('EMAIL_RATE_LIMITS', json.dumps({
+    '*': {'per_minute': 60, 'per_day': 2000},
+    'default': {'per_minute': 30},
+})))
+THROTTLE_REDIS_URL = os.getenv('THROTTLE_REDIS_URL', None if CACHE_URL.startswith('locmem://') else CACHE_URL)
+
+# Compiled message templates kept per worker
+EMAIL_TEMPLATE_CACHE_SIZE = int(os.getenv('EMAIL_TEMPLATE_CACHE_SIZE', '512'))
+
+# Keyset pagination for the list endpoint
+EMAIL_LIST_PAGE_SIZE = int(os.getenv('EMAIL_LIST_PAGE_SIZE', '50'))
+EMAIL_LIST_MAX_PAGE_SIZE = int(os.getenv('EMAIL_LIST_MAX_PAGE_SIZE', '500'))
+
+# Streaming export (endpoint and export_schedules command): rows per fetch
+EMAIL_EXPORT_CHUNK_SIZE = int(os.getenv('EMAIL_EXPORT_CHUNK_SIZE', '2000'))
+
+# Bulk scheduling endpoint
+EMAIL_BULK_MAX_ITEMS = int(os.getenv('EMAIL_BULK_MAX_ITEMS', '10000'))
+# Addresses across all items of one request, bounding the EmailRecipient
+# rows built in memory and inserted in one transaction
+EMAIL_BULK_MAX_RECIPIENTS = int(os.getenv('EMAIL_BULK_MAX_RECIPIENTS', '20000'))
+EMAIL_BULK_INSERT_BATCH_SIZE = int(os.getenv('EMAIL_BULK_INSERT_BATCH_SIZE', '1000'))
+
+# Telex webhook; in async mode the webhook returns 202 and a worker posts
+# the reply to TELEX_REPLY_URL (formatted with the channel_id)
+TELEX_ASYNC_WEBHOOK = os.getenv('TELEX_ASYNC_WEBHOOK', 'False').lower() in ['true', '1', 'yes']
+TELEX_REPLY_URL = os.getenv('TELEX_REPLY_URL', 'https://ping.telex.im/v1/webhooks/{channel_id}')
+TELEX_REPLY_TIMEOUT = float(os.getenv('TELEX_REPLY_TIMEOUT', '5'))
+TELEX_REPLY_RETRIES = int(os.getenv('TELEX_REPLY_RETRIES', '3'))
+TELEX_REPLY_CONCURRENCY = int(os.getenv('TELEX_REPLY_CONCURRENCY', '10'))
+
+# Telex /list replies: emails per page and how long rendered pages are cached
+TELEX_LIST_PAGE_SIZE = int(os.getenv('TELEX_LIST_PAGE_SIZE', '10'))
+TELEX_LIST_CACHE_TTL = int(os.getenv('TELEX_LIST_CACHE_TTL', '3600'))
+
+# Delivery attempt log
+DELIVERY_LOG_RETENTION_DAYS = int(os.getenv('DELIVERY_LOG_RETENTION_DAYS', '90'))
+
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-due-emails': {
+        'task': 'emails.tasks.dispatch_due_emails',
+        'schedule': EMAIL_DISPATCH_INTERVAL,
+    },
+    'prune-delivery-attempts': {
+        'task': 'emails.tasks.prune_delivery_attempts',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
 
 TIME_ZONE = 'Africa/Lagos'
 USE_TZ = True
\ No newline at end of file
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EmailsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'emails'
+
+    def ready(self):
+        # Registers the sender and token cache invalidation signals
+        from . import authentication, user_cache
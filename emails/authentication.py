@@ -0,0 +1,140 @@
+"""
+Signed bearer tokens for the API.
+
+Login checks the password once and issues a token signed with SECRET_KEY
+(`Authorization: Bearer <token>`). Each request then costs an HMAC check
+instead of a PBKDF2 hash. Verified tokens are kept in a bounded in-process
+LRU, so repeat requests skip the signature check and the user query too.
+
+A token embeds a fingerprint of the user's password hash, so changing the
+password revokes every token issued before it. User saves and deletes drop
+that user's cached tokens in this process; other processes notice within
+API_TOKEN_CACHE_TTL seconds.
+
+Metrics scrapers, which have no user, present METRICS_TOKEN instead.
+"""
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import signing
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.permissions import BasePermission
+
+SALT = 'emails.api-token'
+KEYWORD = b'bearer'
+METRICS_SCOPE = 'metrics'
+
+# token -> (user, monotonic expiry)
+_local = OrderedDict()
+_lock = threading.Lock()
+
+
+def _fingerprint(user):
+    return user.get_session_auth_hash()[:16]
+
+
+def issue_token(user):
+    """A bearer token for `user`, valid for API_TOKEN_MAX_AGE seconds"""
+    return signing.dumps({'u': user.id, 'p': _fingerprint(user)}, salt=SALT, compress=True)
+
+
+def _remember(token, user, ttl):
+    with _lock:
+        _local[token] = (user, time.monotonic() + ttl)
+        _local.move_to_end(token)
+        while len(_local) > settings.API_TOKEN_CACHE_SIZE:
+            _local.popitem(last=False)
+
+
+def verify_token(token):
+    """Return the active user a token was issued to, or None if it is invalid or expired"""
+    with _lock:
+        entry = _local.get(token)
+        if entry and entry[1] > time.monotonic():
+            _local.move_to_end(token)
+            return entry[0]
+
+    try:
+        payload = signing.loads(token, salt=SALT, max_age=settings.API_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+    user = User.objects.filter(id=payload.get('u'), is_active=True).first()
+    if user is None or _fingerprint(user) != payload.get('p'):
+        return None
+
+    # Never keep a token cached past its own expiry (tokens end in :timestamp:signature)
+    issued_at = signing.b62_decode(token.rsplit(':', 2)[-2])
+    remaining = settings.API_TOKEN_MAX_AGE - (time.time() - issued_at)
+    _remember(token, user, min(settings.API_TOKEN_CACHE_TTL, remaining))
+    return user
+
+
+def forget_user(user_id):
+    """Drop this process's cached tokens for a user"""
+    with _lock:
+        for token in [t for t, (user, _) in _local.items() if user.id == user_id]:
+            del _local[token]
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    forget_user(instance.id)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """DRF authentication for `Authorization: Bearer <token>` headers"""
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != KEYWORD:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header')
+
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header')
+
+        user = verify_token(token)
+        if user is None:
+            raise exceptions.AuthenticationFailed('Invalid or expired token')
+        return (user, token)
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    `Authorization: Bearer <METRICS_TOKEN>` for Prometheus scrapes.
+
+    Any other header falls through to the next authentication class.
+    """
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not settings.METRICS_TOKEN or len(auth) != 2 or auth[0].lower() != KEYWORD:
+            return None
+        if not hmac.compare_digest(auth[1], settings.METRICS_TOKEN.encode()):
+            return None
+        return (AnonymousUser(), METRICS_SCOPE)
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+class HasMetricsToken(BasePermission):
+    """Requests authenticated by MetricsTokenAuthentication"""
+
+    def has_permission(self, request, view):
+        return request.auth == METRICS_SCOPE
@@ -0,0 +1,480 @@
+"""
+Offline benchmark scenarios, run with `python manage.py benchmark`.
+
+Each scenario takes the command options and returns a dict of results;
+register new ones with the @scenario decorator. Scenarios registered with
+db=True run against a throwaway test database seeded with
+`--volume` schedules, with Celery in eager mode and the locmem email
+backend, so nothing leaves the machine.
+"""
+import multiprocessing
+import random
+import resource
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from pytz import timezone as pytz_timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import authentication
+from .models import ScheduledEmail
+from .parser import parse_command
+from .recurrence import PERIODS, next_occurrence
+from .serializers import ScheduledEmailSerializer, serialize_values, value_fields
+from .smtp_pool import SMTPPool
+from .smtp_sink import start_sink
+from .tasks import claim_due_emails, enqueue_send_batches
+
+SCENARIOS = {}
+
+SEED_USERS = 1000
+
+# Result sizes of the serialize scenario
+SERIALIZE_SIZES = [1000, 10000, 100000]
+
+# Per-command reply delay of the SMTP sink in the delivery scenario
+SINK_LATENCY = 0.002
+
+# Commands as users actually send them, via Telex and the parse endpoint
+PARSER_CORPUS = [
+    '/schedule "Don\'t forget the meeting!" to john@example.com at 9am with header "Meeting Reminder"',
+    '/schedule "Happy Birthday!" to mom@example.com at 7am every birthday with header "Birthday Wishes"',
+    '/schedule "Monthly report check-in" to team@example.com at 10am monthly with header "Monthly Update"',
+    '/schedule "Stand-up in 10 minutes" to dev-team@company.io at 9:50am daily',
+    '/schedule "Pay rent" to me@email.com at 8am monthly with header "Rent"',
+    '/schedule "Happy work anniversary!" to ada.lovelace@firm.co.uk at 9am job anniversary with header "Congrats"',
+    '/schedule "Weekly sync notes" to pm@startup.ng on friday at 4:30pm weekly',
+    '/schedule "Submit timesheet" to staff@company.com at 17:00 every week with header "Timesheets"',
+    '/schedule "Renew domain" to ops@example.org on 2026-03-01 at 10am yearly',
+    '/schedule "Call grandma" to me@example.com at 6pm',
+    "Send me 'Hello world' on Friday at 2:30pm",
+    "Send 'Birthday message' to john@example.com at 12:00 every birthday",
+    "Remind 'Quarterly taxes due' to finance@example.com on 2026-04-15 at 9:00am",
+    "Send 'Good morning team' to all@example.com every day at 8:00am",
+]
+
+
+def scenario(name, db=False):
+    """Register a benchmark scenario under `name`; db=True needs the seeded database"""
+    def register(func):
+        func.needs_db = db
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def summarize(samples, operations=None, queries=None):
+    """Latency percentiles (microseconds) and throughput for timed samples in seconds"""
+    samples = sorted(samples)
+    total = sum(samples)
+    operations = operations or len(samples)
+    result = {
+        'operations': operations,
+        'total_seconds': round(total, 6),
+        'ops_per_second': round(operations / total, 1) if total else None,
+        'p50_us': round(samples[len(samples) // 2] * 1e6, 2),
+        'p99_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6, 2),
+        'mean_us': round(statistics.fmean(samples) * 1e6, 2),
+    }
+    if queries is not None:
+        result['queries_per_op'] = round(sum(queries) / operations, 2)
+        result['max_queries'] = max(queries)
+    return result
+
+
+def seed_schedules(volume, due=False, priority='default'):
+    """
+    Insert `volume` active schedules spread over SEED_USERS users.
+
+    Schedules are spread over the next 30 days, or the last hour when `due`.
+    """
+    now = timezone.now()
+    User.objects.bulk_create(
+        [User(username=f'bench{i}', email=f'bench{i}@example.com') for i in range(SEED_USERS)],
+        ignore_conflicts=True
+    )
+    users = list(User.objects.filter(username__startswith='bench').order_by('id'))
+
+    rng = random.Random(7)
+    recurrences = ['once', 'daily', 'weekly', 'monthly', 'yearly']
+    batch = []
+    for i in range(volume):
+        if due:
+            send_at = now - timedelta(seconds=rng.randint(0, 3600))
+        else:
+            send_at = now + timedelta(seconds=rng.randint(60, 30 * 86400))
+        user = users[i % len(users)]
+        batch.append(ScheduledEmail(
+            user=user,
+            recipient_email=user.email,
+            subject=f'Benchmark {i}',
+            content='Benchmark body ' * 20,
+            email_header='Benchmark',
+            scheduled_time=send_at,
+            next_send=send_at,
+            recurrence_type=rng.choice(recurrences),
+            priority=priority,
+        ))
+        if len(batch) == 5000:
+            ScheduledEmail.objects.bulk_create(batch)
+            batch = []
+    ScheduledEmail.objects.bulk_create(batch)
+    return users
+
+
+def timed_requests(requests, iterations):
+    """Run `requests` (callables taking the iteration number) and time each call"""
+    samples = []
+    queries = []
+    for i in range(iterations):
+        for request in requests:
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request(i)
+                samples.append(time.perf_counter() - start)
+            queries.append(len(captured))
+            if response.status_code >= 400:
+                raise RuntimeError(f'Benchmark request failed ({response.status_code}): {response.content[:200]}')
+    return summarize(samples, queries=queries)
+
+
+@scenario('parser')
+def bench_parser(options):
+    """Single-pass command parser over the corpus"""
+    samples = []
+    for _ in range(options['iterations']):
+        for text in PARSER_CORPUS:
+            start = time.perf_counter()
+            parse_command(text)
+            samples.append(time.perf_counter() - start)
+
+    return summarize(samples)
+
+
+@scenario('recurrence')
+def bench_recurrence(options):
+    """next_occurrence for every recurrence type, up to 50 years into a series"""
+    rng = random.Random(42)
+    tz = pytz_timezone('Africa/Lagos')
+    cases = []
+    for recurrence_type in PERIODS:
+        for _ in range(options['iterations']):
+            anchor = tz.localize(datetime(2000, rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23)))
+            cases.append((anchor, recurrence_type, anchor + timedelta(days=rng.randint(0, 365 * 50))))
+
+    samples = []
+    for anchor, recurrence_type, after in cases:
+        start = time.perf_counter()
+        next_occurrence(anchor, recurrence_type, after, 'Africa/Lagos')
+        samples.append(time.perf_counter() - start)
+
+    return summarize(samples)
+
+
+def bearer_headers():
+    """Authorization headers for the seeded users, in seed order"""
+    users = User.objects.filter(username__startswith='bench').order_by('id')
+    return [{'HTTP_AUTHORIZATION': f'Bearer {authentication.issue_token(user)}'} for user in users]
+
+
+@scenario('schedule', db=True)
+def bench_schedule(options):
+    """POST /api/email/schedule/ with distinct payloads, as the seeded users"""
+    client = APIClient()
+    headers = bearer_headers()
+    scheduled_time = (datetime.now() + timedelta(days=1)).replace(microsecond=0).isoformat()
+
+    def schedule(i):
+        return client.post('/api/email/schedule/', {
+            'recipient_email': f'bench{i % SEED_USERS}@example.com',
+            'content': f'Benchmark message {i}',
+            'scheduled_time': scheduled_time,
+            'recurrence_type': 'weekly',
+        }, format='json', **headers[i % len(headers)])
+
+    return timed_requests([schedule], options['iterations'])
+
+
+@scenario('list', db=True)
+def bench_list(options):
+    """GET /api/email/list/ first pages as the seeded users, unfiltered and per recipient"""
+    client = APIClient()
+    headers = bearer_headers()
+
+    def list_all(i):
+        return client.get('/api/email/list/', {'page_size': 50}, **headers[i % len(headers)])
+
+    def list_recipient(i):
+        return client.get('/api/email/list/', {
+            'recipient_email': f'bench{i % len(headers)}@example.com',
+            'fields': 'id,subject,scheduled_time',
+        }, **headers[i % len(headers)])
+
+    return timed_requests([list_all, list_recipient], options['iterations'])
+
+
+@scenario('webhook', db=True)
+def bench_webhook(options):
+    """Telex webhook with a mix of /schedule, /list and small talk"""
+    client = APIClient()
+
+    def message(text):
+        def send(i):
+            return client.post('/api/telex/webhook/', {
+                'message': text.format(i=i),
+                'sender_email': f'bench{i % SEED_USERS}@example.com',
+                'channel_id': 'bench',
+            }, format='json')
+        return send
+
+    return timed_requests([
+        message('/schedule "Benchmark {i}" to team{i}@example.com at 9am daily with header "Bench"'),
+        message('/list'),
+        message('hi there'),
+    ], options['iterations'])
+
+
+@scenario('auth', db=True)
+def bench_auth(options):
+    """
+    Per-request authentication cost: a bearer token served from the
+    in-process cache, the same token verified cold (signature check and
+    user query), and the password check login runs once per token.
+    """
+    user = User.objects.create_user('bench-auth', 'bench-auth@example.com', 'bench-password')
+    token = authentication.issue_token(user)
+    request = APIRequestFactory().get('/api/email/list/', HTTP_AUTHORIZATION=f'Bearer {token}')
+    backend = authentication.SignedTokenAuthentication()
+
+    def timed(func, iterations):
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        return sorted(samples)
+
+    def cold():
+        authentication.forget_user(user.id)
+        backend.authenticate(request)
+
+    backend.authenticate(request)
+    result = summarize(timed(lambda: backend.authenticate(request), options['iterations']))
+    cold_samples = timed(cold, options['iterations'])
+    # PBKDF2 is deliberately slow; a handful of samples is enough
+    password_samples = timed(lambda: user.check_password('bench-password'), min(options['iterations'], 20))
+
+    result['cold_p50_us'] = round(cold_samples[len(cold_samples) // 2] * 1e6, 2)
+    result['check_password_p50_us'] = round(password_samples[len(password_samples) // 2] * 1e6, 2)
+    result['speedup_vs_password'] = round(result['check_password_p50_us'] / result['p50_us'], 1)
+    return result
+
+
+@scenario('serialize', db=True)
+def bench_serialize(options):
+    """
+    Read and render list pages of 1k, 10k and 100k rows through
+    ScheduledEmailSerializer and through the values fast path, checking that
+    both produce the same JSON bytes. Seeds up to the largest size.
+    """
+    missing = max(SERIALIZE_SIZES) - ScheduledEmail.objects.count()
+    if missing > 0:
+        seed_schedules(missing)
+
+    emails = ScheduledEmail.objects.order_by('next_send', 'id')
+    fields, columns = value_fields()
+    renderer = JSONRenderer()
+
+    def drf(size):
+        page = list(emails.only(*fields)[:size])
+        return renderer.render(ScheduledEmailSerializer(page, many=True).data)
+
+    def fast(size):
+        return renderer.render(serialize_values(emails.values_list(*columns)[:size], fields))
+
+    result = {}
+    for size in SERIALIZE_SIZES:
+        label = f'{size // 1000}k'
+        timings = {}
+        for name, render in (('drf', drf), ('fast', fast)):
+            start = time.perf_counter()
+            body = render(size)
+            timings[name] = (time.perf_counter() - start, body)
+            result[f'{name}_rows_per_second_{label}'] = round(size / timings[name][0], 1)
+        if timings['drf'][1] != timings['fast'][1]:
+            raise RuntimeError(f'Fast path output differs from the serializer at {size} rows')
+        result[f'speedup_{label}'] = round(timings['drf'][0] / timings['fast'][0], 2)
+    return result
+
+
+@scenario('send', db=True)
+def bench_send(options):
+    """Dispatch and send `--volume` due emails through the batch sender"""
+    seed_schedules(options['volume'], due=True)
+
+    sent = 0
+    samples = []
+    queries = 0
+    while True:
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            email_ids = claim_due_emails(options['dispatch_batch_size'])
+            enqueue_send_batches(email_ids)
+            samples.append(time.perf_counter() - start)
+        queries += len(captured)
+        sent += len(mail.outbox)
+        mail.outbox = []
+        if not email_ids:
+            break
+
+    # Latencies here are per dispatch tick, throughput is per email
+    result = summarize(samples, operations=sent)
+    result['queries_per_op'] = round(queries / max(sent, 1), 2)
+    return result
+
+
+@scenario('priority', db=True)
+def bench_priority(options):
+    """
+    Drain a `--volume` email bulk campaign while one urgent email falls due
+    every dispatch tick. Reports the urgent send lag (due to sent) per
+    quarter of the drain; it should stay flat since the high tier is
+    claimed and sent first.
+    """
+    seed_schedules(options['volume'], due=True, priority='bulk')
+    user = User.objects.get(username='bench0')
+
+    waiting = {}
+    lags = []
+    sent = 0
+    tick = 0
+    start = time.perf_counter()
+    while True:
+        now = timezone.now()
+        urgent = ScheduledEmail.objects.create(
+            user=user,
+            recipient_email=user.email,
+            subject='Urgent',
+            content='Urgent benchmark body',
+            scheduled_time=now,
+            next_send=now,
+            recurrence_type='once',
+            priority='high',
+        )
+        waiting[urgent.id] = now
+
+        # Batches run inline here, high tier first, as its own workers would
+        email_ids = claim_due_emails(options['dispatch_batch_size'])
+        enqueue_send_batches(email_ids)
+
+        urgent_sent = ScheduledEmail.objects.filter(id__in=waiting, last_sent__isnull=False)
+        for email_id, last_sent in urgent_sent.values_list('id', 'last_sent'):
+            lags.append((tick, (last_sent - waiting.pop(email_id)).total_seconds()))
+        sent += len(mail.outbox)
+        mail.outbox = []
+        tick += 1
+        # Only the urgent email was due: the campaign has drained
+        if len(email_ids) <= 1:
+            break
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'operations': sent,
+        'ticks': tick,
+        'ops_per_second': round(sent / elapsed, 1) if elapsed else None,
+        'urgent_unsent': len(waiting),
+    }
+    quarter = max(tick / 4, 1)
+    for q in range(4):
+        samples = sorted(lag for t, lag in lags if q * quarter <= t < (q + 1) * quarter)
+        if samples:
+            result[f'urgent_p50_ms_q{q + 1}'] = round(samples[len(samples) // 2] * 1e3, 2)
+            result[f'urgent_p99_ms_q{q + 1}'] = round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e3, 2)
+    return result
+
+
+def _serve_sink(ports):
+    sink = start_sink(latency={'*': SINK_LATENCY})
+    ports.put(sink.server_address[1])
+    while True:
+        time.sleep(3600)
+
+
+def _sink_connection(port):
+    return get_connection(
+        'django.core.mail.backends.smtp.EmailBackend',
+        host='127.0.0.1', port=port, username='', password='',
+        use_tls=False, use_ssl=False, fail_silently=False, timeout=30,
+    )
+
+
+def _bench_message(i):
+    return EmailMessage(f'Benchmark {i}', 'Benchmark body ' * 20, 'bench@example.com', [f'bench{i}@example.com'])
+
+
+def _prefork_worker(port, messages, rss):
+    connection = _sink_connection(port)
+    connection.open()
+    for i in range(messages):
+        connection.send_messages([_bench_message(i)])
+    connection.close()
+    rss.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+@scenario('delivery')
+def bench_delivery(options):
+    """
+    Send `--iterations` messages to a local SMTP sink (SINK_LATENCY per
+    command, in its own process). First `--workers` forked processes each
+    send over one connection, like prefork Celery workers. Then a single
+    process sends through an SMTPPool of `--pool-size` threads. Reports
+    messages/second and RSS in KiB, summed over processes the way ps
+    counts it.
+    """
+    context = multiprocessing.get_context('fork')
+    ports = context.Queue()
+    sink = context.Process(target=_serve_sink, args=(ports,), daemon=True)
+    sink.start()
+    port = ports.get(timeout=10)
+    messages = options['iterations']
+    result = {'operations': messages}
+
+    try:
+        workers = options['workers']
+        rss = context.Queue()
+        share, extra = divmod(messages, workers)
+        processes = [
+            context.Process(target=_prefork_worker, args=(port, share + (i < extra), rss))
+            for i in range(workers)
+        ]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        worker_rss = [rss.get(timeout=600) for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        result['prefork_messages_per_second'] = round(messages / elapsed, 1)
+        result['prefork_rss_kib'] = sum(worker_rss)
+
+        pool_size = options['pool_size']
+        pool = SMTPPool(size=pool_size, queue_size=pool_size * 2, connection_factory=lambda: _sink_connection(port))
+        start = time.perf_counter()
+        futures = [pool.submit(_bench_message(i)) for i in range(messages)]
+        errors = sum(1 for future in futures if future.result()[0] is not None)
+        elapsed = time.perf_counter() - start
+        pool.close()
+        result['pool_messages_per_second'] = round(messages / elapsed, 1)
+        result['pool_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['pool_errors'] = errors
+    finally:
+        sink.terminate()
+    return result
@@ -0,0 +1,98 @@
+"""
+Request dedupe for retried webhooks and schedule calls.
+
+A request is identified either by an explicit `Idempotency-Key` header or
+by a hash of its identifying parts (sender, channel, text, ...) within
+IDEMPOTENCY_WINDOW_SECONDS, and in both cases by the authenticated caller,
+so one user's key or body never replays another user's response. The first
+response is stored in the cache with a TTL and replayed for repeats,
+without touching the DB or broker again.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+IN_FLIGHT = 'in-flight'
+IN_FLIGHT_TIMEOUT = 60
+
+
+def _digest(raw):
+    return 'idem:' + hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def idempotency_keys(scope, explicit_key, parts, caller=None):
+    """
+    Cache keys for a request, newest first, or [] when it should not be deduped.
+
+    `caller` is the authenticated user's pk (None for anonymous requests).
+    Hashed keys cover the current and previous window so a retry that
+    straddles a window boundary still matches.
+    """
+    caller = '' if caller is None else caller
+    if explicit_key:
+        return [_digest(f"{scope}|{caller}|key|{explicit_key}")]
+    if parts is None:
+        return []
+
+    window = int(time.time() // settings.IDEMPOTENCY_WINDOW_SECONDS)
+    body = '\x1f'.join(str(part) for part in parts)
+    return [_digest(f"{scope}|{caller}|{w}|{body}") for w in (window, window - 1)]
+
+
+def idempotent(scope, key_parts):
+    """
+    Make an APIView handler idempotent.
+
+    `key_parts(request)` returns the values that identify a repeat of the
+    request, or None to skip dedupe for it.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            explicit_key = request.headers.get('Idempotency-Key')
+            keys = idempotency_keys(scope, explicit_key, key_parts(request), request.user.pk)
+            if not keys:
+                return handler(self, request, *args, **kwargs)
+
+            stored = cache.get_many(keys)
+            for key in keys:
+                if key not in stored:
+                    continue
+                if stored[key] == IN_FLIGHT:
+                    return Response({
+                        'status': 'error',
+                        'message': 'This request is already being processed'
+                    }, status=status.HTTP_409_CONFLICT)
+
+                replay = Response(stored[key]['data'], status=stored[key]['status_code'])
+                replay['Idempotent-Replayed'] = 'true'
+                return replay
+
+            key = keys[0]
+            if not cache.add(key, IN_FLIGHT, IN_FLIGHT_TIMEOUT):
+                return Response({
+                    'status': 'error',
+                    'message': 'This request is already being processed'
+                }, status=status.HTTP_409_CONFLICT)
+
+            try:
+                response = handler(self, request, *args, **kwargs)
+            except Exception:
+                cache.delete(key)
+                raise
+
+            # Server errors are not remembered so the client can retry them
+            if response.status_code < 500:
+                ttl = settings.IDEMPOTENCY_KEY_TTL if explicit_key else settings.IDEMPOTENCY_WINDOW_SECONDS * 2
+                cache.set(key, {'status_code': response.status_code, 'data': response.data}, ttl)
+            else:
+                cache.delete(key)
+
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,46 @@
+"""
+Per-user cache of rendered Telex /list replies.
+
+Each user has a version token in the Django cache, and rendered pages are
+stored under that token. Creating, cancelling or sending a user's emails
+replaces the token with invalidate_lists(), one set_many for any number of
+users, so stale pages are never read again and simply expire. A repeated
+/list with nothing changed is served from the cache without touching the
+database.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+PREFIX = 'telex-list'
+
+
+def _version_key(user_id):
+    return f'{PREFIX}:version:{user_id}'
+
+
+def _version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, settings.TELEX_LIST_CACHE_TTL)
+        version = cache.get(key)
+    return version
+
+
+def cached_page(user_id, page, render):
+    """The rendered page for this user, calling render(user_id, page) on a miss"""
+    key = f'{PREFIX}:{user_id}:{_version(user_id)}:{page}'
+    reply = cache.get(key)
+    if reply is None:
+        reply = render(user_id, page)
+        cache.set(key, reply, settings.TELEX_LIST_CACHE_TTL)
+    return reply
+
+
+def invalidate_lists(user_ids):
+    """Drop the cached /list pages of these users"""
+    versions = {_version_key(user_id): uuid.uuid4().hex for user_id in set(user_ids) if user_id}
+    if versions:
+        cache.set_many(versions, settings.TELEX_LIST_CACHE_TTL)
@@ -0,0 +1,121 @@
+import json
+import platform
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from email_scheduler.celery import app as celery_app
+from emails.benchmarks import SCENARIOS, seed_schedules
+
+
+class Command(BaseCommand):
+    help = (
+        'Run offline benchmark scenarios and report throughput, latency and query counts. '
+        'Database scenarios use a throwaway test database, eager Celery and the locmem email backend.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios', nargs='*', help=f'Scenarios to run (default: all). Available: {", ".join(SCENARIOS)}'
+        )
+        parser.add_argument('--iterations', type=int, default=1000, help='Repetitions per scenario')
+        parser.add_argument('--volume', type=int, default=10000, help='Schedules seeded before database scenarios')
+        parser.add_argument(
+            '--dispatch-batch-size', type=int, default=500, help='Rows claimed per dispatch tick in the send scenario'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=8, help='Sender processes in the delivery scenario (prefork model)'
+        )
+        parser.add_argument('--pool-size', type=int, default=32, help='SMTP pool threads in the delivery scenario')
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+        parser.add_argument('--compare', help='Print the change against a previous --output file')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+        results = {'meta': self.describe_run(options), 'scenarios': {}}
+
+        plain = [name for name in names if not SCENARIOS[name].needs_db]
+        with_db = [name for name in names if SCENARIOS[name].needs_db]
+
+        for name in plain:
+            results['scenarios'][name] = self.run_scenario(name, options)
+
+        if with_db:
+            self.run_with_database(with_db, options, results)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def run_scenario(self, name, options):
+        self.stdout.write(f'Running {name}...')
+        result = SCENARIOS[name](options)
+        self.stdout.write(json.dumps(result, indent=2))
+        return result
+
+    def run_with_database(self, names, options, results):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        try:
+            with override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                TELEX_ASYNC_WEBHOOK=False,
+                # Measure the sender itself, not the provider rate limits
+                EMAIL_RATE_LIMITS={},
+                THROTTLE_REDIS_URL=None,
+            ):
+                self.stdout.write(f'Seeding {options["volume"]} schedules...')
+                seed_schedules(options['volume'])
+                for name in names:
+                    results['scenarios'][name] = self.run_scenario(name, options)
+        finally:
+            celery_app.conf.task_always_eager = eager
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def describe_run(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True
+            ).stdout.strip()
+        except OSError:
+            commit = None
+
+        return {
+            'commit': commit or None,
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'volume': options['volume'],
+        }
+
+    def compare(self, path, results):
+        with open(path) as f:
+            baseline = json.load(f)
+
+        self.stdout.write(f'\nChange against {path} ({baseline.get("meta", {}).get("commit")}):')
+        for name, current in results['scenarios'].items():
+            previous = baseline.get('scenarios', {}).get(name)
+            if not previous:
+                continue
+            for metric, value in current.items():
+                old = previous.get(metric)
+                if not isinstance(value, (int, float)) or not old:
+                    continue
+                change = (value - old) / old * 100
+                self.stdout.write(f'  {name}.{metric}: {old} -> {value} ({change:+.1f}%)')
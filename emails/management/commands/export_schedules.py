@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emails.export import CONTENT_TYPES, export_chunks, export_queryset
+
+
+class Command(BaseCommand):
+    help = 'Stream the schedules of a user and/or recipient domain as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help='Only this user\'s schedules')
+        parser.add_argument('--domain', help='Only schedules to recipients at this domain')
+        parser.add_argument('--format', choices=list(CONTENT_TYPES), default='ndjson', help='Output format')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--active', action='store_true', help='Skip cancelled and finished schedules')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per round trip (EMAIL_EXPORT_CHUNK_SIZE)')
+        parser.add_argument('--output', help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['user_id'] is None and not options['domain']:
+            raise CommandError('Provide --user-id and/or --domain')
+
+        emails = export_queryset(
+            user_id=options['user_id'],
+            domain=options['domain'],
+            active_only=options['active'],
+        )
+        chunks = export_chunks(
+            emails, options['format'], compress=options['gzip'], chunk_size=options['chunk_size']
+        )
+
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
@@ -0,0 +1,56 @@
+import json
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emails.timing_wheel import WheelRunner
+
+
+class Command(BaseCommand):
+    help = 'Fire emails due within the horizon on time from an in-memory timing wheel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, help='Wheel resolution in seconds (EMAIL_WHEEL_TICK)')
+        parser.add_argument(
+            '--horizon', type=int, help='Seconds of schedules held in memory (EMAIL_WHEEL_HORIZON_SECONDS)'
+        )
+        parser.add_argument(
+            '--refill-interval', type=int, help='Seconds between window refills (EMAIL_WHEEL_REFILL_SECONDS)'
+        )
+        parser.add_argument(
+            '--report-interval', type=float, default=60.0, help='Seconds between stats reports (0 to disable)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            runner = WheelRunner(
+                tick=options['tick'],
+                horizon=options['horizon'],
+                refill_interval=options['refill_interval'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        stop = threading.Event()
+        if options['report_interval']:
+            def report():
+                while not stop.wait(options['report_interval']):
+                    self.stdout.write(json.dumps({
+                        'time': time.time(),
+                        'held': len(runner.wheel),
+                        'fired': runner.fired,
+                        'loaded_until': runner.loaded_until.isoformat() if runner.loaded_until else None,
+                    }))
+            threading.Thread(target=report, daemon=True).start()
+
+        self.stdout.write(
+            f'Timing wheel running: tick {runner.tick}s, horizon {runner.horizon}s, '
+            f'refill every {runner.refill_interval}s'
+        )
+        try:
+            runner.run_forever(stop)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
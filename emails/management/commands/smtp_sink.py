@@ -0,0 +1,84 @@
+import json
+import ssl
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emails.smtp_sink import SMTPSink
+
+
+def parse_latency(value):
+    """'0.05' for every command, or 'DATA=0.2,RCPT=0.01,*=0.005'"""
+    latency = {}
+    for part in value.split(','):
+        command, _, seconds = part.rpartition('=')
+        latency[(command or '*').upper()] = float(seconds)
+    return latency
+
+
+def parse_error(value):
+    """'451:0.05' -> (451, 0.05)"""
+    code, _, probability = value.partition(':')
+    code = int(code)
+    if not 400 <= code < 600:
+        raise ValueError('error codes must be 4xx or 5xx')
+    return code, float(probability)
+
+
+class Command(BaseCommand):
+    help = 'Run a local SMTP sink that accepts and counts messages, with optional latency, drops and errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--latency', default='0', help="Seconds per command: '0.05' or 'DATA=0.2,RCPT=0.01,*=0'")
+        parser.add_argument(
+            '--drop-rate', type=float, default=0.0, help='Probability of dropping the connection on a command'
+        )
+        parser.add_argument(
+            '--error', action='append', default=[], help="CODE:PROBABILITY reply injection, e.g. 451:0.05 (repeatable)"
+        )
+        parser.add_argument('--certfile', help='Certificate for STARTTLS')
+        parser.add_argument('--keyfile', help='Private key for STARTTLS')
+        parser.add_argument(
+            '--report-interval', type=float, default=10.0, help='Seconds between stats reports (0 to disable)'
+        )
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible fault injection')
+
+    def handle(self, *args, **options):
+        try:
+            latency = parse_latency(options['latency'])
+            errors = [parse_error(value) for value in options['error']]
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        ssl_context = None
+        if options['certfile']:
+            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_context.load_cert_chain(options['certfile'], options['keyfile'])
+
+        sink = SMTPSink(
+            (options['host'], options['port']),
+            latency=latency,
+            drop_rate=options['drop_rate'],
+            errors=errors,
+            ssl_context=ssl_context,
+            seed=options['seed'],
+        )
+
+        stop = threading.Event()
+        if options['report_interval']:
+            def report():
+                while not stop.wait(options['report_interval']):
+                    self.stdout.write(json.dumps(sink.stats.snapshot()))
+            threading.Thread(target=report, daemon=True).start()
+
+        self.stdout.write(f'SMTP sink listening on {options["host"]}:{options["port"]}')
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            sink.server_close()
+            self.stdout.write(json.dumps(sink.stats.snapshot()))
@@ -0,0 +1,187 @@
+"""
+Lightweight Prometheus metrics shared across gunicorn and Celery processes.
+
+Values live in the shared Django cache (Redis, see CACHE_URL), so every
+process increments the same counters and /api/metrics/ renders the
+combined view. Histograms store per-bucket counts plus count and sum;
+label values are declared up front so the endpoint knows every series.
+"""
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from . import throttle
+from .models import ScheduledEmail
+
+PREFIX = 'metrics'
+
+# Sums are stored as integers in millionths so they can use cache.incr
+SUM_SCALE = 1_000_000
+
+VIEWS = ['schedule', 'schedule_bulk', 'list', 'cancel', 'cancel_bulk', 'telex_webhook']
+
+
+def _incr(key, amount):
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if not cache.add(key, amount, None):
+            cache.incr(key, amount)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+
+    def inc(self, amount=1):
+        if amount:
+            _incr(f'{PREFIX}:{self.name}', amount)
+
+    def render(self):
+        value = cache.get(f'{PREFIX}:{self.name}', 0)
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} counter',
+            f'{self.name} {value}',
+        ]
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labelnames=(), labelvalues=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = list(buckets)
+        self.labelnames = tuple(labelnames)
+        self.series = [tuple(values) for values in labelvalues] or [()]
+
+    def _key(self, labels, part):
+        return ':'.join([PREFIX, self.name, *labels, part])
+
+    def observe(self, value, labels=()):
+        self.observe_many([value], labels)
+
+    def observe_many(self, values, labels=()):
+        """Record several observations with one increment per touched key"""
+        labels = tuple(labels)
+        counts = {}
+        for value in values:
+            bucket = next((str(b) for b in self.buckets if value <= b), '+Inf')
+            counts[bucket] = counts.get(bucket, 0) + 1
+        if not counts:
+            return
+
+        for bucket, count in counts.items():
+            _incr(self._key(labels, bucket), count)
+        _incr(self._key(labels, 'count'), len(values))
+        _incr(self._key(labels, 'sum'), int(sum(values) * SUM_SCALE))
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        for labels in self.series:
+            parts = [str(b) for b in self.buckets] + ['+Inf', 'count', 'sum']
+            keys = [self._key(labels, part) for part in parts]
+            stored = cache.get_many(keys)
+            values = {part: stored.get(key, 0) for part, key in zip(parts, keys)}
+
+            cumulative = 0
+            for bucket in parts[:-2]:
+                cumulative += values[bucket]
+                label_text = _format_labels(self.labelnames, labels, ('le', bucket))
+                lines.append(f'{self.name}_bucket{label_text} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_count{label_text} {values["count"]}')
+            lines.append(f'{self.name}_sum{label_text} {values["sum"] / SUM_SCALE}')
+        return lines
+
+
+EMAILS_SENT = Counter('emails_sent_total', 'Emails accepted by the SMTP server')
+EMAILS_FAILED = Counter('emails_failed_total', 'Emails whose SMTP send raised an error')
+EMAILS_SKIPPED = Counter(
+    'emails_skipped_inactive_total',
+    'Emails handed to a sender that were cancelled or no longer due'
+)
+
+EMAILS_DEFERRED = Counter(
+    'emails_deferred_total', 'Emails pushed to a later slot by the send rate limits'
+)
+SEND_LAG = Histogram(
+    'email_send_lag_seconds', 'Delay between next_send and the actual send',
+    [0.5, 1, 5, 15, 30, 60, 120, 300, 900, 3600]
+)
+SMTP_SECONDS = Histogram(
+    'email_smtp_seconds', 'Duration of a single SMTP send',
+    [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+)
+REQUEST_SECONDS = Histogram(
+    'http_request_seconds', 'API request latency',
+    [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5],
+    labelnames=['view'], labelvalues=[[view] for view in VIEWS]
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per API request',
+    [0, 1, 2, 5, 10, 20, 50, 100],
+    labelnames=['view'], labelvalues=[[view] for view in VIEWS]
+)
+
+
+def instrument(view):
+    """Record latency and DB query count for an APIView handler"""
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            queries = 0
+
+            def count_query(execute, sql, params, many, context):
+                nonlocal queries
+                queries += 1
+                return execute(sql, params, many, context)
+
+            start = time.perf_counter()
+            try:
+                with connection.execute_wrapper(count_query):
+                    return handler(*args, **kwargs)
+            finally:
+                REQUEST_SECONDS.observe(time.perf_counter() - start, [view])
+                REQUEST_QUERIES.observe(queries, [view])
+        return wrapper
+    return decorator
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in [EMAILS_SENT, EMAILS_FAILED, EMAILS_SKIPPED, EMAILS_DEFERRED, SEND_LAG,
+                   SMTP_SECONDS, REQUEST_SECONDS, REQUEST_QUERIES]:
+        lines.extend(metric.render())
+
+    overdue = ScheduledEmail.objects.filter(is_active=True, next_send__lt=timezone.now()).count()
+    lines.extend([
+        '# HELP emails_overdue_active Active emails whose next_send has passed',
+        '# TYPE emails_overdue_active gauge',
+        f'emails_overdue_active {overdue}',
+    ])
+
+    lines.extend([
+        '# HELP email_rate_bucket_tokens Tokens left in each send rate bucket',
+        '# TYPE email_rate_bucket_tokens gauge',
+    ])
+    for level in throttle.bucket_levels():
+        labels = f'account="{level["account"]}",scope="{level["scope"]}",window="{level["window"]}"'
+        lines.append(f'email_rate_bucket_tokens{{{labels}}} {level["tokens"]}')
+    return '\n'.join(lines) + '\n'
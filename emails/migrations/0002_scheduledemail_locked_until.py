@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledemail',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
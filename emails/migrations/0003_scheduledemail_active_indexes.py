@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0002_scheduledemail_locked_until'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='scheduledemail',
+            options={},
+        ),
+        migrations.AddIndex(
+            model_name='scheduledemail',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['next_send', 'id'], name='email_active_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledemail',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['recipient_email', 'next_send', 'id'], name='email_active_recipient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledemail',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', 'next_send', 'id'], name='email_active_user_idx'),
+        ),
+    ]
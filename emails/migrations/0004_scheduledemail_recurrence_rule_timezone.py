@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0003_scheduledemail_active_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledemail',
+            name='recurrence_rule',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='scheduledemail',
+            name='timezone',
+            field=models.CharField(default='Africa/Lagos', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='scheduledemail',
+            name='recurrence_type',
+            field=models.CharField(choices=[('once', 'Send Once'), ('daily', 'Every Day'), ('weekly', 'Every Week'), ('monthly', 'Every Month'), ('yearly', 'Every Year'), ('birthday', 'Every Birthday'), ('anniversary', 'Every Anniversary'), ('employment', 'Every Employment Anniversary'), ('custom', 'Custom Rule')], default='once', max_length=20),
+        ),
+    ]
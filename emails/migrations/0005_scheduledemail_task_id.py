@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0004_scheduledemail_recurrence_rule_timezone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledemail',
+            name='task_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0006_emailtemplate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledemail',
+            name='priority',
+            field=models.CharField(choices=[('high', 'High'), ('default', 'Default'), ('bulk', 'Bulk')], default='default', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledemail',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['priority', 'next_send', 'id'], name='email_active_priority_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0007_scheduledemail_priority'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempted_at', models.DateTimeField()),
+                ('outcome', models.CharField(choices=[('sent', 'Sent'), ('failed', 'Failed'), ('deferred', 'Deferred')], max_length=10)),
+                ('smtp_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('duration_ms', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('schedule', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='attempts', to='emails.scheduledemail')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['attempted_at'], name='delivery_attempted_at_idx'), models.Index(fields=['schedule', 'attempted_at'], name='delivery_schedule_idx')],
+            },
+        ),
+    ]
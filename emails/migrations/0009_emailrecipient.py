@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0008_deliveryattempt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('refused', 'Refused'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('smtp_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('last_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('schedule', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='emails.scheduledemail')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('schedule', 'email'), name='email_recipient_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0009_emailrecipient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledemail',
+            name='slot_reserved',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0010_scheduledemail_slot_reserved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledemail',
+            name='failed_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
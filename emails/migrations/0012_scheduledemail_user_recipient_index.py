@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 08:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0011_scheduledemail_failed_attempts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='scheduledemail',
+            name='email_active_recipient_idx',
+        ),
+        migrations.AddIndex(
+            model_name='scheduledemail',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', 'recipient_email', 'next_send', 'id'], name='email_active_recipient_idx'),
+        ),
+    ]
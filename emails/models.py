@@ -2,6 +2,26 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+
+class EmailTemplate(models.Model):
+    """
+    Reusable message body with {{ variable }} placeholders.
+
+    Campaigns store the content once here and each ScheduledEmail only
+    carries its per-recipient context.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    name = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    text_body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
 class ScheduledEmail(models.Model):
     RECURRENCE_CHOICES = [
         ('once', 'Send Once'),
@@ -12,22 +32,141 @@ class ScheduledEmail(models.Model):
         ('birthday', 'Every Birthday'),
         ('anniversary', 'Every Anniversary'),
         ('employment', 'Every Employment Anniversary'),
+        ('custom', 'Custom Rule'),
+    ]
+
+    PRIORITY_CHOICES = [
+        ('high', 'High'),
+        ('default', 'Default'),
+        ('bulk', 'Bulk'),
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     recipient_email = models.EmailField()
     subject = models.CharField(max_length=255)
-    content = models.TextField()
+    content = models.TextField(blank=True)
     email_header = models.CharField(max_length=255, blank=True, null=True)
+    template = models.ForeignKey(EmailTemplate, on_delete=models.PROTECT, null=True, blank=True)
+    # Per-recipient template variables, e.g. {"name": "Ada"}
+    context = models.JSONField(default=dict, blank=True)
     scheduled_time = models.DateTimeField()
     recurrence_type = models.CharField(max_length=20, choices=RECURRENCE_CHOICES, default='once')
+    # RFC 5545 RRULE, used when recurrence_type is 'custom'
+    recurrence_rule = models.CharField(max_length=500, blank=True, default='')
+    timezone = models.CharField(max_length=64, default='Africa/Lagos')
+    # Picks the dispatch tier and Celery queue, see emails.routing
+    priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='default')
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     last_sent = models.DateTimeField(null=True, blank=True)
     next_send = models.DateTimeField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    # Id of the queued batch task carrying this email, while it is leased
+    task_id = models.CharField(max_length=255, blank=True, default='')
+    # Throttle tokens are already taken for the deferred send at next_send
+    slot_reserved = models.BooleanField(default=False)
+    # Failed attempts at the current occurrence, see EMAIL_MAX_ATTEMPTS
+    failed_attempts = models.PositiveSmallIntegerField(default=0)
 
     def __str__(self):
         return f"{self.subject} - {self.user.email} - {self.scheduled_time}"
 
     class Meta:
-        ordering = ['scheduled_time']
\ No newline at end of file
+        # Partial indexes over active rows only, shaped for the due-email
+        # sweep (overall and per priority tier) and the per-user listings,
+        # optionally narrowed to one recipient. All of them end in
+        # (next_send, id) so those queries can read rows in order without a
+        # sort; emails/tests.py checks the plans.
+        indexes = [
+            models.Index(
+                fields=['next_send', 'id'],
+                name='email_active_due_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['priority', 'next_send', 'id'],
+                name='email_active_priority_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['user', 'recipient_email', 'next_send', 'id'],
+                name='email_active_recipient_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['user', 'next_send', 'id'],
+                name='email_active_user_idx',
+                condition=models.Q(is_active=True),
+            ),
+        ]
+
+class EmailRecipient(models.Model):
+    """
+    One address of a multi-recipient ScheduledEmail.
+
+    The schedule holds the content once; the sender packs its recipients
+    into BCC chunks and records each address's outcome for the current
+    occurrence here. Pending and failed addresses are (re)tried until the
+    occurrence is done; then a recurring schedule resets them to pending.
+    Addresses refused with a 5xx stay refused, and a schedule whose
+    addresses are all refused is deactivated.
+    """
+    RETRY_STATUSES = ('pending', 'failed')
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('refused', 'Refused'),
+        ('failed', 'Failed'),
+    ]
+
+    # Covered by email_recipient_unique
+    schedule = models.ForeignKey(
+        ScheduledEmail, on_delete=models.CASCADE, related_name='recipients', db_index=False
+    )
+    email = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    smtp_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.email} - {self.status}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'email'], name='email_recipient_unique'),
+        ]
+
+
+class DeliveryAttempt(models.Model):
+    """
+    Append-only record of one send attempt for a ScheduledEmail.
+
+    Batch workers buffer attempts and write them with a single bulk_create;
+    rows older than DELIVERY_LOG_RETENTION_DAYS are pruned by beat.
+    """
+    OUTCOME_CHOICES = [
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('deferred', 'Deferred'),
+    ]
+
+    # Covered by delivery_schedule_idx
+    schedule = models.ForeignKey(
+        ScheduledEmail, on_delete=models.CASCADE, related_name='attempts', db_index=False
+    )
+    attempted_at = models.DateTimeField()
+    outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES)
+    smtp_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    duration_ms = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"{self.schedule_id} - {self.outcome} - {self.attempted_at}"
+
+    class Meta:
+        # Time-range scans (reporting, pruning) and per-schedule history
+        indexes = [
+            models.Index(fields=['attempted_at'], name='delivery_attempted_at_idx'),
+            models.Index(fields=['schedule', 'attempted_at'], name='delivery_schedule_idx'),
+        ]
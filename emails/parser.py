@@ -0,0 +1,144 @@
+"""
+Single-pass parser for scheduling commands.
+
+Shared by the REST parse endpoint and the Telex /schedule command, e.g.
+    /schedule "Hello world" to john@example.com at 2pm on friday weekly with header "Hi"
+    Send 'Report due' to team@example.com on 2025-11-07 at 14:00
+"""
+import re
+from datetime import datetime, timedelta
+from pytz import timezone as pytz_timezone
+
+LAGOS_TZ = pytz_timezone('Africa/Lagos')
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Longer phrases come first so "job anniversary" wins over "anniversary"
+RECURRENCE_KEYWORDS = {
+    'every birthday': 'birthday',
+    'every anniversary': 'anniversary',
+    'job anniversary': 'employment',
+    'every day': 'daily',
+    'every week': 'weekly',
+    'every month': 'monthly',
+    'every year': 'yearly',
+    'employment': 'employment',
+    'anniversary': 'anniversary',
+    'birthday': 'birthday',
+    'monthly': 'monthly',
+    'weekly': 'weekly',
+    'yearly': 'yearly',
+    'daily': 'daily',
+}
+
+# Quoted spans are consumed whole, so emails, times and keywords inside the
+# message body are never mistaken for parts of the command.
+TOKEN_RE = re.compile(
+    r"""
+      \bheader\s+(?:"(?P<header_dq>[^"]+)"|'(?P<header_sq>[^']+)')
+    | "(?P<quoted_dq>[^"]+)"
+    | (?<!\w)'(?P<quoted_sq>[^']+)'(?!\w)
+    | (?P<email>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b)
+    | \b(?P<date>\d{4}-\d{2}-\d{2})\b
+    | \b(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<period>am|pm)\b
+    | \b(?P<hour24>\d{1,2}):(?P<minute24>\d{2})\b
+    | \b(?P<weekday>WEEKDAYS)\b
+    | \b(?P<recurrence>RECURRENCES)\b
+    """
+    .replace('WEEKDAYS', '|'.join(WEEKDAYS))
+    .replace('RECURRENCES', '|'.join(keyword.replace(' ', r'\s+') for keyword in RECURRENCE_KEYWORDS)),
+    re.IGNORECASE | re.VERBOSE,
+)
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def parse_command(text, now=None):
+    """
+    Extract content, recipient, header, time, day and recurrence from `text`.
+
+    The first occurrence of each part wins. `scheduled_time` is only set
+    when a time of day is present; without a date or weekday it is the next
+    occurrence of that time from `now`.
+    """
+    result = {
+        'content': None,
+        'recipient_email': None,
+        'email_header': None,
+        'scheduled_time': None,
+        'recurrence_type': 'once',
+    }
+    hour = minute = period = None
+    date = weekday = None
+    recurrence = None
+
+    for match in TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+
+        if kind in ('header_dq', 'header_sq'):
+            if result['email_header'] is None:
+                result['email_header'] = match.group(kind)
+        elif kind in ('quoted_dq', 'quoted_sq'):
+            if result['content'] is None:
+                result['content'] = match.group(kind)
+        elif kind == 'email':
+            if result['recipient_email'] is None:
+                result['recipient_email'] = match.group('email')
+        elif kind == 'date':
+            if date is None:
+                date = match.group('date')
+        elif kind == 'period':
+            if hour is None:
+                hour, minute, period = match.group('hour', 'minute', 'period')
+        elif kind == 'minute24':
+            if hour is None:
+                hour, minute = match.group('hour24', 'minute24')
+        elif kind == 'weekday':
+            if weekday is None:
+                weekday = WEEKDAYS.index(match.group('weekday').lower())
+        elif kind == 'recurrence':
+            if recurrence is None:
+                keyword = WHITESPACE_RE.sub(' ', match.group('recurrence').lower())
+                recurrence = RECURRENCE_KEYWORDS[keyword]
+
+    if recurrence:
+        result['recurrence_type'] = recurrence
+
+    if hour is not None:
+        result['scheduled_time'] = resolve_time(
+            int(hour), int(minute or 0), period, date, weekday, now
+        )
+
+    return result
+
+
+def resolve_time(hour, minute, period, date=None, weekday=None, now=None):
+    """Turn the parsed time parts into an aware datetime, or None if invalid"""
+    if period and period.lower() == 'pm' and hour != 12:
+        hour += 12
+    elif period and period.lower() == 'am' and hour == 12:
+        hour = 0
+
+    if hour > 23 or minute > 59:
+        return None
+
+    now = now or datetime.now(LAGOS_TZ)
+
+    if date:
+        try:
+            day = datetime.strptime(date, '%Y-%m-%d')
+        except ValueError:
+            return None
+        return LAGOS_TZ.localize(day.replace(hour=hour, minute=minute))
+
+    scheduled = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    if weekday is not None:
+        scheduled += timedelta(days=(weekday - now.weekday()) % 7)
+        if scheduled < now:
+            scheduled += timedelta(weeks=1)
+    # If time is in past, schedule for tomorrow
+    elif scheduled < now:
+        scheduled += timedelta(days=1)
+
+    return LAGOS_TZ.normalize(scheduled)
@@ -0,0 +1,175 @@
+"""
+Recurrence engine for scheduled emails.
+
+Occurrences are computed in closed form from the schedule's anchor
+(`scheduled_time`): the k-th occurrence is the anchor's local wall time
+shifted by k periods, so finding the next send is O(1) however long the
+schedule has been running. Monthly and yearly steps clamp to the end of
+shorter months (Jan 31 -> Feb 28/29, Feb 29 -> Feb 28), always from the
+anchor so the original day comes back afterwards. Wall times are
+localized in the schedule's time zone, so a 09:00 reminder stays at 09:00
+across DST changes. Custom schedules use an RFC 5545 RRULE via dateutil,
+evaluated against the naive local anchor; normalize_rule() puts rules in
+that form when they are saved.
+"""
+import calendar
+import logging
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from dateutil.rrule import rrulestr
+from django.conf import settings
+from pytz import timezone as pytz_timezone
+
+from .models import ScheduledEmail
+
+logger = logging.getLogger(__name__)
+
+UTC_UNTIL = re.compile(r'UNTIL=(\d{8}T\d{6})Z', re.IGNORECASE)
+
+# recurrence_type -> (unit, step)
+PERIODS = {
+    'daily': ('days', 1),
+    'weekly': ('days', 7),
+    'monthly': ('months', 1),
+    'yearly': ('months', 12),
+    'birthday': ('months', 12),
+    'anniversary': ('months', 12),
+    'employment': ('months', 12),
+}
+
+
+def add_months(value, months):
+    """Shift a naive datetime by whole months, clamping to the month's last day"""
+    total = value.month - 1 + months
+    year, month = value.year + total // 12, total % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def localize(tz, naive):
+    """Attach `tz` to a wall time; times skipped by DST move forward past the gap"""
+    return tz.normalize(tz.localize(naive))
+
+
+def nth_occurrence(anchor, recurrence_type, k, tz):
+    """The k-th occurrence (k=0 is the anchor itself) as an aware datetime"""
+    unit, step = PERIODS[recurrence_type]
+    if unit == 'days':
+        naive = anchor + timedelta(days=k * step)
+    else:
+        naive = add_months(anchor, k * step)
+    return localize(tz, naive)
+
+
+def next_occurrence(scheduled_time, recurrence_type, after, tz_name=None, rule=None):
+    """
+    First occurrence strictly after `after`, or None if the schedule has ended.
+
+    `scheduled_time` anchors the series; `rule` is an RRULE string used when
+    recurrence_type is 'custom'.
+    """
+    tz = pytz_timezone(tz_name or settings.TIME_ZONE)
+    anchor = scheduled_time.astimezone(tz).replace(tzinfo=None)
+    after_local = after.astimezone(tz).replace(tzinfo=None)
+
+    if recurrence_type == 'custom':
+        if not rule:
+            return None
+        naive = rrulestr(rule, dtstart=anchor).after(after_local)
+        return localize(tz, naive) if naive else None
+
+    if recurrence_type not in PERIODS:
+        return None
+
+    # Estimate k directly, then correct by at most a step either way
+    unit, step = PERIODS[recurrence_type]
+    if unit == 'days':
+        k = (after_local - anchor) // timedelta(days=step)
+    else:
+        k = ((after_local.year - anchor.year) * 12 + after_local.month - anchor.month) // step
+    k = max(k, 0)
+
+    while k > 0 and nth_occurrence(anchor, recurrence_type, k - 1, tz) > after:
+        k -= 1
+    while nth_occurrence(anchor, recurrence_type, k, tz) <= after:
+        k += 1
+    return nth_occurrence(anchor, recurrence_type, k, tz)
+
+
+def normalize_rule(rule, scheduled_time, tz_name=None):
+    """
+    Rewrite an RRULE into the form next_occurrence() evaluates, or raise ValueError.
+
+    DTSTART lines are dropped, since scheduled_time anchors the series, and
+    UTC UNTIL values become wall times in the schedule's time zone. The
+    result is checked with the same call the sender makes.
+    """
+    tz = pytz_timezone(tz_name or settings.TIME_ZONE)
+
+    def local_until(match):
+        until = datetime.strptime(match.group(1), '%Y%m%dT%H%M%S').replace(tzinfo=dt_timezone.utc)
+        return 'UNTIL=' + until.astimezone(tz).strftime('%Y%m%dT%H%M%S')
+
+    lines = [
+        UTC_UNTIL.sub(local_until, line.strip())
+        for line in (rule or '').strip().splitlines()
+        if line.strip() and not line.strip().upper().startswith('DTSTART')
+    ]
+    if not lines:
+        raise ValueError('Empty recurrence rule')
+    rule = '\n'.join(lines)
+
+    try:
+        next_occurrence(scheduled_time, 'custom', scheduled_time, tz_name, rule)
+    except (TypeError, ValueError, OverflowError) as e:
+        raise ValueError(str(e))
+    return rule
+
+
+def following_send(email, now):
+    """
+    Next send for `email` after one due at its current next_send went out at `now`.
+
+    Rolls forward from the previous next_send; occurrences missed while
+    the system was down are skipped rather than sent in a burst.
+    """
+    previous = email.next_send or email.scheduled_time
+    return next_occurrence(
+        email.scheduled_time,
+        email.recurrence_type,
+        max(previous, now),
+        email.timezone,
+        email.recurrence_rule,
+    )
+
+
+def advance_schedules(emails, now):
+    """
+    Roll a batch of just-sent emails forward and save them in one bulk UPDATE.
+
+    One-off emails and finished series are deactivated, as is any email
+    whose next send cannot be computed, so one bad row never holds back the
+    rest of the batch.
+    """
+    for email in emails:
+        email.last_sent = now
+        email.locked_until = None
+        email.task_id = ''
+        email.failed_attempts = 0
+        try:
+            next_send = None if email.recurrence_type == 'once' else following_send(email, now)
+        except Exception:
+            logger.exception("Could not compute the next send of email %s, deactivating it", email.id)
+            next_send = None
+        if next_send is None:
+            email.is_active = False
+        else:
+            email.next_send = next_send
+
+    ScheduledEmail.objects.bulk_update(
+        emails,
+        ['last_sent', 'locked_until', 'task_id', 'failed_attempts', 'next_send', 'is_active'],
+        batch_size=500,
+    )
+    return emails
@@ -0,0 +1,43 @@
+"""
+Send priorities and the Celery queues that carry them.
+
+Every ScheduledEmail has a priority. The dispatcher claims due rows
+tier by tier, and each batch goes to its tier's queue, which has its own
+workers (see Procfile). A large campaign therefore only ever delays other
+bulk mail.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+QUEUES = {
+    'high': 'emails.high',
+    'default': 'emails.default',
+    'bulk': 'emails.bulk',
+}
+
+# Claim order for the dispatcher
+PRIORITY_ORDER = ['high', 'default', 'bulk']
+
+
+def default_priority(recurrence_type, scheduled_time, bulk=False, now=None):
+    """
+    Priority for a schedule that did not ask for one.
+
+    Bulk requests are 'bulk'. One-off sends due within
+    EMAIL_URGENT_HORIZON_SECONDS (reminders, transactional mail) are 'high',
+    and everything else, recurring mail included, is 'default'.
+    """
+    if bulk:
+        return 'bulk'
+
+    now = now or timezone.now()
+    horizon = now + timedelta(seconds=settings.EMAIL_URGENT_HORIZON_SECONDS)
+    if recurrence_type == 'once' and scheduled_time <= horizon:
+        return 'high'
+    return 'default'
+
+
+def queue_for(priority):
+    return QUEUES.get(priority, QUEUES['default'])
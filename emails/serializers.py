@@ -1,9 +1,55 @@
+from django.utils import timezone
 from rest_framework import serializers
 from .models import ScheduledEmail
 
 class ScheduledEmailSerializer(serializers.ModelSerializer):
+    """
+    Representation of a schedule. Sparse field lists are served by the
+    values fast path below (value_fields, serialize_values), not by this class.
+    """
+
     class Meta:
         model = ScheduledEmail
-        fields = ['id', 'recipient_email', 'subject', 'content', 'email_header', 
-                  'scheduled_time', 'recurrence_type', 'is_active', 'created_at', 'last_sent']
-        read_only_fields = ['created_at', 'last_sent']
\ No newline at end of file
+        fields = ['id', 'recipient_email', 'subject', 'content', 'email_header', 'template', 'context',
+                  'scheduled_time', 'recurrence_type', 'recurrence_rule', 'timezone', 'priority',
+                  'is_active', 'created_at', 'last_sent']
+        read_only_fields = ['created_at', 'last_sent']
+
+
+# Fast read path: rows from .values_list() rendered exactly as the
+# serializer renders model instances, without building either
+VALUE_COLUMNS = {'template': 'template_id'}
+DATETIME_FIELDS = {'scheduled_time', 'created_at', 'last_sent'}
+
+
+def value_fields(fields=None):
+    """Requested fields in serializer output order, and the columns to select for them"""
+    fields = [f for f in ScheduledEmailSerializer.Meta.fields if fields is None or f in fields]
+    return fields, [VALUE_COLUMNS.get(f, f) for f in fields]
+
+
+def format_datetime(value, tz):
+    """DRF's DateTimeField output: ISO 8601 in the current timezone, UTC as 'Z'"""
+    if not value:
+        return None
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def serialize_values(rows, fields):
+    """
+    Turn value rows (in value_fields() column order) into the dicts
+    ScheduledEmailSerializer(many=True).data would give, limited to `fields`.
+    """
+    tz = timezone.get_current_timezone()
+    datetimes = [i for i, f in enumerate(fields) if f in DATETIME_FIELDS]
+    data = []
+    for row in rows:
+        if datetimes:
+            row = list(row)
+            for i in datetimes:
+                row[i] = format_datetime(row[i], tz)
+        data.append(dict(zip(fields, row)))
+    return data
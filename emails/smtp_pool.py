@@ -0,0 +1,142 @@
+"""
+Thread pool of persistent SMTP connections for I/O-bound delivery.
+
+With EMAIL_DELIVERY_MODE = 'pool', a worker process hands its messages to
+EMAIL_POOL_SIZE threads instead of sending them one at a time. Each thread
+owns one SMTP connection and keeps it open across batches. Before reusing a
+connection that has sat idle for EMAIL_POOL_HEALTH_CHECK_SECONDS, the
+thread sends a NOOP and reconnects if the server has gone away. The job
+queue holds at most EMAIL_POOL_QUEUE_SIZE messages; submit() blocks when
+it is full, so a worker never takes on more than its connections can send.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from smtplib import SMTPException, SMTPRecipientsRefused, SMTPResponseException
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class SMTPPool:
+    def __init__(self, size=None, queue_size=None, health_check_interval=None, connection_factory=None):
+        self.size = size or settings.EMAIL_POOL_SIZE
+        self.health_check_interval = (
+            settings.EMAIL_POOL_HEALTH_CHECK_SECONDS if health_check_interval is None else health_check_interval
+        )
+        self.connection_factory = connection_factory or (lambda: get_connection(fail_silently=False))
+        self.jobs = queue.Queue(maxsize=queue_size or settings.EMAIL_POOL_QUEUE_SIZE)
+        self.threads = [
+            threading.Thread(target=self._run, name=f'smtp-pool-{i}', daemon=True)
+            for i in range(self.size)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, message):
+        """
+        Queue a message, blocking while the pool is saturated.
+
+        Returns a Future resolving to (error, seconds, refused recipients);
+        error is None on success.
+        """
+        future = Future()
+        self.jobs.put((message, future))
+        return future
+
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self):
+        # Imported here: tasks imports this module's get_pool
+        from .tasks import send_with_reconnect
+
+        connection = self.connection_factory()
+        last_used = 0.0
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is _STOP:
+                    break
+                message, future = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                start = time.perf_counter()
+                refused = {}
+                try:
+                    self._ensure_open(connection, time.monotonic() - last_used)
+                except Exception as e:
+                    # Nothing was sent; the session error (connection, login)
+                    # is the message's, and the next job tries a fresh session
+                    error = e
+                    _discard(connection)
+                else:
+                    try:
+                        refused = send_with_reconnect(connection, message)
+                        error = None
+                    except Exception as e:
+                        error = e
+                        self._reset(connection, e)
+                last_used = time.monotonic()
+                future.set_result((error, time.perf_counter() - start, refused))
+        finally:
+            _discard(connection)
+
+    def _reset(self, connection, error):
+        """Keep a session the server rejected a message on; drop one that broke"""
+        smtp = getattr(connection, 'connection', None)
+        if smtp is not None and isinstance(error, (SMTPResponseException, SMTPRecipientsRefused)):
+            try:
+                smtp.rset()
+                return
+            except (SMTPException, OSError):
+                pass
+        _discard(connection)
+
+    def _ensure_open(self, connection, idle):
+        # Non-SMTP backends (locmem, console) have no session to check
+        smtp = getattr(connection, 'connection', None)
+        if smtp is not None and idle > self.health_check_interval:
+            try:
+                code, _ = smtp.noop()
+            except (SMTPException, OSError):
+                code = None
+            if code != 250:
+                logger.info("Pooled SMTP connection failed its health check, reconnecting")
+                _discard(connection)
+
+        if getattr(connection, 'connection', None) is None:
+            connection.open()
+
+
+def _discard(connection):
+    """Close a connection that may already be broken; the thread must survive it"""
+    try:
+        connection.close()
+    except (SMTPException, OSError):
+        connection.connection = None
+
+
+def get_pool():
+    """The process-wide pool, started on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SMTPPool()
+                atexit.register(_pool.close)
+    return _pool
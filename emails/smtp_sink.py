@@ -0,0 +1,224 @@
+"""
+Local SMTP stand-in for delivery benchmarks and end-to-end tests.
+
+Accepts and counts messages without delivering them. Per-command latency,
+random connection drops and 4xx/5xx replies can be injected to exercise
+connection reuse, reconnects and retries. Point EMAIL_HOST/EMAIL_PORT at
+it (with EMAIL_USE_TLS off unless a certificate is given for STARTTLS).
+Run it with `python manage.py smtp_sink`.
+"""
+import base64
+import logging
+import random
+import socketserver
+import ssl
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class SinkStats:
+    """Thread-safe counters for the whole server"""
+
+    def __init__(self, history=1000):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.recipients = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.started = time.monotonic()
+        # (messages, seconds) for recently closed connections
+        self.closed = deque(maxlen=history)
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def connection_closed(self, messages, seconds):
+        with self.lock:
+            self.closed.append((messages, seconds))
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            rates = [m / s for m, s in self.closed if m and s]
+            return {
+                'connections': self.connections,
+                'messages': self.messages,
+                'recipients': self.recipients,
+                'rejected': self.rejected,
+                'dropped': self.dropped,
+                'messages_per_second': round(self.messages / elapsed, 1) if elapsed else 0,
+                'per_connection_messages_per_second': round(sum(rates) / len(rates), 1) if rates else None,
+            }
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """One SMTP session"""
+
+    def setup(self):
+        super().setup()
+        self.tls_active = False
+
+    def reply(self, code, text):
+        lines = text if isinstance(text, list) else [text]
+        for i, line in enumerate(lines):
+            separator = '-' if i < len(lines) - 1 else ' '
+            self.wfile.write(f'{code}{separator}{line}\r\n'.encode())
+        self.wfile.flush()
+
+    def start_tls(self):
+        self.request = self.server.ssl_context.wrap_socket(self.request, server_side=True)
+        self.rfile = self.request.makefile('rb')
+        self.wfile = self.request.makefile('wb')
+        self.tls_active = True
+
+    def handle(self):
+        server = self.server
+        server.stats.add(connections=1)
+        started = time.monotonic()
+        messages = 0
+
+        try:
+            self.reply(220, 'smtp-sink ESMTP ready')
+            while True:
+                line = self.rfile.readline(65536)
+                if not line:
+                    break
+
+                command, _, argument = line.decode('utf-8', 'replace').rstrip('\r\n').partition(' ')
+                command = command.upper()
+                server.wait(command)
+
+                if server.should_drop():
+                    server.stats.add(dropped=1)
+                    break
+
+                if command in ('EHLO', 'HELO'):
+                    features = ['smtp-sink', 'AUTH PLAIN LOGIN', '8BITMIME', 'PIPELINING']
+                    if server.ssl_context and not self.tls_active:
+                        features.append('STARTTLS')
+                    self.reply(250, features if command == 'EHLO' else 'smtp-sink')
+                elif command == 'STARTTLS' and server.ssl_context and not self.tls_active:
+                    self.reply(220, 'Ready to start TLS')
+                    self.start_tls()
+                elif command == 'AUTH':
+                    self.authenticate(argument)
+                elif command in ('MAIL', 'RCPT'):
+                    error = server.pick_error()
+                    if error:
+                        server.stats.add(rejected=1)
+                        self.reply(error, 'Injected failure')
+                    else:
+                        if command == 'RCPT':
+                            server.stats.add(recipients=1)
+                        self.reply(250, 'OK')
+                elif command == 'DATA':
+                    self.reply(354, 'End data with <CR><LF>.<CR><LF>')
+                    if not self.read_data():
+                        break
+                    error = server.pick_error()
+                    if error:
+                        server.stats.add(rejected=1)
+                        self.reply(error, 'Injected failure')
+                    else:
+                        messages += 1
+                        server.stats.add(messages=1)
+                        self.reply(250, 'OK: queued')
+                elif command in ('RSET', 'NOOP'):
+                    self.reply(250, 'OK')
+                elif command == 'QUIT':
+                    self.reply(221, 'Bye')
+                    break
+                else:
+                    self.reply(502, 'Command not implemented')
+        except (ConnectionError, ssl.SSLError, OSError):
+            pass
+        finally:
+            seconds = time.monotonic() - started
+            server.stats.connection_closed(messages, seconds)
+            logger.info(
+                "Connection from %s closed: %d messages in %.2fs (%.1f msg/s)",
+                self.client_address[0], messages, seconds, messages / seconds if seconds else 0
+            )
+
+    def authenticate(self, argument):
+        mechanism, _, initial = argument.partition(' ')
+        mechanism = mechanism.upper()
+        if mechanism == 'PLAIN' and not initial:
+            self.reply(334, '')
+            self.rfile.readline()
+        elif mechanism == 'LOGIN':
+            if not initial:
+                self.reply(334, base64.b64encode(b'Username:').decode())
+                self.rfile.readline()
+            self.reply(334, base64.b64encode(b'Password:').decode())
+            self.rfile.readline()
+        self.reply(235, 'Authentication successful')
+
+    def read_data(self):
+        """Consume the message body; False if the client went away mid-message"""
+        while True:
+            line = self.rfile.readline(1 << 20)
+            if not line:
+                return False
+            if line in (b'.\r\n', b'.\n'):
+                return True
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Threaded SMTP sink.
+
+    latency: seconds to wait before answering, per command name, with '*'
+    as the default for the rest. drop_rate: probability of closing the
+    connection instead of answering a command. errors: (code, probability)
+    pairs applied to MAIL, RCPT and the end of DATA.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+    # socketserver's default backlog of 5 stalls pooled senders that connect at once
+    request_queue_size = 128
+
+    def __init__(self, address, latency=None, drop_rate=0.0, errors=None, ssl_context=None, seed=None):
+        super().__init__(address, SMTPSinkHandler)
+        self.latency = latency or {}
+        self.drop_rate = drop_rate
+        self.errors = errors or []
+        self.ssl_context = ssl_context
+        self.stats = SinkStats()
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def wait(self, command):
+        delay = self.latency.get(command, self.latency.get('*', 0))
+        if delay:
+            time.sleep(delay)
+
+    def should_drop(self):
+        if not self.drop_rate:
+            return False
+        with self.rng_lock:
+            return self.rng.random() < self.drop_rate
+
+    def pick_error(self):
+        if not self.errors:
+            return None
+        with self.rng_lock:
+            roll = self.rng.random()
+        for code, probability in self.errors:
+            if roll < probability:
+                return code
+            roll -= probability
+        return None
+
+
+def start_sink(host='127.0.0.1', port=0, **options):
+    """Run a sink on a background thread; returns the server (port 0 picks a free port)"""
+    sink = SMTPSink((host, port), **options)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    return sink
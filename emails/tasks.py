@@ -1,75 +1,672 @@
-from celery import shared_task
-from django.core.mail import send_mail
+import logging
+import time
+from collections import Counter
+from smtplib import SMTPDataError, SMTPRecipientsRefused, SMTPResponseException, SMTPServerDisconnected
+
+from celery import current_app, shared_task
+from celery.utils import uuid
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
+from django.core.mail.message import sanitize_address
 from django.conf import settings
-from .models import ScheduledEmail
-from datetime import datetime, timedelta
-from pytz import timezone as pytz_timezone
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q
+from django.utils import timezone
+from . import metrics, throttle
+from .list_cache import invalidate_lists
+from .models import DeliveryAttempt, EmailRecipient, ScheduledEmail
+from .recurrence import advance_schedules, following_send
+from .routing import PRIORITY_ORDER, queue_for
+from .smtp_pool import get_pool
+from .templating import render_email
+from .timing_wheel import invalidate, within_horizon
+from datetime import timedelta
+import requests
 
-LAGOS_TZ = pytz_timezone('Africa/Lagos')
+logger = logging.getLogger(__name__)
+
+
+def claim_due_emails(limit, now=None, email_ids=None):
+    """
+    Lease up to `limit` due emails and return their ids.
+
+    Rows are locked with SKIP LOCKED so concurrent dispatchers never pick the
+    same row, and the lease keeps them out of later ticks until it expires.
+    Tiers are claimed in priority order, so a bulk backlog never holds back
+    high priority mail that fell due after it. Passing `email_ids` restricts
+    the claim to those rows (the timing wheel claims what it fires).
+
+    Claiming clears task_id, so a batch task still queued for a row whose
+    lease ran out no longer owns it and skips it. Rows holding a throttle
+    slot are already paid for; others are only claimed while the account's
+    send buckets have tokens left, one per recipient still to be sent to.
+    The last email claimed may overdraw the budget, so one with more
+    recipients than the buckets hold is still sent (and deferred by the
+    sender until its tokens are paid off).
+    """
+    now = now or timezone.now()
+    budget = throttle.claim_budget(throttle.sending_account())
+    lease_until = now + timedelta(seconds=settings.EMAIL_DISPATCH_LEASE_SECONDS)
+
+    due = (
+        ScheduledEmail.objects
+        .select_for_update(skip_locked=True)
+        .filter(is_active=True, next_send__lte=now)
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lte=now))
+    )
+    if email_ids is not None:
+        due = due.filter(id__in=email_ids)
+
+    with transaction.atomic():
+        claimed = []
+        for priority in PRIORITY_ORDER:
+            if len(claimed) >= limit:
+                break
+            tier = due.filter(priority=priority).order_by('next_send')
+            if budget is None:
+                claimed.extend(tier.values_list('id', flat=True)[:limit - len(claimed)])
+                continue
+
+            claimed.extend(tier.filter(slot_reserved=True).values_list('id', flat=True)[:limit - len(claimed)])
+            if budget <= 0:
+                continue
+            # Every email costs at least one token, so at most `budget` can fit
+            unpaid = list(
+                tier.filter(slot_reserved=False)
+                .values_list('id', flat=True)[:min(limit - len(claimed), budget)]
+            )
+            costs = recipient_counts(unpaid)
+            for email_id in unpaid:
+                if budget <= 0:
+                    break
+                budget -= costs.get(email_id, 1)
+                claimed.append(email_id)
+        if claimed:
+            ScheduledEmail.objects.filter(id__in=claimed).update(locked_until=lease_until, task_id='')
+
+    return claimed
+
+
+def recipient_counts(email_ids):
+    """{email id: recipients still to be sent to} for multi-recipient emails among `email_ids`"""
+    if not email_ids:
+        return {}
+    return dict(
+        EmailRecipient.objects
+        .filter(schedule_id__in=email_ids, status__in=EmailRecipient.RETRY_STATUSES)
+        .values('schedule_id')
+        .annotate(count=Count('id'))
+        .values_list('schedule_id', 'count')
+    )
+
+
+def enqueue_send_batches(email_ids):
+    """
+    Publish claimed email ids to the batch sender, EMAIL_SEND_BATCH_SIZE at a time.
+
+    Batches never mix priorities and go to their priority's queue. Each row
+    records the id of the batch task carrying it so a cancellation can
+    revoke the task.
+    """
+    if not email_ids:
+        return
+
+    priorities = dict(ScheduledEmail.objects.filter(id__in=email_ids).values_list('id', 'priority'))
+    by_priority = {}
+    for email_id in email_ids:
+        by_priority.setdefault(priorities.get(email_id, 'default'), []).append(email_id)
+
+    send_batch_size = settings.EMAIL_SEND_BATCH_SIZE
+    for priority in PRIORITY_ORDER:
+        ids = by_priority.get(priority, [])
+        for i in range(0, len(ids), send_batch_size):
+            chunk = ids[i:i + send_batch_size]
+            task_id = uuid()
+            ScheduledEmail.objects.filter(id__in=chunk).update(task_id=task_id)
+            send_scheduled_email_batch.apply_async(
+                args=[chunk], task_id=task_id, queue=queue_for(priority)
+            )
+
+
+def cancel_emails(queryset):
+    """
+    Deactivate the active emails in `queryset` with a single UPDATE.
+
+    Batch tasks already queued for them are revoked once none of their
+    emails is still active, so cancelled work never reaches a worker.
+    Returns the number of emails cancelled.
+    """
+    now = timezone.now()
+    active = queryset.filter(is_active=True)
+
+    with transaction.atomic():
+        task_ids = set(
+            active.filter(locked_until__gt=now)
+            .exclude(task_id='')
+            .values_list('task_id', flat=True)
+        )
+        # Only rows a timing wheel may be holding need invalidating
+        wheel_ids = list(
+            active.filter(next_send__lte=within_horizon(now)).values_list('id', flat=True)
+        )
+        user_ids = set(active.values_list('user_id', flat=True).distinct())
+        cancelled = active.update(is_active=False, locked_until=None, task_id='')
+
+    invalidate(wheel_ids)
+    invalidate_lists(user_ids)
+    if task_ids:
+        revoke_idle_batches(task_ids)
+    return cancelled
+
+
+def revoke_idle_batches(task_ids):
+    """Revoke, in one broadcast, the batch tasks that no longer carry an active email"""
+    still_needed = set(
+        ScheduledEmail.objects
+        .filter(task_id__in=task_ids, is_active=True)
+        .values_list('task_id', flat=True)
+    )
+    idle = sorted(set(task_ids) - still_needed)
+    if not idle:
+        return []
 
-@shared_task
-def send_scheduled_email(email_id):
-    """Send scheduled email and reschedule if recurring"""
     try:
-        email = ScheduledEmail.objects.get(id=email_id)
+        current_app.control.revoke(idle)
+    except Exception as e:
+        # Revoking only saves work; the batch task skips inactive emails anyway
+        logger.warning("Could not revoke %d batch tasks: %s", len(idle), e)
+    return idle
+
+
+@shared_task
+def dispatch_due_emails():
+    """Claim due emails and enqueue them for sending in batches"""
+    batch_size = settings.EMAIL_DISPATCH_BATCH_SIZE
+    email_ids = claim_due_emails(batch_size)
+    enqueue_send_batches(email_ids)
+
+    # A full batch means there is more backlog; keep draining without
+    # waiting for the next beat tick
+    if len(email_ids) == batch_size:
+        dispatch_due_emails.delay()
+
+    return len(email_ids)
 
-        if not email.is_active:
-            return False
 
-        # Build email with header
-        full_content = f"{email.email_header}\n\n{email.content}"
+@shared_task
+def prune_delivery_attempts(batch_size=10000):
+    """Delete delivery attempts older than DELIVERY_LOG_RETENTION_DAYS, a batch at a time"""
+    cutoff = timezone.now() - timedelta(days=settings.DELIVERY_LOG_RETENTION_DAYS)
+    old = DeliveryAttempt.objects.filter(attempted_at__lt=cutoff)
+
+    deleted = 0
+    while True:
+        # Short deletes keep locks brief while workers keep appending
+        ids = list(old.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += DeliveryAttempt.objects.filter(id__in=ids).delete()[0]
+
+    logger.info("Pruned %d delivery attempts older than %s", deleted, cutoff)
+    return deleted
+
 
-        send_mail(
-            subject=email.subject,
-            message=full_content,
+def build_message(email, connection=None, bcc=None, recipient=None):
+    """
+    Build the outgoing message for a scheduled email.
+
+    With `bcc`, the message goes to those addresses only, under an
+    undisclosed To header, so one message serves a chunk of recipients.
+    `recipient` sends to (and renders the template for) that one address
+    instead of the schedule's.
+    """
+    to = [recipient or email.recipient_email] if bcc is None else []
+    headers = {'To': 'undisclosed-recipients:;'} if bcc is not None else None
+
+    if email.template_id:
+        subject, text, html = render_email(email, recipient)
+        message = EmailMultiAlternatives(
+            subject=subject,
+            body=text,
             from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[email.recipient_email],
-            fail_silently=False,
+            to=to,
+            bcc=bcc,
+            connection=connection,
+            headers=headers,
         )
+        if html:
+            message.attach_alternative(html, 'text/html')
+        return message
 
-        email.last_sent = datetime.now(LAGOS_TZ)
+    body = f"{email.email_header}\n\n{email.content}" if email.email_header else email.content
+    return EmailMessage(
+        subject=email.subject,
+        body=body,
+        from_email=settings.EMAIL_HOST_USER,
+        to=to,
+        bcc=bcc,
+        connection=connection,
+        headers=headers,
+    )
 
-        # Handle recurrence
-        if email.recurrence_type != 'once':
-            next_send = calculate_next_send(email.scheduled_time, email.recurrence_type)
-            email.next_send = next_send
 
-            # Reschedule task
-            from . import tasks
-            tasks.send_scheduled_email.apply_async(
-                args=[email_id],
-                eta=next_send
-            )
-        else:
+def recipient_domains(email):
+    """{domain: number of recipients} for the addresses the next send of `email` goes to"""
+    recipients = email.recipients.all()
+    if recipients:
+        addresses = [r.email for r in recipients if r.status in EmailRecipient.RETRY_STATUSES]
+    else:
+        addresses = [email.recipient_email]
+    return Counter(address.rsplit('@', 1)[-1].lower() for address in addresses)
+
+
+def build_jobs(email):
+    """
+    (email, message, recipients) per SMTP transaction for a scheduled email.
+
+    Single-address schedules make one message with recipients None.
+    Multi-recipient schedules are packed EMAIL_MAX_RECIPIENTS_PER_MESSAGE
+    addresses per message, except template-backed ones, which are rendered
+    and sent once per recipient. Only addresses still pending or failed
+    are included, so a retry never repeats a delivered chunk.
+    """
+    recipients = list(email.recipients.all())
+    if not recipients:
+        return [(email, build_message(email), None)]
+
+    recipients = [r for r in recipients if r.status in EmailRecipient.RETRY_STATUSES]
+
+    if email.template_id:
+        return [(email, build_message(email, recipient=r.email), [r]) for r in recipients]
+
+    size = settings.EMAIL_MAX_RECIPIENTS_PER_MESSAGE
+    jobs = []
+    for i in range(0, len(recipients), size):
+        chunk = recipients[i:i + size]
+        jobs.append((email, build_message(email, bcc=[r.email for r in chunk]), chunk))
+    return jobs
+
+
+def send_with_reconnect(connection, message):
+    """
+    Send one message, reopening the connection once if the server dropped it.
+
+    Returns the recipients the server refused, as {address: (code, reply)};
+    the message still went to the others.
+    """
+    try:
+        return send_message(connection, message)
+    except SMTPServerDisconnected:
+        logger.info("SMTP session dropped mid-batch, reconnecting")
+        connection.close()
+        connection.open()
+        return send_message(connection, message)
+
+
+def send_message(connection, message):
+    """
+    Send over an open backend connection, returning refused recipients.
+
+    Django's send_messages drops smtplib's refused-recipient report, so SMTP
+    connections call sendmail on the session directly. Other backends
+    (locmem, console) refuse nothing.
+    """
+    if not hasattr(connection, 'connection'):
+        connection.send_messages([message])
+        return {}
+
+    if connection.connection is None:
+        connection.open()
+    encoding = message.encoding or settings.DEFAULT_CHARSET
+    from_email = sanitize_address(message.from_email, encoding)
+    recipients = [sanitize_address(address, encoding) for address in message.recipients()]
+    return connection.connection.sendmail(from_email, recipients, message.message().as_bytes(linesep='\r\n'))
+
+
+def smtp_code(error):
+    """SMTP reply code for a send outcome: 250 on success, None if the server never answered"""
+    if error is None:
+        return 250
+    if isinstance(error, SMTPResponseException):
+        return error.smtp_code
+    if isinstance(error, SMTPRecipientsRefused) and error.recipients:
+        return next(iter(error.recipients.values()))[0]
+    return None
+
+
+def is_permanent(error):
+    """
+    True when the server rejected this message's recipients (RCPT) or its
+    content (DATA) with a 5xx reply, which another attempt would only repeat.
+
+    Connection, login (535) and MAIL FROM failures say nothing about the
+    message: they hold for the whole account until it is fixed, so they
+    are never permanent for the schedule.
+    """
+    if isinstance(error, SMTPRecipientsRefused):
+        return bool(error.recipients) and all(500 <= code < 600 for code, _ in error.recipients.values())
+    if isinstance(error, SMTPDataError):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+def retry_emails(failed, now):
+    """
+    Release failed emails for another attempt after an exponential backoff.
+
+    After a permanent rejection of a single-address email it is
+    deactivated; multi-recipient emails never get here for one, their
+    refused addresses are recorded per recipient instead. After
+    EMAIL_MAX_ATTEMPTS failures a one-off email is deactivated too and a
+    recurring one gives up on this occurrence and moves on to the next.
+    Returns the emails that moved on.
+    """
+    moved_on = []
+    for email, error in failed:
+        email.failed_attempts += 1
+        email.locked_until = None
+        email.task_id = ''
+        if is_permanent(error):
+            logger.warning("Email %s was rejected permanently (%s), deactivating it", email.id, smtp_code(error))
             email.is_active = False
+        elif email.failed_attempts < settings.EMAIL_MAX_ATTEMPTS:
+            backoff = settings.EMAIL_RETRY_BACKOFF_SECONDS * 2 ** (email.failed_attempts - 1)
+            email.next_send = now + timedelta(seconds=backoff)
+        else:
+            logger.warning("Email %s failed %d times, giving up on this send", email.id, email.failed_attempts)
+            next_send = None if email.recurrence_type == 'once' else following_send(email, now)
+            email.failed_attempts = 0
+            if next_send is None:
+                email.is_active = False
+            else:
+                email.next_send = next_send
+                moved_on.append(email)
+    ScheduledEmail.objects.bulk_update(
+        [email for email, _ in failed],
+        ['failed_attempts', 'locked_until', 'task_id', 'next_send', 'is_active'],
+        batch_size=500,
+    )
+    return moved_on
 
-        email.save()
-        return True
 
-    except ScheduledEmail.DoesNotExist:
-        return False
+def defer_emails(deferred, now):
+    """
+    Move rate-limited emails to the slot reserved for them and release the
+    lease; the dispatcher sends them then without taking tokens again.
+    """
+    for email, wait in deferred:
+        email.next_send = now + timedelta(seconds=wait)
+        email.locked_until = None
+        email.task_id = ''
+        email.slot_reserved = True
+    ScheduledEmail.objects.bulk_update(
+        [email for email, _ in deferred], ['next_send', 'locked_until', 'task_id', 'slot_reserved'], batch_size=500
+    )
 
 
-def calculate_next_send(current_time, recurrence_type):
-    """Calculate next send time based on recurrence type"""
-    current_time = current_time.astimezone(LAGOS_TZ)
+def deliver_sequential(jobs):
+    """Send over one connection; yields (job, attempted_at, error, seconds, refused)"""
+    if not jobs:
+        return
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # Nothing was sent; every message fails with the session's error
+        # and is retried after a backoff
+        logger.error("Could not open an SMTP connection: %s", e)
+        for job in jobs:
+            yield job, timezone.now(), e, 0.0, {}
+        return
 
-    if recurrence_type == 'daily':
-        return current_time + timedelta(days=1)
-    elif recurrence_type == 'weekly':
-        return current_time + timedelta(weeks=1)
-    elif recurrence_type == 'monthly':
-        if current_time.month == 12:
-            return current_time.replace(year=current_time.year + 1, month=1)
+    try:
+        for job in jobs:
+            attempted_at = timezone.now()
+            start = time.perf_counter()
+            error = None
+            refused = {}
+            try:
+                refused = send_with_reconnect(connection, job[1])
+            except Exception as e:
+                error = e
+            yield job, attempted_at, error, time.perf_counter() - start, refused
+    finally:
+        connection.close()
+
+
+def deliver_pooled(jobs):
+    """Fan out over the SMTP pool's threads; yields (job, attempted_at, error, seconds, refused)"""
+    pool = get_pool()
+    submitted = []
+    for job in jobs:
+        # Blocks while every pooled connection is busy
+        submitted.append((job, timezone.now(), pool.submit(job[1])))
+    for job, attempted_at, future in submitted:
+        error, duration, refused = future.result()
+        yield job, attempted_at, error, duration, refused
+
+
+def record_recipients(recipients, attempted_at, error, refused):
+    """
+    Set each recipient's outcome from its message's send result.
+
+    5xx refusals of an address, or of the whole message, are final
+    ('refused'); anything else that kept the message from an address is
+    retried ('failed').
+    """
+    refused = {address.lower(): reply for address, reply in refused.items()}
+    if isinstance(error, SMTPRecipientsRefused):
+        refused = {address.lower(): reply for address, reply in error.recipients.items()}
+        error = None
+
+    for recipient in recipients:
+        recipient.last_attempt_at = attempted_at
+        reply = refused.get(recipient.email.lower())
+        if error:
+            recipient.status = 'refused' if is_permanent(error) else 'failed'
+            recipient.smtp_code = smtp_code(error)
+        elif reply:
+            recipient.status = 'refused' if 500 <= reply[0] < 600 else 'failed'
+            recipient.smtp_code = reply[0]
         else:
-            return current_time.replace(month=current_time.month + 1)
-    elif recurrence_type == 'yearly':
-        return current_time.replace(year=current_time.year + 1)
-    elif recurrence_type == 'birthday':
-        return current_time.replace(year=current_time.year + 1)
-    elif recurrence_type == 'anniversary':
-        return current_time.replace(year=current_time.year + 1)
-    elif recurrence_type == 'employment':
-        return current_time.replace(year=current_time.year + 1)
-    else:
-        return current_time
\ No newline at end of file
+            recipient.status = 'sent'
+            recipient.smtp_code = 250
+
+
+@shared_task(bind=True)
+def send_scheduled_email_batch(self, email_ids):
+    """
+    Send a batch of scheduled emails, over a single SMTP connection or
+    through the process's SMTP pool (EMAIL_DELIVERY_MODE = 'pool').
+
+    Returns the ids that were sent, failed (with the error; see
+    retry_emails), skipped because they were cancelled, re-claimed or
+    already sent by another worker, or deferred to the next free slot of
+    the send rate limits.
+    """
+    now = timezone.now()
+    owned = ScheduledEmail.objects.filter(id__in=email_ids, is_active=True)
+    if self.request.id:
+        # A batch that outwaited its lease in the queue may have had its rows
+        # re-claimed for another task. Renewing the lease on the rows that
+        # still carry this task's id takes them for the whole send, in one
+        # atomic UPDATE; the rest belong to the other task.
+        owned = owned.filter(task_id=self.request.id)
+        owned.update(locked_until=now + timedelta(seconds=settings.EMAIL_DISPATCH_LEASE_SECONDS))
+
+    emails = list(
+        owned
+        .select_related('template')
+        .prefetch_related(Prefetch('recipients', EmailRecipient.objects.order_by('id')))
+        .filter(Q(next_send__isnull=True) | Q(next_send__lte=now))
+    )
+
+    # Templates are private to their owner; a schedule pointing at someone
+    # else's (or an ownerless legacy one) is cancelled rather than rendered
+    foreign = [email for email in emails if email.template_id and email.template.user_id != email.user_id]
+    if foreign:
+        logger.warning("Cancelling emails %s: their template belongs to another user", [e.id for e in foreign])
+        ScheduledEmail.objects.filter(id__in=[e.id for e in foreign]).update(
+            is_active=False, locked_until=None, task_id=''
+        )
+        emails = [email for email in emails if email not in foreign]
+
+    found_ids = {email.id for email in emails}
+    result = {
+        'sent': [],
+        'failed': [],
+        'skipped': [email_id for email_id in email_ids if email_id not in found_ids],
+        'deferred': [],
+    }
+    if not emails:
+        metrics.EMAILS_SKIPPED.inc(len(result['skipped']))
+        return result
+
+    sent = []
+    failed = []
+    deferred = []
+    attempts = []
+    lags = []
+    smtp_durations = []
+    account = throttle.sending_account()
+    to_send = []
+    reserved = [email for email in emails if email.slot_reserved]
+    if reserved:
+        # Their slot has come; a retry after this send pays again
+        ScheduledEmail.objects.filter(id__in=[email.id for email in reserved]).update(slot_reserved=False)
+    for email in emails:
+        if email.slot_reserved:
+            email.slot_reserved = False
+            to_send.append(email)
+            continue
+        wait = throttle.acquire(account, recipient_domains(email))
+        if wait:
+            deferred.append((email, wait))
+            attempts.append(DeliveryAttempt(
+                schedule_id=email.id, attempted_at=timezone.now(), outcome='deferred'
+            ))
+        else:
+            to_send.append(email)
+
+    jobs = []
+    for email in to_send:
+        jobs.extend(build_jobs(email))
+
+    # An email is done once none of its messages failed. For multi-recipient
+    # emails that is per address: accepted and permanently refused ones are
+    # done, the rest make the email retry
+    errors = {}
+    recipients = {}
+    deliver = deliver_pooled if settings.EMAIL_DELIVERY_MODE == 'pool' else deliver_sequential
+    try:
+        for (email, _, chunk), attempted_at, error, duration, refused in deliver(jobs):
+            smtp_durations.append(duration)
+            attempts.append(DeliveryAttempt(
+                schedule_id=email.id,
+                attempted_at=attempted_at,
+                outcome='failed' if error else 'sent',
+                smtp_code=smtp_code(error),
+                duration_ms=round(duration * 1000),
+                error=str(error or refused or '')[:1000],
+            ))
+            if chunk:
+                record_recipients(chunk, attempted_at, error, refused)
+                recipients.update((recipient.id, recipient) for recipient in chunk)
+                retry = {r.email: (r.smtp_code, b'') for r in chunk if r.status == 'failed'}
+                if retry:
+                    errors.setdefault(email.id, error or SMTPRecipientsRefused(retry))
+            elif error:
+                errors.setdefault(email.id, error)
+
+        for email in to_send:
+            if email.id in errors:
+                failed.append((email, errors[email.id]))
+                result['failed'].append({'id': email.id, 'error': str(errors[email.id])})
+                continue
+
+            statuses = [recipient.status for recipient in email.recipients.all()]
+            if statuses and all(status == 'refused' for status in statuses):
+                logger.warning("Every recipient of email %s was refused, deactivating it", email.id)
+                email.is_active = False
+
+            if email.next_send:
+                lags.append(max((timezone.now() - email.next_send).total_seconds(), 0))
+            sent.append(email)
+    finally:
+        # Record what did go out even if the batch was interrupted
+        moved_on = []
+        if sent:
+            moved_on += advance_schedules(sent, timezone.now())
+        if failed:
+            moved_on += retry_emails(failed, timezone.now())
+        # The next occurrence of a recurring schedule goes to everyone again,
+        # except addresses the server has refused for good
+        for email in moved_on:
+            if email.is_active:
+                for recipient in email.recipients.all():
+                    if recipient.status != 'refused':
+                        recipient.status = 'pending'
+                        recipients[recipient.id] = recipient
+        if deferred:
+            defer_emails(deferred, timezone.now())
+        if attempts or recipients:
+            try:
+                DeliveryAttempt.objects.bulk_create(attempts, batch_size=500)
+                EmailRecipient.objects.bulk_update(
+                    list(recipients.values()), ['status', 'smtp_code', 'last_attempt_at'], batch_size=500
+                )
+            except Exception:
+                # The sends already happened; a lost log write must not undo them
+                logger.exception("Could not write %d delivery attempts", len(attempts))
+        # Running timing wheels already loaded past these new send times
+        rescheduled = sent + [email for email, _ in failed + deferred]
+        horizon = within_horizon()
+        invalidate(
+            email.id for email in rescheduled
+            if email.is_active and email.next_send and email.next_send <= horizon
+        )
+        invalidate_lists(email.user_id for email in rescheduled)
+
+        metrics.SMTP_SECONDS.observe_many(smtp_durations)
+        metrics.SEND_LAG.observe_many(lags)
+        metrics.EMAILS_SENT.inc(len(sent))
+        metrics.EMAILS_FAILED.inc(len(result['failed']))
+        metrics.EMAILS_SKIPPED.inc(len(result['skipped']))
+        metrics.EMAILS_DEFERRED.inc(len(deferred))
+
+    result['sent'] = [email.id for email in sent]
+    result['deferred'] = [email.id for email, _ in deferred]
+
+    logger.info(
+        "Email batch done: %d sent, %d failed, %d skipped, %d deferred",
+        len(result['sent']), len(result['failed']), len(result['skipped']), len(result['deferred'])
+    )
+    return result
+
+
+@shared_task
+def send_scheduled_email(email_id):
+    """Per-email task kept for messages queued before batching; claims the email for the batch sender"""
+    claimed = claim_due_emails(1, email_ids=[email_id])
+    enqueue_send_batches(claimed)
+    return bool(claimed)
+
+
+@shared_task
+def process_telex_message(message_text, sender_email, channel_id, sender_name=None):
+    """Handle a Telex message off the request path and post the reply to its channel"""
+    from .telex_integration import TelexWebhookView, post_telex_reply
+
+    try:
+        response_text = TelexWebhookView().process_user_message(
+            sender_email, message_text, channel_id, sender_name
+        )
+    except Exception:
+        logger.exception("Could not process Telex message for channel %s", channel_id)
+        response_text = "❌ Something went wrong, please try again."
+
+    try:
+        return post_telex_reply(channel_id, response_text)
+    except requests.RequestException as e:
+        # Not retried: the message has already been acted on
+        logger.error("Could not deliver Telex reply to channel %s: %s", channel_id, e)
+        return False
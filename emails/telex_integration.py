@@ -1,18 +1,94 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.contrib.auth.models import User
-from datetime import datetime, timedelta
+from django.conf import settings
+from datetime import datetime
 from pytz import timezone as pytz_timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import logging
 import re
 import random
+import threading
 import requests
+from .idempotency import idempotent
+from .list_cache import cached_page, invalidate_lists
+from .metrics import instrument
 from .models import ScheduledEmail
-from .tasks import send_scheduled_email
+from .parser import parse_command
+from .routing import default_priority
+from .tasks import cancel_emails, process_telex_message
+from .timing_wheel import invalidate, within_horizon
+from .user_cache import get_or_create_user_id, lookup_user_id
 
 LAGOS_TZ = pytz_timezone('Africa/Lagos')
 
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+_reply_slots = threading.BoundedSemaphore(settings.TELEX_REPLY_CONCURRENCY)
+
+
+def get_telex_session():
+    """Process-wide requests session with pooled keep-alive connections and retries"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=settings.TELEX_REPLY_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=['POST'],
+                )
+                adapter = HTTPAdapter(
+                    pool_maxsize=settings.TELEX_REPLY_CONCURRENCY,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def post_telex_reply(channel_id, text):
+    """
+    Post a bot reply back to a Telex channel.
+
+    At most TELEX_REPLY_CONCURRENCY replies are in flight per process, which
+    also matches the size of the session's connection pool.
+    """
+    if not settings.TELEX_REPLY_URL:
+        logger.error("TELEX_REPLY_URL is not set, dropping reply for channel %s", channel_id)
+        return False
+
+    url = settings.TELEX_REPLY_URL.format(channel_id=channel_id)
+    payload = {
+        'event_name': 'email_scheduler',
+        'message': text,
+        'status': 'success',
+        'username': 'Email Scheduler',
+    }
+
+    with _reply_slots:
+        response = get_telex_session().post(url, json=payload, timeout=settings.TELEX_REPLY_TIMEOUT)
+    response.raise_for_status()
+    return True
+
+
+def telex_request_parts(request):
+    """Idempotency key parts for Telex: only commands that change state are deduped"""
+    data = request.data
+    if not isinstance(data, dict):
+        return None
+    message_text = str(data.get('message', '')).strip()
+    if not message_text.lower().startswith(('/schedule', '/cancel')):
+        return None
+    return [data.get('sender_email') or data.get('sender_id'), data.get('channel_id'), message_text]
+
 
 class TelexWebhookView(APIView):
     """
@@ -20,9 +96,17 @@ class TelexWebhookView(APIView):
     Webhook URL: https://your-domain.com/api/telex/webhook/
     """
 
+    @instrument('telex_webhook')
+    @idempotent('telex', telex_request_parts)
     def post(self, request):
         """Handle incoming Telex A2A webhook events"""
         
+        if not isinstance(request.data, dict):
+            return Response({
+                'status': 'error',
+                'message': 'Expected a JSON object'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             data = request.data
             
@@ -31,21 +115,31 @@ class TelexWebhookView(APIView):
             sender_id = data.get('sender_id')
             channel_id = data.get('channel_id')
             sender_email = data.get('sender_email', f"user_{sender_id}@telex.im")
+            sender_name = data.get('sender_name')
             
             if not message_text:
                 return Response({
                     'status': 'success',
                     'message': 'Empty message ignored'
                 }, status=status.HTTP_200_OK)
-            
-            # Get or create user
-            user, _ = User.objects.get_or_create(
-                email=sender_email,
-                defaults={'username': sender_email.split('@')[0]}
-            )
-            
+
+            # Acknowledge now and let a worker reply through the channel
+            if settings.TELEX_ASYNC_WEBHOOK:
+                if not channel_id:
+                    return Response({
+                        'status': 'error',
+                        'message': 'channel_id is required'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+
+                process_telex_message.delay(message_text, sender_email, channel_id, sender_name)
+                return Response({
+                    'status': 'accepted',
+                    'message': 'Message received',
+                    'channel_id': channel_id
+                }, status=status.HTTP_202_ACCEPTED)
+
             # Process the message and get response
-            response_text = self.process_user_message(user, message_text, channel_id)
+            response_text = self.process_user_message(sender_email, message_text, channel_id, sender_name)
             
             # Return in A2A format
             return Response({
@@ -54,142 +148,138 @@ class TelexWebhookView(APIView):
                 'channel_id': channel_id
             }, status=status.HTTP_200_OK)
             
-        except Exception as e:
+        except Exception:
+            # A server error: not stored by @idempotent, so Telex's retry runs again
+            logger.exception("Could not process Telex message")
             return Response({
                 'status': 'error',
-                'message': str(e)
-            }, status=status.HTTP_400_BAD_REQUEST)
+                'message': 'Could not process the message, please try again'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def process_user_message(self, sender_email, text, channel_id, sender_name=None):
+        """
+        Route user message to appropriate handler.
 
-    def process_user_message(self, user, text, channel_id):
-        """Route user message to appropriate handler"""
+        Stateless replies (/help, small talk) never touch the database; the
+        sender's user id is only resolved for commands that need it.
+        """
         
         text = text.strip()
         text_lower = text.lower()
         
         # Command detection
-        if text_lower.startswith('/schedule'):
-            return self.process_schedule_command(user, text, channel_id)
+        if text_lower.startswith('/help'):
+            return self.get_help_message()
+        elif text_lower.startswith('/schedule'):
+            return self.process_schedule_command(get_or_create_user_id(sender_email), text, channel_id)
         elif text_lower.startswith('/list'):
-            return self.process_list_command(user)
+            return self.process_list_command(lookup_user_id(sender_email), text)
         elif text_lower.startswith('/cancel'):
-            return self.process_cancel_command(user, text)
-        elif text_lower.startswith('/help'):
-            return self.get_help_message()
+            return self.process_cancel_command(lookup_user_id(sender_email), text)
         else:
             # Natural language parsing
-            return self.process_natural_language(user, text)
+            return self.process_natural_language(sender_name or sender_email.split('@')[0], text)
 
-    def process_schedule_command(self, user, text, channel_id):
+    def process_schedule_command(self, user_id, text, channel_id):
         """
         Handle /schedule command
         Example: /schedule "Hello world" to john@example.com at 2pm with header "Birthday"
         """
         
-        # Extract components
-        content_match = re.search(r'"([^"]+)"', text)
-        email_match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
-        header_match = re.search(r'header\s+["\']([^"\']+)["\']', text, re.IGNORECASE)
-        
-        if not content_match or not email_match:
+        parsed = parse_command(text)
+
+        if not parsed['content'] or not parsed['recipient_email']:
             return "❌ Invalid format.\nUse: /schedule \"message\" to email@domain.com at 2pm with header \"Header\""
 
-        content = content_match.group(1)
-        recipient_email = email_match.group(0)
-        email_header = header_match.group(1) if header_match else "Scheduled Message"
+        content = parsed['content']
+        recipient_email = parsed['recipient_email']
+        email_header = parsed['email_header'] or "Scheduled Message"
+        scheduled_time = parsed['scheduled_time']
+        recurrence_type = parsed['recurrence_type']
 
-        # Parse time
-        time_match = re.search(r'(\d{1,2}):?(\d{2})?\s*(am|pm)?', text, re.IGNORECASE)
-        if not time_match:
+        if not scheduled_time:
             return "❌ Could not parse time. Use format: 2pm, 14:00, 2:30pm"
 
-        hour = int(time_match.group(1))
-        minute = int(time_match.group(2) or 0)
-        period = time_match.group(3)
-
-        if period and period.lower() == 'pm' and hour != 12:
-            hour += 12
-        elif period and period.lower() == 'am' and hour == 12:
-            hour = 0
-
-        now = datetime.now(LAGOS_TZ)
-        scheduled_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-
-        # If time is in past, schedule for tomorrow
-        if scheduled_time < now:
-            scheduled_time += timedelta(days=1)
-
-        # Check for recurrence
-        recurrence_type = 'once'
-        if 'daily' in text.lower():
-            recurrence_type = 'daily'
-        elif 'weekly' in text.lower():
-            recurrence_type = 'weekly'
-        elif 'monthly' in text.lower():
-            recurrence_type = 'monthly'
-        elif 'yearly' in text.lower():
-            recurrence_type = 'yearly'
-        elif 'birthday' in text.lower():
-            recurrence_type = 'birthday'
-        elif 'anniversary' in text.lower():
-            recurrence_type = 'anniversary'
-        elif 'employment' in text.lower():
-            recurrence_type = 'employment'
-
-        # Create scheduled email
-        try:
-            email_obj = ScheduledEmail.objects.create(
-                user=user,
-                recipient_email=recipient_email,
-                subject='Scheduled Message',
-                content=content,
-                email_header=email_header,
-                scheduled_time=scheduled_time,
-                recurrence_type=recurrence_type,
-                next_send=scheduled_time
-            )
-
-            # Schedule task
-            send_scheduled_email.apply_async(
-                args=[email_obj.id],
-                eta=scheduled_time
-            )
-
-            # Send confirmation
-            recurrence_text = f" ({recurrence_type})" if recurrence_type != 'once' else ""
-            confirmation = (
-                f"✅ Email scheduled!\n"
-                f"📧 To: {recipient_email}\n"
-                f"📝 Message: {content}\n"
-                f"⏰ Time: {scheduled_time.strftime('%A, %B %d at %I:%M %p %Z')}{recurrence_text}\n"
-                f"🎯 Header: {email_header}"
-            )
-            return confirmation
-            
-        except Exception as e:
-            return f"❌ Error scheduling email: {str(e)}"
+        # Create scheduled email; database errors propagate so the webhook
+        # answers 500 and the retry is not replayed
+        email_obj = ScheduledEmail.objects.create(
+            user_id=user_id,
+            recipient_email=recipient_email,
+            subject='Scheduled Message',
+            content=content,
+            email_header=email_header,
+            scheduled_time=scheduled_time,
+            recurrence_type=recurrence_type,
+            priority=default_priority(recurrence_type, scheduled_time),
+            next_send=scheduled_time
+        )
+        if email_obj.next_send <= within_horizon():
+            invalidate([email_obj.id])
+        invalidate_lists([user_id])
 
-    def process_list_command(self, user):
-        """List all scheduled emails"""
-        
-        emails = ScheduledEmail.objects.filter(user=user, is_active=True)
+        # Send confirmation
+        recurrence_text = f" ({recurrence_type})" if recurrence_type != 'once' else ""
+        confirmation = (
+            f"✅ Email scheduled!\n"
+            f"📧 To: {recipient_email}\n"
+            f"📝 Message: {content}\n"
+            f"⏰ Time: {scheduled_time.strftime('%A, %B %d at %I:%M %p %Z')}{recurrence_text}\n"
+            f"🎯 Header: {email_header}"
+        )
+        return confirmation
+
+    def process_list_command(self, user_id, text='/list'):
+        """
+        List scheduled emails, a page at a time
+        Example: /list 2
+        """
         
-        if not emails.exists():
+        if user_id is None:
             return "📭 No scheduled emails yet."
 
-        message = "📋 Your Scheduled Emails:\n\n"
-        for i, email in enumerate(emails, 1):
-            next_time = email.next_send.strftime('%A, %B %d at %I:%M %p')
-            message += (
-                f"{i}. {email.subject}\n"
-                f"   To: {email.recipient_email}\n"
-                f"   Next: {next_time}\n"
-                f"   Recurrence: {email.recurrence_type}\n"
-                f"   ID: {email.id}\n\n"
-            )
+        match = re.search(r'/list\s+(\d+)', text)
+        page = max(int(match.group(1)), 1) if match else 1
+        return cached_page(user_id, page, self.render_list_page)
 
-        return message
+    def render_list_page(self, user_id, page):
+        """Render one /list page; fetches one extra row to know if more follow"""
+        page_size = settings.TELEX_LIST_PAGE_SIZE
+        offset = (page - 1) * page_size
+        emails = list(
+            ScheduledEmail.objects
+            .filter(user_id=user_id, is_active=True)
+            .order_by('next_send', 'id')
+            .only('id', 'subject', 'recipient_email', 'next_send', 'recurrence_type', 'timezone')
+            [offset:offset + page_size + 1]
+        )
+
+        if not emails:
+            if page == 1:
+                return "📭 No scheduled emails yet."
+            return f"📭 No scheduled emails on page {page}. Use /list to see the first page."
+
+        has_more = len(emails) > page_size
+        lines = ["📋 Your Scheduled Emails:" if page == 1 else f"📋 Your Scheduled Emails (page {page}):", ""]
+        for i, email in enumerate(emails[:page_size], offset + 1):
+            if email.next_send:
+                local_send = email.next_send.astimezone(pytz_timezone(email.timezone))
+                next_time = local_send.strftime('%A, %B %d at %I:%M %p %Z')
+            else:
+                next_time = 'not scheduled'
+            lines.extend([
+                f"{i}. {email.subject}",
+                f"   To: {email.recipient_email}",
+                f"   Next: {next_time}",
+                f"   Recurrence: {email.recurrence_type}",
+                f"   ID: {email.id}",
+                "",
+            ])
+        if has_more:
+            lines.append(f"➡️ More: /list {page + 1}")
 
-    def process_cancel_command(self, user, text):
+        return "\n".join(lines)
+
+    def process_cancel_command(self, user_id, text):
         """
         Cancel a scheduled email
         Example: /cancel 5
@@ -200,11 +290,12 @@ class TelexWebhookView(APIView):
             return "❌ Use format: /cancel EMAIL_ID"
 
         email_id = int(match.group(1))
+        if user_id is None:
+            return "❌ Email not found."
         
         try:
-            email = ScheduledEmail.objects.get(id=email_id, user=user)
-            email.is_active = False
-            email.save()
+            email = ScheduledEmail.objects.only('id', 'subject').get(id=email_id, user_id=user_id)
+            cancel_emails(ScheduledEmail.objects.filter(id=email.id))
             return f"✅ Email '{email.subject}' has been cancelled."
         except ScheduledEmail.DoesNotExist:
             return "❌ Email not found."
@@ -216,7 +307,7 @@ class TelexWebhookView(APIView):
             "📚 **Scheduled Email Bot Help**\n\n"
             "**Commands:**\n"
             "/schedule \"message\" to email@domain.com at 2pm with header \"Header\"\n"
-            "/list - Show all scheduled emails\n"
+            "/list [page] - Show your scheduled emails\n"
             "/cancel EMAIL_ID - Cancel a scheduled email\n"
             "/help - Show this help message\n\n"
             "**Recurrence options (add to /schedule):**\n"
@@ -230,7 +321,7 @@ class TelexWebhookView(APIView):
         
         return help_text
 
-    def process_natural_language(self, user, text):
+    def process_natural_language(self, name, text):
         """
         Handle natural language input & casual conversation
         Supports both scheduling requests and friendly chat
@@ -241,7 +332,7 @@ class TelexWebhookView(APIView):
         # Greeting responses
         greetings = ['hi', 'hello', 'hey', 'greetings', 'howdy']
         if any(greeting in text_lower for greeting in greetings):
-            return self.get_greeting_response(user.first_name or user.username)
+            return self.get_greeting_response(name)
         
         # How are you questions
         if any(phrase in text_lower for phrase in ['how are you', 'how are u', 'how do you do', 'how you doing']):
@@ -291,7 +382,8 @@ class TelexWebhookView(APIView):
         """Response to 'how are you'"""
         
         responses = [
-            "I'm doing great, thanks for asking! 😊 I'm here and ready to help you schedule emails. How are *you* doing?",
+            "I'm doing great, thanks for asking! 😊 I'm here and ready to help you schedule emails. "
+            "How are *you* doing?",
             "Fantastic! I'm running smoothly and ready to help. How's your day treating you?",
             "I'm awesome, thanks! 🚀 Ready to schedule some emails whenever you are.",
             "Doing well! My circuits are buzzing with energy. What can I help you with?",
@@ -312,7 +404,8 @@ class TelexWebhookView(APIView):
             time_context = "evening"
         
         responses = [
-            f"My {time_context} is going great, thanks! 🌅 Just here helping people schedule important emails. How's yours?",
+            f"My {time_context} is going great, thanks! 🌅 Just here helping people schedule important emails. "
+            "How's yours?",
             f"Pretty good {time_context}! Just waiting to help you schedule something awesome. What's on your mind?",
             f"Can't complain! The {time_context} is young and full of possibilities. How about you?",
             f"Living my best {time_context}! 📧 Ready to help whenever you need. What's up?",
@@ -325,7 +418,8 @@ class TelexWebhookView(APIView):
         quotes = [
             "✨ \"The future depends on what you do today.\" - Mahatma Gandhi",
             "💪 \"You are capable of amazing things.\" - Unknown",
-            "🎯 \"Success is not final, failure is not fatal: it is the courage to continue that counts.\" - Winston Churchill",
+            "🎯 \"Success is not final, failure is not fatal: it is the courage to continue that counts.\" "
+            "- Winston Churchill",
             "🚀 \"The only way to do great work is to love what you do.\" - Steve Jobs",
             "⭐ \"Don't watch the clock; do what it does. Keep going.\" - Sam Levenson",
             "🌟 \"Believe you can and you're halfway there.\" - Theodore Roosevelt",
@@ -359,7 +453,7 @@ class TelexWebhookView(APIView):
             "💬 **Chat** - Have a friendly conversation with me\n\n"
             "**Quick Start:**\n"
             "/schedule \"Your message\" to email@domain.com at 2pm\n"
-            "/list - See all scheduled emails\n"
+            "/list [page] - See your scheduled emails\n"
             "/help - Full command details\n\n"
             "What would you like to do? 😊"
         )
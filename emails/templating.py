@@ -0,0 +1,71 @@
+"""
+Compiled message templates with per-recipient substitution.
+
+A template is split once into literal text and {{ variable }} slots and
+kept in a per-worker LRU keyed by (id, updated_at), so editing a template
+naturally invalidates it. Rendering is then a join over the slots. Each
+variable is stringified and HTML-escaped once and reused across the
+subject, plaintext and HTML parts.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.html import escape
+from pytz import timezone as pytz_timezone
+
+PLACEHOLDER_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+def compile_text(text):
+    """Split text into alternating literals and variable names"""
+    return tuple(PLACEHOLDER_RE.split(text or ''))
+
+
+@lru_cache(maxsize=settings.EMAIL_TEMPLATE_CACHE_SIZE)
+def compile_template(template_id, updated_at, subject, text_body, html_body):
+    """Compiled (subject, text, html) parts; cached per template version"""
+    return compile_text(subject), compile_text(text_body), compile_text(html_body)
+
+
+def fill(parts, values):
+    """Render compiled parts; unknown variables render as empty strings"""
+    return ''.join(
+        part if i % 2 == 0 else values.get(part, '')
+        for i, part in enumerate(parts)
+    )
+
+
+def template_context(email, recipient_email=None):
+    """
+    Variables for one send: defaults from the schedule and the recipient
+    (`recipient_email`, else the schedule's), overridden by its context
+    """
+    recipient_email = recipient_email or email.recipient_email
+    send_time = email.next_send or email.scheduled_time
+    if send_time:
+        send_time = send_time.astimezone(pytz_timezone(email.timezone))
+    context = {
+        'name': recipient_email.split('@')[0],
+        'recipient_email': recipient_email,
+        'date': send_time.strftime('%B %d, %Y') if send_time else '',
+    }
+    context.update(email.context or {})
+    return context
+
+
+def render_email(email, recipient_email=None):
+    """Render the subject, plaintext and HTML bodies of a template-backed email for one recipient"""
+    template = email.template
+    subject_parts, text_parts, html_parts = compile_template(
+        template.id, template.updated_at, template.subject, template.text_body, template.html_body
+    )
+
+    values = {key: str(value) for key, value in template_context(email, recipient_email).items()}
+    html = ''
+    if template.html_body:
+        html = fill(html_parts, {key: escape(value) for key, value in values.items()})
+
+    # Header injection guard: subjects must stay on one line
+    subject = fill(subject_parts, values).replace('\r', ' ').replace('\n', ' ')
+    return subject, fill(text_parts, values), html
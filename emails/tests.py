@@ -1,3 +1,1103 @@
-from django.test import TestCase
+import calendar
+import csv
+import gzip
+import io
+import json
+import random
+import re
+import time
+import unittest
+from datetime import datetime, timedelta
+from smtplib import SMTPAuthenticationError, SMTPDataError, SMTPResponseException
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from pytz import timezone as pytz_timezone
+from rest_framework.test import APIClient
+
+from .idempotency import IN_FLIGHT, idempotency_keys
+from .models import DeliveryAttempt, EmailRecipient, EmailTemplate, ScheduledEmail
+from .recurrence import next_occurrence, normalize_rule
+from .serializers import ScheduledEmailSerializer
+from .smtp_pool import SMTPPool
+from . import authentication, throttle, user_cache
+from .routing import queue_for
+from .tasks import (
+    claim_due_emails, enqueue_send_batches, is_permanent, prune_delivery_attempts, send_scheduled_email_batch,
+)
+from .telex_integration import TelexWebhookView
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class FlakyBackend(LocmemBackend):
+    """locmem backend whose session or messages fail the way a test sets up"""
+
+    # Raised when the session opens, as a wrong password would
+    open_error = None
+    # address -> error raised for any message that includes it
+    errors = {}
+    # Sessions opened so far
+    opened = 0
+
+    def open(self):
+        FlakyBackend.opened += 1
+        if FlakyBackend.open_error:
+            raise FlakyBackend.open_error
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            for address in message.recipients():
+                if address in FlakyBackend.errors:
+                    raise FlakyBackend.errors[address]
+        return super().send_messages(messages)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    THROTTLE_REDIS_URL=None,
+    EMAIL_RATE_LIMITS={},
+    EMAIL_BACKEND='emails.tests.FlakyBackend',
+    EMAIL_DELIVERY_MODE='batch',
+    EMAIL_MAX_ATTEMPTS=3,
+    EMAIL_RETRY_BACKOFF_SECONDS=60,
+    EMAIL_MAX_RECIPIENTS_PER_MESSAGE=100,
+)
+class SenderTestCase(TestCase):
+    """Sends through FlakyBackend, unthrottled, with a per-process cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='sender', email='sender@example.com', password='x')
+
+    def setUp(self):
+        FlakyBackend.open_error = None
+        FlakyBackend.errors = {}
+        FlakyBackend.opened = 0
+
+    def schedule(self, recipient_email='friend@example.com', recurrence_type='daily', recipients=(), **fields):
+        now = timezone.now()
+        email = ScheduledEmail.objects.create(
+            user=self.user,
+            recipient_email=recipient_email,
+            subject='Hello',
+            content='Hi there',
+            scheduled_time=now - timedelta(minutes=1),
+            next_send=now - timedelta(minutes=1),
+            recurrence_type=recurrence_type,
+            **fields,
+        )
+        EmailRecipient.objects.bulk_create(EmailRecipient(schedule=email, email=address) for address in recipients)
+        return email
+
+    def send(self, *emails):
+        return send_scheduled_email_batch([email.id for email in emails])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, THROTTLE_REDIS_URL=None)
+class ApiTestCase(TestCase):
+    """Two users, Alice and Bob, each with an authenticated API client"""
+
+    # Far enough ahead that nothing is handed to the broker
+    LATER = '2030-01-15T09:00:00'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', email='alice@example.com', password='x')
+        cls.bob = User.objects.create_user(username='bob', email='bob@example.com', password='x')
+
+    def setUp(self):
+        cache.clear()
+        user_cache._local.clear()
+        self.as_alice = APIClient()
+        self.as_alice.force_authenticate(self.alice)
+        self.as_bob = APIClient()
+        self.as_bob.force_authenticate(self.bob)
+
+
+class QueryPlanChecks:
+    """
+    The hot ScheduledEmail queries read the partial indexes in order,
+    without a sort. Subclasses run EXPLAIN the way their database does.
+    """
+
+    # Regex matching a plan step that reads one of the indexes in {names}
+    index_step = None
+    # Marker of a sort step in the plan
+    sort_step = None
+    # Regex matching an index search on both user and recipient
+    user_and_recipient_search = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='planner', email='planner@example.com', password='x')
+
+    def explain(self, cursor, sql):
+        raise NotImplementedError
+
+    def plans(self, run):
+        """EXPLAIN output of every ScheduledEmail SELECT that `run` issues"""
+        with CaptureQueriesContext(connection) as ctx:
+            run()
+        plans = []
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if sql.startswith('SELECT') and re.search(r'FROM "emails_scheduledemail"', sql):
+                with connection.cursor() as cursor:
+                    plans.append(self.explain(cursor, sql))
+        self.assertTrue(plans, 'no ScheduledEmail query was issued')
+        return plans
+
+    def assertUsesIndex(self, plans, *names):
+        for plan in plans:
+            self.assertRegex(plan, self.index_step.format(names='|'.join(names)))
+            self.assertNotRegex(plan, self.sort_step)
+
+    def test_claim_uses_priority_index(self):
+        plans = self.plans(lambda: claim_due_emails(10))
+        self.assertUsesIndex(plans, 'email_active_priority_idx')
+
+    def test_list_uses_user_index(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        plans = self.plans(lambda: client.get('/api/email/list/'))
+        self.assertUsesIndex(plans, 'email_active_user_idx', 'email_active_recipient_idx')
+
+    def test_list_by_recipient_uses_recipient_index(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        plans = self.plans(lambda: client.get('/api/email/list/', {'recipient_email': 'friend@example.com'}))
+        self.assertUsesIndex(plans, 'email_active_recipient_idx')
+        # Both equality columns are index searches, not a filter over the user's rows
+        for plan in plans:
+            self.assertRegex(plan, self.user_and_recipient_search)
+
+    def test_telex_list_uses_user_index(self):
+        plans = self.plans(lambda: TelexWebhookView().render_list_page(self.user.id, 1))
+        self.assertUsesIndex(plans, 'email_active_user_idx', 'email_active_recipient_idx')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+@override_settings(CACHES=LOCMEM_CACHES, THROTTLE_REDIS_URL=None)
+class SQLiteQueryPlanTests(QueryPlanChecks, TestCase):
+    index_step = r'USING (COVERING )?INDEX ({names})\b'
+    sort_step = r'TEMP B-TREE'
+    user_and_recipient_search = re.escape('user_id=? AND recipient_email=?')
+
+    def explain(self, cursor, sql):
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return ' | '.join(row[-1] for row in cursor.fetchall())
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'EXPLAIN output is PostgreSQL specific')
+@override_settings(CACHES=LOCMEM_CACHES, THROTTLE_REDIS_URL=None)
+class PostgresQueryPlanTests(QueryPlanChecks, TestCase):
+    index_step = r'Index (Only )?Scan (Backward )?using ({names}) on emails_scheduledemail'
+    sort_step = r'\bSort\b'
+    user_and_recipient_search = r'Index Cond: .*user_id = .*recipient_email.* = '
+
+    def setUp(self):
+        # A test table is a few pages, which the planner would rather scan
+        # whole; these checks are about whether the indexes fit the queries.
+        # SET LOCAL ends with the test's transaction.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+
+    def explain(self, cursor, sql):
+        cursor.execute(f'EXPLAIN {sql}')
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+STEPS = {'daily': (1, 0), 'weekly': (7, 0), 'monthly': (0, 1), 'yearly': (0, 12), 'anniversary': (0, 12)}
+
+
+def brute_force(anchor, recurrence_type, after, tz, weekdays=None):
+    """
+    First occurrence after `after`, found by walking the series one step at a
+    time from the naive local anchor. `weekdays` walks day by day and keeps
+    the days a weekly BYDAY rule would.
+    """
+    # DST moves a wall time by at most a couple of hours, so earlier candidates can be skipped
+    floor = after.astimezone(tz).replace(tzinfo=None) - timedelta(hours=3)
+    k = 0
+    while True:
+        if weekdays is not None:
+            naive = anchor + timedelta(days=k)
+            if naive.weekday() not in weekdays:
+                k += 1
+                continue
+        else:
+            days, months = STEPS[recurrence_type]
+            if days:
+                naive = anchor + timedelta(days=k * days)
+            else:
+                total = anchor.month - 1 + k * months
+                year, month = anchor.year + total // 12, total % 12 + 1
+                naive = anchor.replace(year=year, month=month, day=min(anchor.day, calendar.monthrange(year, month)[1]))
+        if naive >= floor:
+            aware = tz.normalize(tz.localize(naive))
+            if aware > after:
+                return aware
+        k += 1
+
+
+class RecurrencePropertyTests(SimpleTestCase):
+    """next_occurrence() agrees with a step-by-step walk of the series"""
+
+    ZONES = ['Africa/Lagos', 'America/New_York', 'Europe/London', 'Australia/Sydney']
+    SAMPLES = 9000
+
+    def random_anchor(self, rng):
+        """Local wall times biased towards month ends, leap days and the small hours DST shifts"""
+        year, month = rng.randint(2020, 2030), rng.randint(1, 12)
+        last = calendar.monthrange(year, month)[1]
+        day = rng.randint(28, last) if rng.random() < 0.5 else rng.randint(1, last)
+        if rng.random() < 0.1 and calendar.isleap(year):
+            month, day = 2, 29
+        hour = rng.randint(0, 3) if rng.random() < 0.5 else rng.randint(0, 23)
+        return datetime(year, month, day, hour, rng.choice([0, 15, 30, 59]))
+
+    def test_matches_brute_force(self):
+        rng = random.Random(20261017)
+        types = list(STEPS) + ['custom']
+        for _ in range(self.SAMPLES):
+            tz_name = rng.choice(self.ZONES)
+            tz = pytz_timezone(tz_name)
+            scheduled_time = tz.normalize(tz.localize(self.random_anchor(rng)))
+            # The engine anchors on the stored instant, so compare against its wall time
+            anchor = scheduled_time.astimezone(tz).replace(tzinfo=None)
+            after = scheduled_time + timedelta(days=rng.randint(0, 800), seconds=rng.randint(0, 86399))
+            recurrence_type = rng.choice(types)
+
+            rule = weekdays = None
+            if recurrence_type == 'custom':
+                weekdays = sorted(rng.sample(range(7), rng.randint(1, 7)))
+                rule = normalize_rule(
+                    'FREQ=WEEKLY;BYDAY=' + ','.join(WEEKDAYS[d] for d in weekdays), scheduled_time, tz_name
+                )
+
+            with self.subTest(anchor=anchor, tz=tz_name, type=recurrence_type, after=after, rule=rule):
+                expected = brute_force(anchor, recurrence_type, after, tz, weekdays)
+                got = next_occurrence(scheduled_time, recurrence_type, after, tz_name, rule)
+                self.assertEqual(got, expected)
+                self.assertEqual(got.utcoffset(), expected.utcoffset())
+
+    def test_month_end_clamps_and_returns(self):
+        tz = pytz_timezone('Africa/Lagos')
+        anchor = tz.localize(datetime(2027, 1, 31, 9, 0))
+        sends = [anchor]
+        for _ in range(3):
+            sends.append(next_occurrence(anchor, 'monthly', sends[-1], 'Africa/Lagos'))
+        self.assertEqual([s.day for s in sends], [31, 28, 31, 30])
+
+    def test_leap_day_anniversary(self):
+        tz = pytz_timezone('Africa/Lagos')
+        anchor = tz.localize(datetime(2028, 2, 29, 8, 0))
+        sends = [anchor]
+        for _ in range(4):
+            sends.append(next_occurrence(anchor, 'anniversary', sends[-1], 'Africa/Lagos'))
+        self.assertEqual(
+            [(s.year, s.month, s.day) for s in sends],
+            [(2028, 2, 29), (2029, 2, 28), (2030, 2, 28), (2031, 2, 28), (2032, 2, 29)],
+        )
+
+    def test_dst_gap_moves_forward_then_recovers(self):
+        tz = pytz_timezone('America/New_York')
+        anchor = tz.localize(datetime(2026, 3, 7, 2, 30))
+        gap = next_occurrence(anchor, 'daily', anchor, 'America/New_York')
+        self.assertEqual((gap.day, gap.hour, gap.minute), (8, 3, 30))
+        after_gap = next_occurrence(anchor, 'daily', gap, 'America/New_York')
+        self.assertEqual((after_gap.day, after_gap.hour, after_gap.minute), (9, 2, 30))
+
+    def test_wall_time_kept_across_dst(self):
+        tz = pytz_timezone('Europe/London')
+        anchor = tz.localize(datetime(2026, 10, 20, 9, 0))
+        send = next_occurrence(anchor, 'weekly', anchor, 'Europe/London')
+        self.assertEqual((send.day, send.hour), (27, 9))
+        self.assertNotEqual(send.utcoffset(), anchor.utcoffset())
+
+    def test_rrule_utc_until_is_inclusive_local_time(self):
+        tz = pytz_timezone('Africa/Lagos')
+        anchor = tz.localize(datetime(2026, 10, 19, 9, 0))
+        # 08:00Z is 09:00 in Lagos, so the third day is the last send
+        rrule = 'DTSTART:20261019T080000Z\nRRULE:FREQ=DAILY;UNTIL=20261021T080000Z'
+        rule = normalize_rule(rrule, anchor, 'Africa/Lagos')
+        self.assertNotIn('DTSTART', rule)
+        last = next_occurrence(anchor, 'custom', anchor + timedelta(days=1), 'Africa/Lagos', rule)
+        self.assertEqual(last, tz.localize(datetime(2026, 10, 21, 9, 0)))
+        self.assertIsNone(next_occurrence(anchor, 'custom', last, 'Africa/Lagos', rule))
+        with self.assertRaises(ValueError):
+            normalize_rule('FREQ=SOMETIMES', anchor, 'Africa/Lagos')
+
+
+class BatchSendTests(SenderTestCase):
+    """A batch goes out over one connection and rolls its schedules forward"""
+
+    def test_batch_shares_one_connection(self):
+        emails = [self.schedule(f'friend{i}@example.com') for i in range(4)]
+
+        result = self.send(*emails)
+
+        self.assertEqual(sorted(result['sent']), sorted(email.id for email in emails))
+        self.assertEqual(FlakyBackend.opened, 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f'friend{i}@example.com' for i in range(4)])
+
+    def test_sent_schedules_advance(self):
+        once = self.schedule(recurrence_type='once')
+        daily = self.schedule()
+        previous_send = daily.next_send
+
+        self.send(once, daily)
+
+        once.refresh_from_db()
+        daily.refresh_from_db()
+        self.assertFalse(once.is_active)
+        self.assertTrue(daily.is_active)
+        self.assertEqual(daily.next_send, previous_send + timedelta(days=1))
+        self.assertIsNotNone(daily.last_sent)
+        self.assertIsNone(daily.locked_until)
+
+    def test_cancelled_and_not_yet_due_are_skipped(self):
+        cancelled = self.schedule(is_active=False)
+        later = self.schedule()
+        ScheduledEmail.objects.filter(id=later.id).update(next_send=timezone.now() + timedelta(hours=1))
+
+        result = self.send(cancelled, later)
+
+        self.assertEqual(sorted(result['skipped']), sorted([cancelled.id, later.id]))
+        self.assertEqual(mail.outbox, [])
+
+    def test_backoff_doubles(self):
+        FlakyBackend.errors = {'busy@example.com': SMTPResponseException(421, b'4.7.0 Try again later')}
+        email = self.schedule('busy@example.com')
+        for attempt, backoff in ((1, 60), (2, 120)):
+            ScheduledEmail.objects.filter(id=email.id).update(next_send=timezone.now() - timedelta(seconds=1))
+            before = timezone.now()
+            self.send(email)
+            email.refresh_from_db()
+            self.assertEqual(email.failed_attempts, attempt)
+            self.assertGreaterEqual(email.next_send, before + timedelta(seconds=backoff))
+            self.assertLess(email.next_send, before + timedelta(seconds=backoff + 5))
+
+
+class SendFailureTests(SenderTestCase):
+    """Only rejections of the message itself are final; session failures back off"""
+
+    def test_login_failure_backs_off_instead_of_deactivating(self):
+        FlakyBackend.open_error = SMTPAuthenticationError(535, b'5.7.8 Username and Password not accepted')
+        emails = [self.schedule(f'friend{i}@example.com') for i in range(3)]
+        start = timezone.now()
+
+        result = self.send(*emails)
+
+        self.assertEqual(len(result['failed']), 3)
+        for email in ScheduledEmail.objects.filter(id__in=[e.id for e in emails]):
+            self.assertTrue(email.is_active)
+            self.assertEqual(email.failed_attempts, 1)
+            self.assertIsNone(email.locked_until)
+            self.assertGreaterEqual(email.next_send, start + timedelta(seconds=60))
+        self.assertEqual(mail.outbox, [])
+
+    def test_login_failure_in_pool_is_not_permanent(self):
+        FlakyBackend.open_error = SMTPAuthenticationError(535, b'5.7.8 Username and Password not accepted')
+        pool = SMTPPool(size=1, queue_size=1, health_check_interval=0)
+        try:
+            error, _, refused = pool.submit(mail.EmailMessage('Hi', 'Hi', to=['friend@example.com'])).result()
+        finally:
+            pool.close()
+        self.assertIsInstance(error, SMTPAuthenticationError)
+        self.assertFalse(is_permanent(error))
+
+    def test_account_level_5xx_is_not_permanent(self):
+        self.assertFalse(is_permanent(SMTPResponseException(554, b'5.7.0 Too many login attempts')))
+        self.assertFalse(is_permanent(ConnectionRefusedError()))
+        self.assertTrue(is_permanent(SMTPDataError(552, b'5.3.4 Message too big')))
+
+    def test_rejected_message_deactivates_single_address_schedule(self):
+        FlakyBackend.errors = {'gone@example.com': SMTPDataError(550, b'5.1.1 No such user')}
+        email = self.schedule('gone@example.com')
+
+        self.send(email)
+
+        email.refresh_from_db()
+        self.assertFalse(email.is_active)
+
+    def test_retries_are_capped(self):
+        FlakyBackend.errors = {'busy@example.com': SMTPResponseException(421, b'4.7.0 Try again later')}
+        once = self.schedule('busy@example.com', recurrence_type='once')
+        daily = self.schedule('busy@example.com')
+        previous_send = daily.next_send
+
+        for attempt in range(1, 4):
+            self.send(once, daily)
+            once.refresh_from_db()
+            daily.refresh_from_db()
+            if attempt < 3:
+                self.assertEqual((once.failed_attempts, daily.failed_attempts), (attempt, attempt))
+                ScheduledEmail.objects.filter(id__in=[once.id, daily.id]).update(
+                    next_send=timezone.now() - timedelta(seconds=1)
+                )
+
+        self.assertFalse(once.is_active)
+        self.assertTrue(daily.is_active)
+        self.assertEqual(daily.failed_attempts, 0)
+        self.assertEqual(daily.next_send, previous_send + timedelta(days=1))
+
+
+class RecipientChunkingTests(SenderTestCase):
+    """Multi-recipient schedules go out as BCC chunks, or one render per recipient"""
+
+    def test_recipients_are_sent_in_bcc_chunks(self):
+        addresses = [f'r{i:03}@example.com' for i in range(250)]
+        email = self.schedule('r000@example.com', recipients=addresses)
+
+        result = self.send(email)
+
+        self.assertEqual(result['sent'], [email.id])
+        self.assertEqual(FlakyBackend.opened, 1)
+        self.assertEqual([len(message.bcc) for message in mail.outbox], [100, 100, 50])
+        self.assertEqual(sorted(a for message in mail.outbox for a in message.bcc), addresses)
+        for message in mail.outbox:
+            self.assertEqual(message.to, [])
+            self.assertEqual(message.message()['To'], 'undisclosed-recipients:;')
+
+    def test_template_schedules_render_per_recipient(self):
+        template = EmailTemplate.objects.create(
+            user=self.user, name='Welcome', subject='Hi {{ name }}', text_body='Welcome, {{ name }}'
+        )
+        email = self.schedule('ann@example.com', template=template, recipients=['ann@example.com', 'ben@example.com'])
+
+        self.send(email)
+
+        sent = sorted((message.to, message.subject, message.body, message.bcc) for message in mail.outbox)
+        self.assertEqual(sent, [
+            (['ann@example.com'], 'Hi ann', 'Welcome, ann', []),
+            (['ben@example.com'], 'Hi ben', 'Welcome, ben', []),
+        ])
+
+
+class ChunkRejectionTests(SenderTestCase):
+    """A 5xx on one BCC chunk refuses those recipients only"""
+
+    def test_rejected_chunk_is_refused_and_schedule_advances(self):
+        addresses = [f'r{i:03}@example.com' for i in range(150)]
+        FlakyBackend.errors = {addresses[120]: SMTPDataError(552, b'5.3.4 Message too big')}
+        email = self.schedule('r000@example.com', recipients=addresses)
+        previous_send = email.next_send
+
+        result = self.send(email)
+
+        self.assertEqual(result['sent'], [email.id])
+        email.refresh_from_db()
+        self.assertTrue(email.is_active)
+        self.assertEqual(email.next_send, previous_send + timedelta(days=1))
+        statuses = dict(email.recipients.values_list('email', 'status'))
+        # The next occurrence goes to the first chunk again but not to the refused one
+        self.assertEqual(sum(status == 'pending' for status in statuses.values()), 100)
+        self.assertEqual(sum(status == 'refused' for status in statuses.values()), 50)
+        self.assertEqual(statuses[addresses[120]], 'refused')
+
+        mail.outbox.clear()
+        FlakyBackend.errors = {}
+        ScheduledEmail.objects.filter(id=email.id).update(next_send=timezone.now() - timedelta(seconds=1))
+        self.send(email)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(len(mail.outbox[0].bcc), 100)
+
+    def test_every_recipient_refused_deactivates(self):
+        addresses = ['a@example.com', 'b@example.com']
+        FlakyBackend.errors = {'a@example.com': SMTPDataError(554, b'5.7.1 Rejected')}
+        email = self.schedule('a@example.com', recipients=addresses)
+
+        self.send(email)
+
+        email.refresh_from_db()
+        self.assertFalse(email.is_active)
+
+    def test_temporary_chunk_failure_retries_that_chunk(self):
+        addresses = [f'r{i:03}@example.com' for i in range(150)]
+        FlakyBackend.errors = {addresses[120]: SMTPResponseException(451, b'4.3.0 Try later')}
+        email = self.schedule('r000@example.com', recipients=addresses)
+
+        result = self.send(email)
+
+        self.assertEqual([failure['id'] for failure in result['failed']], [email.id])
+        email.refresh_from_db()
+        self.assertTrue(email.is_active)
+        self.assertEqual(email.failed_attempts, 1)
+        statuses = list(email.recipients.values_list('status', flat=True))
+        self.assertEqual((statuses.count('sent'), statuses.count('failed')), (100, 50))
+
+
+class DeliveryLogTests(SenderTestCase):
+    """Every attempt leaves a DeliveryAttempt row until retention runs out"""
+
+    def outcomes(self, email):
+        return list(email.attempts.order_by('id').values_list('outcome', 'smtp_code'))
+
+    def test_sends_and_failures_are_logged(self):
+        FlakyBackend.errors = {'busy@example.com': SMTPResponseException(421, b'4.7.0 Try again later')}
+        ok = self.schedule('ok@example.com')
+        busy = self.schedule('busy@example.com')
+
+        self.send(ok, busy)
+
+        self.assertEqual(self.outcomes(ok), [('sent', 250)])
+        self.assertEqual(self.outcomes(busy), [('failed', 421)])
+        self.assertIn('Try again later', busy.attempts.get().error)
+
+    def test_rate_limited_emails_are_logged_as_deferred(self):
+        email = self.schedule()
+
+        with mock.patch('emails.tasks.throttle.acquire', return_value=30):
+            self.send(email)
+
+        self.assertEqual(self.outcomes(email), [('deferred', None)])
+        email.refresh_from_db()
+        self.assertTrue(email.slot_reserved)
+        self.assertEqual(mail.outbox, [])
+
+    @override_settings(DELIVERY_LOG_RETENTION_DAYS=30)
+    def test_old_attempts_are_pruned(self):
+        email = self.schedule()
+        now = timezone.now()
+        for days in (45, 31, 29, 1):
+            DeliveryAttempt.objects.create(schedule=email, attempted_at=now - timedelta(days=days), outcome='sent')
+
+        self.assertEqual(prune_delivery_attempts(batch_size=1), 2)
+        remaining = sorted((now - attempt).days for attempt in email.attempts.values_list('attempted_at', flat=True))
+        self.assertEqual(remaining, [1, 29])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TELEX_ASYNC_WEBHOOK=False)
+class TelexWebhookTests(TestCase):
+    """Webhook replies are deduped, but failures are left for Telex to retry"""
+
+    payload = {
+        'message': '/schedule "Stand-up in 5" to team@example.com at 2pm',
+        'sender_email': 'lead@example.com',
+        'channel_id': 'channel-1',
+    }
+
+    def setUp(self):
+        cache.clear()
+        user_cache._local.clear()
+
+    def post(self):
+        return APIClient().post('/api/telex/webhook/', self.payload, format='json')
+
+    def test_repeat_is_replayed(self):
+        first, second = self.post(), self.post()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(ScheduledEmail.objects.count(), 1)
+
+    def test_retry_after_database_error_runs_again(self):
+        create = ScheduledEmail.objects.create
+        calls = []
+
+        def flaky_create(**fields):
+            calls.append(fields)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return create(**fields)
+
+        with mock.patch.object(ScheduledEmail.objects, 'create', side_effect=flaky_create):
+            failed = self.post()
+            retried = self.post()
+
+        self.assertEqual(failed.status_code, 500)
+        self.assertEqual(retried.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', retried)
+        self.assertEqual(ScheduledEmail.objects.filter(recipient_email='team@example.com').count(), 1)
+
+    def test_non_object_body_is_rejected(self):
+        response = APIClient().post('/api/telex/webhook/', [self.payload], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TokenAuthTests(ApiTestCase):
+    """Login issues a bearer token that stops working with the password"""
+
+    def setUp(self):
+        super().setUp()
+        authentication._local.clear()
+        self.alice.set_password('s3cret')
+        self.alice.save()
+
+    def login(self, password='s3cret'):
+        return APIClient().post('/api/auth/login/', {'email': 'alice@example.com', 'password': password}, format='json')
+
+    def get_list(self, token):
+        return APIClient().get('/api/email/list/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_login_token_authenticates(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_list(response.data['token']).status_code, 200)
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+
+    def test_bad_token_is_rejected(self):
+        token = self.login().data['token']
+        for bad in (token[:-1] + ('A' if token[-1] != 'A' else 'B'), 'nonsense'):
+            with self.subTest(token=bad):
+                response = self.get_list(bad)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    def test_password_change_revokes_tokens(self):
+        token = self.login().data['token']
+        self.assertEqual(self.get_list(token).status_code, 200)
+
+        self.alice.set_password('n3w-secret')
+        self.alice.save()
+
+        self.assertEqual(self.get_list(token).status_code, 401)
+
+    @override_settings(API_TOKEN_MAX_AGE=60)
+    def test_expired_token_is_rejected(self):
+        with mock.patch('django.core.signing.time.time', return_value=time.time() - 120):
+            token = authentication.issue_token(self.alice)
+        self.assertEqual(self.get_list(token).status_code, 401)
+
+    def test_anonymous_requests_are_unauthorized(self):
+        response = APIClient().post(
+            '/api/email/schedule/', {'recipient_email': 'team@example.com', 'content': 'Hi'}, format='json'
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(ScheduledEmail.objects.exists())
+
+
+class TemplateOwnershipTests(ApiTestCase):
+    """Templates can only be used by the user who created them"""
+
+    def setUp(self):
+        super().setUp()
+        response = self.as_alice.post('/api/email/templates/', {
+            'name': 'Payroll',
+            'subject': 'Alice private',
+            'text_body': 'Alice payroll: {{ amount }}',
+        }, format='json')
+        self.template_id = response.data['template_id']
+
+    def schedule_item(self):
+        return {
+            'recipient_email': 'someone@example.com',
+            'template_id': self.template_id,
+            'context': {'amount': 123},
+            'scheduled_time': self.LATER,
+        }
+
+    def test_template_is_owned_by_its_creator(self):
+        self.assertEqual(EmailTemplate.objects.get(id=self.template_id).user, self.alice)
+
+    def test_owner_can_schedule_with_it(self):
+        response = self.as_alice.post('/api/email/schedule/', self.schedule_item(), format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_other_user_cannot_schedule_with_it(self):
+        response = self.as_bob.post('/api/email/schedule/', self.schedule_item(), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['message'], 'Template not found')
+
+        response = self.as_bob.post('/api/email/schedule/bulk/', {'emails': [self.schedule_item()]}, format='json')
+        self.assertEqual(response.data['results'][0]['message'], 'Template not found')
+        self.assertFalse(ScheduledEmail.objects.filter(user=self.bob).exists())
+
+    @override_settings(EMAIL_RATE_LIMITS={}, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_sender_does_not_render_another_users_template(self):
+        now = timezone.now()
+        email = ScheduledEmail.objects.create(
+            user=self.bob, recipient_email='bob@example.com', template_id=self.template_id,
+            scheduled_time=now, next_send=now,
+        )
+
+        result = send_scheduled_email_batch([email.id])
+
+        self.assertEqual(result['sent'], [])
+        self.assertEqual(mail.outbox, [])
+        email.refresh_from_db()
+        self.assertFalse(email.is_active)
+
+
+@override_settings(METRICS_TOKEN='scrape-secret', EMAIL_RATE_LIMITS={})
+class MetricsAccessTests(ApiTestCase):
+    """Metrics are for staff and the scraper only"""
+
+    def test_anonymous_is_refused(self):
+        self.assertEqual(APIClient().get('/api/metrics/').status_code, 401)
+
+    def test_regular_user_is_refused(self):
+        self.assertEqual(self.as_alice.get('/api/metrics/').status_code, 403)
+
+    def test_staff_and_scrape_token_are_allowed(self):
+        staff = User.objects.create_user(username='ops', password='x', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+        self.assertEqual(client.get('/api/metrics/').status_code, 200)
+
+        response = APIClient().get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'email_send_lag_seconds', response.content)
+
+    def test_wrong_scrape_token_is_refused(self):
+        response = APIClient().get('/api/metrics/', HTTP_AUTHORIZATION='Bearer guess')
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SenderCacheTests(TestCase):
+    """Sender lookups are invalidated per address, across processes"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache._local.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='x')
+
+    def other_process(self):
+        """Forget this process's entries, as a different worker would not have them"""
+        user_cache._local.clear()
+
+    def test_new_sender_keeps_other_entries(self):
+        self.assertEqual(user_cache.lookup_user_id('alice@example.com'), self.alice.id)
+        user_cache.get_or_create_user_id('newcomer@example.com')
+
+        self.other_process()
+        with self.assertNumQueries(0):
+            self.assertEqual(user_cache.lookup_user_id('alice@example.com'), self.alice.id)
+
+    def test_local_hit_skips_shared_cache(self):
+        user_cache.lookup_user_id('alice@example.com')
+        with mock.patch.object(user_cache.cache, 'get_many') as get_many:
+            self.assertEqual(user_cache.lookup_user_id('alice@example.com'), self.alice.id)
+        get_many.assert_not_called()
+
+    def test_changed_address_is_invalidated_everywhere(self):
+        user_cache.lookup_user_id('alice@example.com')
+        self.alice.email = 'alice@new.example.com'
+        self.alice.save()
+
+        self.other_process()
+        self.assertIsNone(user_cache.lookup_user_id('alice@example.com'))
+        self.assertEqual(user_cache.lookup_user_id('alice@new.example.com'), self.alice.id)
+
+    def test_negative_entry_cleared_by_signup(self):
+        self.assertIsNone(user_cache.lookup_user_id('late@example.com'))
+        late = User.objects.create_user(username='late', email='late@example.com', password='x')
+
+        self.other_process()
+        self.assertEqual(user_cache.lookup_user_id('late@example.com'), late.id)
+
+
+class BulkCancelTests(ApiTestCase):
+    """Bulk cancel only ever matches the caller's own schedules"""
+
+    def setUp(self):
+        super().setUp()
+        later = timezone.now() + timedelta(days=1)
+        self.emails = {}
+        for owner in (self.alice, self.bob):
+            for recipient in ('team@example.com', 'boss@example.com'):
+                self.emails[owner.username, recipient] = ScheduledEmail.objects.create(
+                    user=owner, recipient_email=recipient, subject='Hi', content='Hi',
+                    scheduled_time=later, next_send=later,
+                )
+
+    def cancel(self, client, body):
+        return client.post('/api/email/cancel/', body, format='json')
+
+    def active(self):
+        return set(
+            ScheduledEmail.objects.filter(is_active=True)
+            .values_list('user__username', 'recipient_email')
+        )
+
+    def test_by_recipient(self):
+        response = self.cancel(self.as_alice, {'recipient_email': 'team@example.com'})
+        self.assertEqual(response.data['cancelled'], 1)
+        self.assertNotIn(('alice', 'team@example.com'), self.active())
+        self.assertIn(('bob', 'team@example.com'), self.active())
+
+    def test_by_own_user_id(self):
+        response = self.cancel(self.as_alice, {'user_id': self.alice.id})
+        self.assertEqual(response.data['cancelled'], 2)
+        self.assertEqual(self.active(), {('bob', 'team@example.com'), ('bob', 'boss@example.com')})
+
+    def test_other_users_schedules_are_untouched(self):
+        bob_email = self.emails['bob', 'team@example.com']
+        for body in ({'user_id': self.bob.id}, {'ids': [bob_email.id]}):
+            response = self.cancel(self.as_alice, body)
+            self.assertEqual(response.data['cancelled'], 0)
+        self.assertEqual(len(self.active()), 4)
+
+    def test_bad_bodies_are_rejected(self):
+        for body in ([{'ids': [1]}], {}, {'ids': 1}, {'ids': [1], 'user_id': 1}, {'user_id': 'me'}):
+            with self.subTest(body=body):
+                self.assertEqual(self.cancel(self.as_alice, body).status_code, 400)
+        self.assertEqual(len(self.active()), 4)
+
+    def lease(self, email, task_id):
+        ScheduledEmail.objects.filter(pk=email.pk).update(
+            task_id=task_id, locked_until=timezone.now() + timedelta(minutes=5)
+        )
+
+    def test_queued_batches_are_revoked(self):
+        self.lease(self.emails['alice', 'team@example.com'], 'batch-1')
+        with mock.patch('emails.tasks.current_app.control.revoke') as revoke:
+            self.cancel(self.as_alice, {'user_id': self.alice.id})
+        revoke.assert_called_once_with(['batch-1'])
+        self.assertFalse(ScheduledEmail.objects.filter(task_id='batch-1').exists())
+
+    def test_batches_still_carrying_active_emails_are_kept(self):
+        self.lease(self.emails['alice', 'team@example.com'], 'batch-1')
+        self.lease(self.emails['bob', 'team@example.com'], 'batch-1')
+        with mock.patch('emails.tasks.current_app.control.revoke') as revoke:
+            response = self.cancel(self.as_alice, {'user_id': self.alice.id})
+        self.assertEqual(response.data['cancelled'], 2)
+        revoke.assert_not_called()
+
+
+@override_settings(EMAIL_BULK_MAX_ITEMS=5, EMAIL_MAX_RECIPIENTS_PER_SCHEDULE=4, EMAIL_BULK_MAX_RECIPIENTS=10)
+class BulkScheduleTests(ApiTestCase):
+    """Bulk scheduling validates per item and bounds the whole request"""
+
+    def item(self, **fields):
+        return {'recipient_email': 'team@example.com', 'content': 'Hi', 'scheduled_time': self.LATER, **fields}
+
+    def bulk(self, items):
+        return self.as_alice.post('/api/email/schedule/bulk/', {'emails': items}, format='json')
+
+    def test_items_are_created_with_results_in_order(self):
+        response = self.bulk([self.item(), self.item(recurrence_type='hourly'), self.item(context='x')])
+        self.assertEqual([r['status'] for r in response.data['results']], ['success', 'error', 'error'])
+        self.assertEqual([r['index'] for r in response.data['results']], [0, 1, 2])
+        email = ScheduledEmail.objects.get(user=self.alice)
+        self.assertEqual(email.priority, 'bulk')
+
+    def test_recipients_are_saved(self):
+        recipients = ['a@example.com', 'b@example.com', 'c@example.com']
+        response = self.bulk([self.item(recipient_email=None, recipients=recipients)])
+        self.assertEqual(response.data['results'][0]['status'], 'success')
+        email = ScheduledEmail.objects.get(user=self.alice)
+        self.assertEqual(sorted(email.recipients.values_list('email', flat=True)), recipients)
+
+    def test_total_recipients_are_capped(self):
+        items = [self.item(recipients=[f'r{i}{j}@example.com' for j in range(4)]) for i in range(3)]
+        response = self.bulk(items)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('10 recipients per request', response.data['message'])
+        self.assertFalse(ScheduledEmail.objects.exists())
+        self.assertFalse(EmailRecipient.objects.exists())
+
+    def test_item_count_is_capped(self):
+        self.assertEqual(self.bulk([self.item()] * 6).status_code, 400)
+
+    def test_non_object_body_is_rejected(self):
+        response = self.as_alice.post('/api/email/schedule/bulk/', [self.item()], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ClaimBudgetTests(SenderTestCase):
+    """The dispatcher claims only what the send buckets can pay for, per recipient"""
+
+    def setUp(self):
+        super().setUp()
+        throttle._local_buckets.clear()
+
+    @override_settings(EMAIL_RATE_LIMITS={'*': {'per_minute': 10}})
+    def test_claim_is_sized_by_recipients(self):
+        first = self.schedule(recipients=[f'a{i}@example.com' for i in range(6)])
+        second = self.schedule(recipients=[f'b{i}@example.com' for i in range(6)])
+        third = self.schedule()
+        ScheduledEmail.objects.filter(id=second.id).update(next_send=first.next_send + timedelta(seconds=1))
+        ScheduledEmail.objects.filter(id=third.id).update(next_send=first.next_send + timedelta(seconds=2))
+
+        # 6 of 10 tokens, then 6 more overdraws the rest; nothing is left for the third
+        self.assertEqual(claim_due_emails(10), [first.id, second.id])
+
+    @override_settings(EMAIL_RATE_LIMITS={'*': {'per_minute': 10}})
+    def test_spent_budget_claims_only_reserved_rows(self):
+        throttle.acquire(throttle.sending_account(), {'example.com': 10})
+        unpaid = self.schedule()
+        reserved = self.schedule(slot_reserved=True)
+
+        self.assertEqual(claim_due_emails(10), [reserved.id])
+        self.assertEqual(throttle.claim_budget(throttle.sending_account()), 0)
+        self.assertIsNone(ScheduledEmail.objects.get(id=unpaid.id).locked_until)
+
+
+class BulkEnqueueTests(ApiTestCase):
+    """Due bulk items are leased and handed to the batch sender in grouped batches"""
+
+    def item(self, scheduled_time, **fields):
+        return {'recipient_email': 'team@example.com', 'content': 'Hi', 'scheduled_time': scheduled_time, **fields}
+
+    @mock.patch('emails.views.enqueue_send_batches')
+    def test_due_items_are_leased_and_enqueued_together(self, enqueue):
+        past = '2020-01-01T09:00:00'
+        response = self.as_alice.post('/api/email/schedule/bulk/', {
+            'emails': [self.item(past), self.item(self.LATER), self.item(past)]
+        }, format='json')
+
+        ids = [result['email_id'] for result in response.data['results']]
+        enqueue.assert_called_once_with([ids[0], ids[2]])
+        leased = dict(ScheduledEmail.objects.values_list('id', 'locked_until'))
+        self.assertIsNotNone(leased[ids[0]])
+        self.assertIsNone(leased[ids[1]])
+        self.assertEqual(ScheduledEmail.objects.get(id=ids[1]).priority, 'bulk')
+
+    @override_settings(EMAIL_SEND_BATCH_SIZE=2)
+    @mock.patch('emails.tasks.send_scheduled_email_batch.apply_async')
+    def test_batches_are_grouped_by_priority(self, apply_async):
+        now = timezone.now()
+        emails = [
+            ScheduledEmail.objects.create(
+                user=self.alice, recipient_email='team@example.com', content='Hi',
+                scheduled_time=now, next_send=now, priority=priority,
+            )
+            for priority in ('bulk', 'high', 'bulk', 'bulk')
+        ]
+
+        enqueue_send_batches([email.id for email in emails])
+
+        calls = [(c.kwargs['args'][0], c.kwargs['queue'], c.kwargs['task_id']) for c in apply_async.call_args_list]
+        self.assertEqual([(ids, queue) for ids, queue, _ in calls], [
+            ([emails[1].id], queue_for('high')),
+            ([emails[0].id, emails[2].id], queue_for('bulk')),
+            ([emails[3].id], queue_for('bulk')),
+        ])
+        # Rows carry their batch's task id, so cancelling can revoke it
+        for ids, _, task_id in calls:
+            task_ids = ScheduledEmail.objects.filter(id__in=ids).values_list('task_id', flat=True)
+            self.assertEqual(set(task_ids), {task_id})
+
+
+class IdempotentScheduleTests(ApiTestCase):
+    """Retried schedule calls are replayed, per caller"""
+
+    def schedule(self, client, key=None, **fields):
+        body = {'recipient_email': 'team@example.com', 'content': 'Hi', 'scheduled_time': self.LATER, **fields}
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return client.post('/api/email/schedule/', body, format='json', **headers)
+
+    def test_explicit_key_replays_the_first_response(self):
+        first = self.schedule(self.as_alice, key='abc')
+        second = self.schedule(self.as_alice, key='abc', content='Changed')
+
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['email_id'], first.data['email_id'])
+        self.assertEqual(ScheduledEmail.objects.count(), 1)
+
+    def test_identical_body_is_deduped_without_a_key(self):
+        self.schedule(self.as_alice)
+        self.assertEqual(self.schedule(self.as_alice)['Idempotent-Replayed'], 'true')
+        self.assertEqual(ScheduledEmail.objects.count(), 1)
+
+    def test_keys_are_per_caller(self):
+        alice = self.schedule(self.as_alice, key='abc')
+        bob = self.schedule(self.as_bob, key='abc')
+
+        self.assertNotIn('Idempotent-Replayed', bob)
+        self.assertNotEqual(bob.data['email_id'], alice.data['email_id'])
+        self.assertEqual(ScheduledEmail.objects.get(id=bob.data['email_id']).user, self.bob)
+
+    def test_request_in_flight_conflicts(self):
+        key = idempotency_keys('schedule', 'abc', None, self.alice.pk)[0]
+        cache.set(key, IN_FLIGHT)
+        response = self.schedule(self.as_alice, key='abc')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(ScheduledEmail.objects.exists())
+
+    def test_validation_errors_are_replayed_but_server_errors_are_not(self):
+        self.assertEqual(self.schedule(self.as_alice, key='bad', scheduled_time='soon').status_code, 400)
+        self.assertEqual(self.schedule(self.as_alice, key='bad')['Idempotent-Replayed'], 'true')
+
+        with mock.patch('emails.views.parse_schedule_item', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.schedule(self.as_alice, key='retry')
+        self.assertEqual(self.schedule(self.as_alice, key='retry').status_code, 201)
+
+
+class ExportTests(ApiTestCase):
+    """The export streams a user's or a domain's schedules to admins only"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True)
+        later = timezone.now() + timedelta(days=1)
+        for owner, recipient, active in (
+            (cls.alice, 'team@example.com', True),
+            (cls.alice, 'boss@corp.example', True),
+            (cls.alice, 'old@example.com', False),
+            (cls.bob, 'team@example.com', True),
+        ):
+            ScheduledEmail.objects.create(
+                user=owner, recipient_email=recipient, subject='Hi', content='Hi, "you"',
+                scheduled_time=later, next_send=later, is_active=active, context={'name': 'Ann'},
+            )
+
+    def setUp(self):
+        super().setUp()
+        self.as_admin = APIClient()
+        self.as_admin.force_authenticate(self.admin)
+
+    def export(self, client=None, **params):
+        return (client or self.as_admin).get('/api/email/export/', params)
+
+    def rows(self, **params):
+        response = self.export(**params)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_admins_only(self):
+        self.assertEqual(self.export(self.as_alice, user_id=self.alice.id).status_code, 403)
+        self.assertEqual(self.export(APIClient(), user_id=self.alice.id).status_code, 401)
+
+    def test_ndjson_rows_match_the_serializer(self):
+        rows = self.rows(user_id=self.alice.id)
+        emails = ScheduledEmail.objects.filter(user=self.alice).order_by('id')
+        self.assertEqual(rows, json.loads(json.dumps(ScheduledEmailSerializer(emails, many=True).data)))
+        self.assertEqual(rows[0]['context'], {'name': 'Ann'})
+
+    def test_filters(self):
+        def recipients(**params):
+            return sorted((row['recipient_email'], row['is_active']) for row in self.rows(**params))
+
+        self.assertEqual(recipients(domain='corp.example'), [('boss@corp.example', True)])
+        self.assertEqual(recipients(user_id=self.alice.id, active='true'),
+                         [('boss@corp.example', True), ('team@example.com', True)])
+        self.assertEqual(recipients(user_id=self.bob.id, domain='example.com'), [('team@example.com', True)])
+
+    def test_csv_has_a_header_and_json_context(self):
+        response = self.export(user_id=self.bob.id, type='csv')
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        header, *rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(header[:3], ['id', 'recipient_email', 'subject'])
+        self.assertEqual(len(rows), 1)
+        row = dict(zip(header, rows[0]))
+        self.assertEqual(row['content'], 'Hi, "you"')
+        self.assertEqual(json.loads(row['context']), {'name': 'Ann'})
+
+    def test_gzip_round_trips(self):
+        plain = b''.join(self.export(user_id=self.alice.id).streaming_content)
+        response = self.export(user_id=self.alice.id, gzip='true')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('schedules.ndjson.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({'user_id': self.alice.id, 'type': 'xml'}, {}, {'user_id': 'me'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.export(**params).status_code, 400)
@@ -0,0 +1,225 @@
+"""
+Token-bucket send throttling per sending account and recipient domain.
+
+Limits come from EMAIL_RATE_LIMITS: '*' is the account-wide limit, a
+domain key (e.g. 'gmail.com') limits sends to that domain and 'default'
+covers every other domain. Each limit may set per_second, per_minute,
+per_hour and per_day; each becomes a bucket refilled continuously at
+limit/window tokens per second.
+
+Providers count recipients, not messages, so a send costs one token per
+recipient, taken from the account bucket and from each recipient domain's
+bucket. acquire() always takes them, letting buckets go into debt, and
+returns how long until the debt it adds is paid off. That is the send's
+slot: callers defer the send to it, already paid for, so each deferred
+send gets its own slot behind the ones before it instead of all retrying
+at once. claim_budget() tells the dispatcher how many recipients the
+account can pay for now, so it stops claiming work that would only be
+deferred.
+
+Buckets live in Redis when THROTTLE_REDIS_URL is set, so all workers share
+them; otherwise (or if Redis is unreachable) each process keeps its own.
+Redis buckets are listed in a set, so reporting reads them directly
+instead of scanning a keyspace shared with the broker and the cache.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = {
+    'per_second': 1,
+    'per_minute': 60,
+    'per_hour': 3600,
+    'per_day': 86400,
+}
+
+KEY_PREFIX = 'throttle'
+# Set of every bucket key, for bucket_levels()
+REGISTRY_KEY = f'{KEY_PREFIX}-buckets'
+
+# Takes the tokens from every bucket, into debt if need be, and returns
+# when the deepest debt is paid off. The last key is the bucket registry.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wait = 0
+local registry = KEYS[#KEYS]
+for i = 1, #KEYS - 1 do
+    local key = KEYS[i]
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local capacity = tonumber(ARGV[i * 3])
+    local cost = tonumber(ARGV[i * 3 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate) - cost
+    if tokens < 0 then
+        wait = math.max(wait, -tokens / rate)
+    end
+    redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil((capacity - tokens) / rate) + 60)
+    redis.call('SADD', registry, key)
+end
+return tostring(wait)
+"""
+
+_local_buckets = {}
+_local_lock = threading.Lock()
+_redis = None
+_redis_script = None
+
+
+def buckets_for(account, domains):
+    """
+    (key, rate per second, capacity, cost) for every bucket a send must pass.
+
+    `domains` maps each recipient domain to its number of recipients.
+    """
+    limits = settings.EMAIL_RATE_LIMITS
+    scopes = [('*', limits.get('*'), sum(domains.values()))]
+    for domain, count in domains.items():
+        scopes.append((domain, limits.get(domain, limits.get('default')), count))
+
+    buckets = []
+    for scope, scope_limits, cost in scopes:
+        for window, limit in (scope_limits or {}).items():
+            seconds = WINDOWS[window]
+            buckets.append((f'{KEY_PREFIX}:{account}:{scope}:{window}', limit / seconds, float(limit), cost))
+    return buckets
+
+
+def _get_redis():
+    global _redis, _redis_script
+    if _redis is None and settings.THROTTLE_REDIS_URL:
+        import redis
+        _redis = redis.Redis.from_url(settings.THROTTLE_REDIS_URL)
+        _redis_script = _redis.register_script(ACQUIRE_SCRIPT)
+    return _redis
+
+
+def _refilled(tokens, ts, rate, capacity, now):
+    return min(capacity, tokens + max(0.0, now - ts) * rate)
+
+
+def _acquire_local(buckets, now):
+    with _local_lock:
+        wait = 0.0
+        for key, rate, capacity, cost in buckets:
+            tokens, ts = _local_buckets.get(key, (capacity, now))
+            tokens = _refilled(tokens, ts, rate, capacity, now) - cost
+            if tokens < 0:
+                wait = max(wait, -tokens / rate)
+            _local_buckets[key] = (tokens, now)
+        return wait
+
+
+def acquire(account, domains):
+    """
+    Reserve send slots for recipients at `domains` ({domain: recipients}).
+
+    Returns 0 when the send may go now, or the seconds until its reserved
+    slot; the tokens are taken either way.
+    """
+    buckets = buckets_for(account, domains)
+    if not buckets or not sum(domains.values()):
+        return 0.0
+
+    now = time.time()
+    if _get_redis() is not None:
+        try:
+            keys = [key for key, _, _, _ in buckets] + [REGISTRY_KEY]
+            args = [now]
+            for _, rate, capacity, cost in buckets:
+                args.extend([rate, capacity, cost])
+            return float(_redis_script(keys=keys, args=args))
+        except Exception as e:
+            logger.warning("Throttle Redis unavailable, using local buckets: %s", e)
+
+    return _acquire_local(buckets, now)
+
+
+def claim_budget(account):
+    """
+    Recipients the account-wide buckets can pay for right now, or None when
+    they are unlimited. Each send costs one token per recipient (see acquire).
+    """
+    buckets = buckets_for(account, {})
+    if not buckets:
+        return None
+
+    now = time.time()
+    states = None
+    if _get_redis() is not None:
+        try:
+            pipe = _redis.pipeline()
+            for key, _, _, _ in buckets:
+                pipe.hmget(key, 'tokens', 'ts')
+            states = [
+                (float(tokens), float(ts)) if tokens is not None else None
+                for tokens, ts in pipe.execute()
+            ]
+        except Exception as e:
+            logger.warning("Throttle Redis unavailable, using local buckets: %s", e)
+
+    if states is None:
+        with _local_lock:
+            states = [_local_buckets.get(key) for key, _, _, _ in buckets]
+
+    budget = None
+    for (key, rate, capacity, _), state in zip(buckets, states):
+        tokens = capacity if state is None else _refilled(state[0], state[1], rate, capacity, now)
+        budget = int(max(tokens, 0)) if budget is None else min(budget, int(max(tokens, 0)))
+    return budget
+
+
+def sending_account():
+    return settings.EMAIL_HOST_USER or 'default'
+
+
+def bucket_levels():
+    """Current token level of every known bucket, for reporting"""
+    levels = []
+    now = time.time()
+
+    if _get_redis() is not None:
+        try:
+            keys = sorted(_redis.smembers(REGISTRY_KEY))
+            pipe = _redis.pipeline()
+            for key in keys:
+                pipe.hmget(key, 'tokens', 'ts')
+            expired = []
+            for key, (tokens, ts) in zip(keys, pipe.execute()):
+                if tokens is None:
+                    expired.append(key)
+                else:
+                    levels.append(_level(key.decode(), float(tokens), float(ts), now))
+            # Buckets left to expire are registered again when next used
+            if expired:
+                _redis.srem(REGISTRY_KEY, *expired)
+            return levels
+        except Exception as e:
+            logger.warning("Throttle Redis unavailable, reporting local buckets: %s", e)
+            levels = []
+
+    with _local_lock:
+        for key, (tokens, ts) in _local_buckets.items():
+            levels.append(_level(key, tokens, ts, now))
+    return levels
+
+
+def _level(key, tokens, ts, now):
+    _, account, scope, window = key.split(':', 3)
+    limits = settings.EMAIL_RATE_LIMITS
+    scope_limits = limits.get(scope, limits.get('default')) or {}
+    capacity = float(scope_limits.get(window, tokens))
+    rate = capacity / WINDOWS[window]
+    return {
+        'account': account,
+        'scope': scope,
+        'window': window,
+        'capacity': capacity,
+        'tokens': round(_refilled(tokens, ts, rate, capacity, now), 3),
+    }
@@ -0,0 +1,250 @@
+"""
+Hierarchical timing wheel that fires due emails from memory.
+
+The runner (`python manage.py run_timing_wheel`) loads only the emails due
+within the next EMAIL_WHEEL_HORIZON_SECONDS, with one range query on the
+active due index, and extends that window every EMAIL_WHEEL_REFILL_SECONDS.
+The wheel fires each email on its tick. It claims the email through the
+same lease as the dispatcher, then hands it to the batch sender. Memory and
+refill cost therefore follow the horizon, not the total number of schedules.
+
+The API records created, edited and cancelled ids in the cache with
+invalidate(). The runner reloads those ids before its next tick. The lease
+claim re-checks is_active and next_send in any case, and the beat dispatcher
+still picks up anything the wheel misses.
+"""
+import logging
+import math
+import time
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import ScheduledEmail
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'timing_wheel'
+SEQ_KEY = f'{PREFIX}:seq'
+
+
+class _Slot:
+    """Email ids and due timestamps kept in two parallel arrays"""
+    __slots__ = ('ids', 'dues')
+
+    def __init__(self):
+        self.ids = array('q')
+        self.dues = array('d')
+
+    def add(self, email_id, due):
+        self.ids.append(email_id)
+        self.dues.append(due)
+
+    def drain(self):
+        entries = zip(self.ids, self.dues)
+        self.ids = array('q')
+        self.dues = array('d')
+        return entries
+
+
+class TimingWheel:
+    """
+    Hashed hierarchical timing wheel with `levels` wheels of 2**bits slots.
+
+    Level 0 slots are one tick wide, and each higher level is 2**bits times
+    coarser. An entry is placed on the lowest level whose digit still
+    differs from the current tick. It cascades down as the wheel turns, so
+    every add, cascade and fire costs O(1) per entry.
+    """
+    __slots__ = ('tick', 'bits', 'mask', 'levels', 'wheels', 'current', 'entries', 'ready')
+
+    def __init__(self, tick=0.1, bits=6, levels=4, start=None):
+        self.tick = tick
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.levels = levels
+        self.wheels = [[_Slot() for _ in range(1 << bits)] for _ in range(levels)]
+        self.current = int((time.time() if start is None else start) / tick)
+        # email id -> due timestamp of its live entry; stale slot entries
+        # (removed or rescheduled) are skipped when they come up
+        self.entries = {}
+        self.ready = []
+
+    @property
+    def span(self):
+        """Seconds ahead the wheel can hold"""
+        return self.tick * (1 << (self.bits * self.levels))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, email_id):
+        return email_id in self.entries
+
+    def add(self, email_id, due):
+        """Schedule `email_id` for the timestamp `due`, replacing any earlier entry"""
+        self.entries[email_id] = due
+        self._place(email_id, due)
+
+    def remove(self, email_id):
+        self.entries.pop(email_id, None)
+
+    def _place(self, email_id, due):
+        # Round up so an entry never fires before its due time
+        due_tick = math.ceil(due / self.tick)
+        if due_tick <= self.current:
+            self.ready.append((email_id, due))
+            return
+
+        for level in range(self.levels):
+            shift = self.bits * (level + 1)
+            if due_tick >> shift == self.current >> shift:
+                index = (due_tick >> (self.bits * level)) & self.mask
+                self.wheels[level][index].add(email_id, due)
+                return
+        raise ValueError(f'Due time is beyond the wheel span of {self.span:.0f}s')
+
+    def advance(self, now=None):
+        """Turn the wheel up to `now` and return the ids that came due, in order"""
+        target = int((time.time() if now is None else now) / self.tick)
+        fired = self._take_ready()
+        while self.current < target:
+            self.current += 1
+            # Cascade top-down so entries can drop several levels in one tick
+            for level in range(self.levels - 1, 0, -1):
+                if self.current & ((1 << (self.bits * level)) - 1) == 0:
+                    index = (self.current >> (self.bits * level)) & self.mask
+                    for email_id, due in self.wheels[level][index].drain():
+                        if self.entries.get(email_id) == due:
+                            self._place(email_id, due)
+
+            for email_id, due in self.wheels[0][self.current & self.mask].drain():
+                if self.entries.get(email_id) == due:
+                    del self.entries[email_id]
+                    fired.append(email_id)
+            # Entries cascaded onto the current tick
+            fired.extend(self._take_ready())
+        return fired
+
+    def _take_ready(self):
+        fired = []
+        for email_id, due in self.ready:
+            if self.entries.get(email_id) == due:
+                del self.entries[email_id]
+                fired.append(email_id)
+        self.ready = []
+        return fired
+
+
+def invalidate(email_ids):
+    """Tell running wheels that these emails were created, edited or cancelled"""
+    email_ids = list(email_ids)
+    if not email_ids:
+        return
+
+    try:
+        seq = cache.incr(SEQ_KEY)
+    except ValueError:
+        cache.add(SEQ_KEY, 0, None)
+        seq = cache.incr(SEQ_KEY)
+    cache.set(f'{PREFIX}:invalidated:{seq}', email_ids, settings.EMAIL_WHEEL_HORIZON_SECONDS * 2)
+
+
+def within_horizon(now=None):
+    """Upper bound of next_send for rows a running wheel may hold"""
+    now = now or timezone.now()
+    return now + timedelta(seconds=settings.EMAIL_WHEEL_HORIZON_SECONDS + settings.EMAIL_WHEEL_REFILL_SECONDS)
+
+
+class WheelRunner:
+    """Keeps a TimingWheel filled from the database and sends what it fires"""
+
+    def __init__(self, tick=None, horizon=None, refill_interval=None):
+        self.tick = tick or settings.EMAIL_WHEEL_TICK
+        self.horizon = horizon or settings.EMAIL_WHEEL_HORIZON_SECONDS
+        self.refill_interval = refill_interval or settings.EMAIL_WHEEL_REFILL_SECONDS
+        self.wheel = TimingWheel(tick=self.tick)
+        if self.wheel.span < self.horizon + self.refill_interval:
+            raise ValueError('Horizon does not fit in the timing wheel')
+        self.loaded_until = None
+        self.next_refill = 0.0
+        self.seq = cache.get(SEQ_KEY, 0)
+        self.fired = 0
+
+    def refill(self, now):
+        """Load the rows that fall due between the loaded window and now + horizon"""
+        until = datetime.fromtimestamp(now + self.horizon, dt_timezone.utc)
+        rows = ScheduledEmail.objects.filter(is_active=True, next_send__lte=until)
+        if self.loaded_until is None:
+            # Rows already overdue are left to the dispatcher
+            rows = rows.filter(next_send__gt=datetime.fromtimestamp(now, dt_timezone.utc))
+        else:
+            rows = rows.filter(next_send__gt=self.loaded_until)
+
+        loaded = 0
+        for email_id, next_send in rows.values_list('id', 'next_send').iterator(chunk_size=2000):
+            self.wheel.add(email_id, next_send.timestamp())
+            loaded += 1
+        self.loaded_until = until
+        self.next_refill = now + self.refill_interval
+        return loaded
+
+    def reload(self, email_ids):
+        """Re-read invalidated rows inside the loaded window"""
+        for email_id in email_ids:
+            self.wheel.remove(email_id)
+        rows = ScheduledEmail.objects.filter(
+            id__in=email_ids, is_active=True, next_send__lte=self.loaded_until
+        )
+        for email_id, next_send in rows.values_list('id', 'next_send'):
+            self.wheel.add(email_id, next_send.timestamp())
+
+    def apply_invalidations(self, now):
+        seq = cache.get(SEQ_KEY, 0)
+        if seq == self.seq or self.loaded_until is None:
+            self.seq = seq
+            return
+
+        email_ids = set()
+        for number in range(self.seq + 1, seq + 1):
+            ids = cache.get(f'{PREFIX}:invalidated:{number}')
+            if ids is None:
+                # Missed part of the log; start over from the database
+                logger.warning("Timing wheel invalidations expired, reloading the horizon")
+                self.wheel = TimingWheel(tick=self.tick, start=now)
+                self.loaded_until = None
+                self.seq = seq
+                self.refill(now)
+                return
+            email_ids.update(ids)
+        self.seq = seq
+        self.reload(list(email_ids))
+
+    def fire(self, now):
+        from .tasks import claim_due_emails, enqueue_send_batches
+
+        email_ids = self.wheel.advance(now)
+        if not email_ids:
+            return 0
+        claimed = claim_due_emails(len(email_ids), email_ids=email_ids)
+        enqueue_send_batches(claimed)
+        self.fired += len(claimed)
+        return len(claimed)
+
+    def run_once(self, now=None):
+        now = time.time() if now is None else now
+        if now >= self.next_refill:
+            self.refill(now)
+        self.apply_invalidations(now)
+        return self.fire(now)
+
+    def run_forever(self, stop=None):
+        while stop is None or not stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Timing wheel tick failed")
+            time.sleep(max(0.0, self.tick - time.time() % self.tick))
@@ -2,15 +2,21 @@ from django.urls import path
 from .telex_integration import TelexWebhookView
 from .views import (
     UserLoginView, UserRegisterView, ParseEmailRequestView,
-    ScheduleEmailView, ListScheduledEmailsView, CancelScheduledEmailView
+    EmailTemplateView, ScheduleEmailView, BulkScheduleEmailView, ListScheduledEmailsView, CancelScheduledEmailView,
+    BulkCancelScheduledEmailsView, ExportScheduledEmailsView, MetricsView
 )
 
 urlpatterns = [
     path('auth/register/', UserRegisterView.as_view(), name='register'),
     path('auth/login/', UserLoginView.as_view(), name='login'),
     path('email/parse/', ParseEmailRequestView.as_view(), name='parse-email'),
+    path('email/templates/', EmailTemplateView.as_view(), name='email-templates'),
     path('email/schedule/', ScheduleEmailView.as_view(), name='schedule-email'),
+    path('email/schedule/bulk/', BulkScheduleEmailView.as_view(), name='bulk-schedule-email'),
     path('email/list/', ListScheduledEmailsView.as_view(), name='list-emails'),
+    path('email/cancel/', BulkCancelScheduledEmailsView.as_view(), name='bulk-cancel-emails'),
     path('email/cancel/<int:email_id>/', CancelScheduledEmailView.as_view(), name='cancel-email'),
+    path('email/export/', ExportScheduledEmailsView.as_view(), name='export-emails'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('telex/webhook/', TelexWebhookView.as_view(), name='telex-webhook'),
 ]
@@ -0,0 +1,109 @@
+"""
+Sender email -> user id resolution for the Telex hot path.
+
+Lookups go through a bounded in-process LRU, then the shared Django cache,
+then the database. Unknown senders are cached as negative entries for a
+shorter time so repeated /list or /cancel calls from them stay off the DB.
+
+Shared entries are stamped with a version token kept per address. Saving
+or deleting a user replaces the token of its address (and of the address
+it changed away from), so only that sender's entries stop being trusted;
+the version is read in the same round trip as the entry. In-process
+entries are trusted for at most SENDER_CACHE_LOCAL_TTL seconds, so other
+processes notice a change within that time without a shared read per
+lookup.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+# Stored for senders with no user row
+MISSING = 0
+
+_local = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cache_key(email):
+    return f'sender-user:{email}'
+
+
+def _version_key(email):
+    return f'sender-user:version:{email}'
+
+
+def _remember(email, user_id, version):
+    ttl = settings.SENDER_CACHE_TTL if user_id else settings.SENDER_CACHE_NEGATIVE_TTL
+    with _lock:
+        _local[email] = (user_id, time.monotonic() + min(ttl, settings.SENDER_CACHE_LOCAL_TTL))
+        _local.move_to_end(email)
+        while len(_local) > settings.SENDER_CACHE_SIZE:
+            _local.popitem(last=False)
+    cache.set(_cache_key(email), (user_id, version), ttl)
+
+
+def lookup_user_id(email):
+    """Return the id of the user with this email, or None if there is none"""
+    with _lock:
+        entry = _local.get(email)
+        if entry and entry[1] > time.monotonic():
+            _local.move_to_end(email)
+            return entry[0] or None
+
+    # The version is read before the user row, so a save racing this lookup
+    # outdates what it stores
+    stored = cache.get_many([_cache_key(email), _version_key(email)])
+    version = stored.get(_version_key(email))
+    shared = stored.get(_cache_key(email))
+    if isinstance(shared, tuple) and shared[1] == version:
+        user_id = shared[0]
+    else:
+        user_id = User.objects.filter(email=email).values_list('id', flat=True).first() or MISSING
+    _remember(email, user_id, version)
+    return user_id or None
+
+
+def get_or_create_user_id(email):
+    """Return the id of the user with this email, creating the user if needed"""
+    user_id = lookup_user_id(email)
+    if user_id:
+        return user_id
+
+    user, _ = User.objects.get_or_create(
+        email=email,
+        defaults={'username': email.split('@')[0]}
+    )
+    # Stamped with the version post_save just set, so the new entry is trusted
+    _remember(email, user.id, cache.get(_version_key(email)))
+    return user.id
+
+
+def invalidate(email):
+    """Drop this email's entry here and outdate it in every process"""
+    with _lock:
+        _local.pop(email, None)
+    cache.set(_version_key(email), uuid.uuid4().hex, settings.SENDER_CACHE_TTL)
+
+
+@receiver(pre_save, sender=User)
+def remember_previous_email(sender, instance, update_fields=None, **kwargs):
+    # Entries for the old address must go too; saves that cannot change
+    # it (last_login on every login) skip the query
+    if instance.pk and (update_fields is None or 'email' in update_fields):
+        instance._previous_email = User.objects.filter(pk=instance.pk).values_list('email', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    invalidate(instance.email)
+    previous = getattr(instance, '_previous_email', None)
+    if previous and previous != instance.email:
+        invalidate(previous)
@@ -1,16 +1,33 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-from pytz import timezone as pytz_timezone
+from pytz import timezone as pytz_timezone, UnknownTimeZoneError
 from datetime import datetime, timedelta
-import re
 import json
-
-from .models import ScheduledEmail
-from .serializers import ScheduledEmailSerializer
-from .tasks import send_scheduled_email
+import base64
+import binascii
+
+from .authentication import HasMetricsToken, MetricsTokenAuthentication, SignedTokenAuthentication, issue_token
+from .export import CONTENT_TYPES, export_chunks, export_queryset
+from .idempotency import idempotent
+from .list_cache import invalidate_lists
+from .metrics import instrument, render_metrics
+from .models import EmailRecipient, EmailTemplate, ScheduledEmail
+from .parser import parse_command
+from .recurrence import normalize_rule
+from .routing import QUEUES, default_priority
+from .serializers import ScheduledEmailSerializer, serialize_values, value_fields
+from .tasks import cancel_emails, enqueue_send_batches
+from .timing_wheel import invalidate, within_horizon
 
 LAGOS_TZ = pytz_timezone('Africa/Lagos')
 
@@ -30,6 +47,8 @@ class UserLoginView(APIView):
                     'user_id': user.id,
                     'username': user.username,
                     'email': user.email,
+                    'token': issue_token(user),
+                    'expires_in': settings.API_TOKEN_MAX_AGE,
                     'message': 'Login successful'
                 }, status=status.HTTP_200_OK)
             else:
@@ -80,74 +99,11 @@ class ParseEmailRequestView(APIView):
         "Send me 'Hello world' on Friday at 2pm"
         "Send 'Birthday message' to john@example.com every birthday"
         """
-        result = {
-            'subject': None,
-            'content': None,
-            'recipient_email': None,
-            'scheduled_time': None,
-            'recurrence_type': 'once',
-            'email_header': None
-        }
-
-        # Extract content between quotes
-        content_match = re.search(r"['\"](.+?)['\"]", text)
-        if content_match:
-            result['content'] = content_match.group(1)
-
-        # Extract recipient email
-        email_match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
-        if email_match:
-            result['recipient_email'] = email_match.group(0)
-
-        # Extract recurrence
-        recurrence_keywords = {
-            'daily': 'daily',
-            'every day': 'daily',
-            'weekly': 'weekly',
-            'every week': 'weekly',
-            'monthly': 'monthly',
-            'every month': 'monthly',
-            'yearly': 'yearly',
-            'every year': 'yearly',
-            'birthday': 'birthday',
-            'every birthday': 'birthday',
-            'anniversary': 'anniversary',
-            'every anniversary': 'anniversary',
-            'employment': 'employment',
-            'job anniversary': 'employment',
-        }
-
-        text_lower = text.lower()
-        for keyword, recurrence in recurrence_keywords.items():
-            if keyword in text_lower:
-                result['recurrence_type'] = recurrence
-                break
-
-        # Simple time extraction
-        time_match = re.search(r'(\d{1,2}):(\d{2})\s*(am|pm)?', text)
-        if time_match:
-            hour = int(time_match.group(1))
-            minute = int(time_match.group(2))
-            period = time_match.group(3)
-
-            if period and period.lower() == 'pm' and hour != 12:
-                hour += 12
-            elif period and period.lower() == 'am' and hour == 12:
-                hour = 0
-
-            now = datetime.now(LAGOS_TZ)
-            scheduled = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-
-            # If time is in past, schedule for tomorrow
-            if scheduled < now:
-                scheduled += timedelta(days=1)
-
-            result['scheduled_time'] = scheduled
+        result = parse_command(text)
 
         # Extract subject (first few words)
-        if not result['subject']:
-            words = text.split()[:5]
-            result['subject'] = ' '.join(words)[:255]
+        words = text.split()[:5]
+        result['subject'] = ' '.join(words)[:255]
 
         return result
 
@@ -191,62 +147,188 @@ class ParseEmailRequestView(APIView):
         }, status=status.HTTP_200_OK)
 
 
-class ScheduleEmailView(APIView):
-    """Schedule an email"""
+RECURRENCE_TYPES = {choice for choice, _ in ScheduledEmail.RECURRENCE_CHOICES}
+
+
+def parse_schedule_item(data, bulk=False):
+    """
+    Validate a single schedule payload.
+
+    Returns (fields, None) with the ScheduledEmail field values on success,
+    or (None, error message) when the payload is invalid. Without an explicit
+    priority, `bulk` items default to the bulk tier. fields['recipients']
+    lists every address of a multi-recipient schedule (empty for one), to be
+    saved as EmailRecipient rows.
+    """
+    recipient_email = data.get('recipient_email')
+    content = data.get('content')
+    template_id = data.get('template_id')
+    scheduled_time_str = data.get('scheduled_time')
+    recurrence_type = data.get('recurrence_type', 'once')
+
+    recipients = data.get('recipients')
+    if recipients is not None:
+        if not isinstance(recipients, list) or not all(isinstance(address, str) for address in recipients):
+            return None, 'recipients must be a list of email addresses'
+        addresses = [recipient_email] if recipient_email else []
+        recipients = list(dict.fromkeys(address.strip() for address in addresses + recipients))
+        if len(recipients) > settings.EMAIL_MAX_RECIPIENTS_PER_SCHEDULE:
+            return None, f'At most {settings.EMAIL_MAX_RECIPIENTS_PER_SCHEDULE} recipients per email'
+        for address in recipients:
+            try:
+                validate_email(address)
+            except ValidationError:
+                return None, f'Invalid recipient address: {address}'
+        recipient_email = recipient_email or (recipients[0] if recipients else None)
+
+    if not all([recipient_email, content or template_id, scheduled_time_str]):
+        return None, (
+            'Missing required fields: recipient_email (or recipients), '
+            'content (or template_id), scheduled_time'
+        )
+
+    if template_id is not None:
+        try:
+            template_id = int(template_id)
+        except (TypeError, ValueError):
+            return None, 'template_id must be an integer'
+
+    context = data.get('context') or {}
+    if not isinstance(context, dict):
+        return None, 'context must be an object'
+
+    if recurrence_type not in RECURRENCE_TYPES:
+        return None, f'Invalid recurrence_type. Use one of: {", ".join(sorted(RECURRENCE_TYPES))}'
+
+    tz_name = data.get('timezone') or 'Africa/Lagos'
+    try:
+        tz = pytz_timezone(tz_name)
+    except UnknownTimeZoneError:
+        return None, f'Unknown timezone: {tz_name}'
+
+    try:
+        scheduled_time = datetime.fromisoformat(scheduled_time_str)
+        scheduled_time = tz.localize(scheduled_time)
+    except (TypeError, ValueError):
+        return None, 'Invalid datetime format. Use ISO format: 2025-11-07T14:00:00'
+
+    recurrence_rule = data.get('recurrence_rule') or ''
+    if recurrence_type == 'custom':
+        try:
+            recurrence_rule = normalize_rule(recurrence_rule, scheduled_time, tz_name)
+        except (TypeError, ValueError):
+            return None, 'A valid recurrence_rule (RRULE) is required for custom recurrence'
+
+    priority = data.get('priority') or default_priority(recurrence_type, scheduled_time, bulk=bulk)
+    if priority not in QUEUES:
+        return None, f'Invalid priority. Use one of: {", ".join(QUEUES)}'
+
+    return {
+        'recipient_email': recipient_email,
+        'subject': data.get('subject', 'Scheduled Message'),
+        'content': content or '',
+        'template_id': template_id,
+        'context': context,
+        'email_header': data.get('email_header', 'Scheduled Message'),
+        'scheduled_time': scheduled_time,
+        'recurrence_type': recurrence_type,
+        'recurrence_rule': recurrence_rule,
+        'timezone': tz_name,
+        'priority': priority,
+        'next_send': scheduled_time,
+        'recipients': recipients if recipients and len(recipients) > 1 else [],
+    }, None
+
+
+def missing_templates(template_ids, user):
+    """The ids in `template_ids` with no EmailTemplate owned by `user`, in one query"""
+    template_ids = {template_id for template_id in template_ids if template_id is not None}
+    if not template_ids:
+        return set()
+    found = EmailTemplate.objects.filter(id__in=template_ids, user=user).values_list('id', flat=True)
+    return template_ids - set(found)
+
+
+def request_body_parts(request):
+    """Idempotency key parts for REST calls: the canonical request body"""
+    return [json.dumps(request.data, sort_keys=True, default=str)]
+
+
+class EmailTemplateView(APIView):
+    """Create a reusable message template, usable only by its creator"""
+
+    permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        """Schedule an email"""
-        recipient_email = request.data.get('recipient_email')
-        subject = request.data.get('subject', 'Scheduled Message')
-        content = request.data.get('content')
-        email_header = request.data.get('email_header', 'Scheduled Message')
-        scheduled_time_str = request.data.get('scheduled_time')
-        recurrence_type = request.data.get('recurrence_type', 'once')
+        name = request.data.get('name')
+        subject = request.data.get('subject')
+        text_body = request.data.get('text_body')
 
-        if not all([recipient_email, content, scheduled_time_str]):
+        if not all([name, subject, text_body]):
             return Response({
                 'status': 'error',
-                'message': 'Missing required fields: recipient_email, content, scheduled_time'
+                'message': 'Missing required fields: name, subject, text_body'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get or create user from recipient email
-        user, _ = User.objects.get_or_create(
-            email=recipient_email,
-            defaults={'username': recipient_email.split('@')[0]}
+        template = EmailTemplate.objects.create(
+            user=request.user,
+            name=name,
+            subject=subject,
+            text_body=text_body,
+            html_body=request.data.get('html_body', '')
         )
 
-        try:
-            scheduled_time = datetime.fromisoformat(scheduled_time_str)
-            scheduled_time = LAGOS_TZ.localize(scheduled_time)
-        except ValueError:
+        return Response({
+            'status': 'success',
+            'template_id': template.id,
+            'message': f'✅ Template "{template.name}" created'
+        }, status=status.HTTP_201_CREATED)
+
+
+class ScheduleEmailView(APIView):
+    """Schedule an email for the caller"""
+
+    permission_classes = [IsAuthenticated]
+
+    @instrument('schedule')
+    @idempotent('schedule', request_body_parts)
+    def post(self, request):
+        """Schedule an email"""
+        fields, error = parse_schedule_item(request.data)
+        if error:
             return Response({
                 'status': 'error',
-                'message': 'Invalid datetime format. Use ISO format: 2025-11-07T14:00:00'
+                'message': error
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            email = ScheduledEmail.objects.create(
-                user=user,
-                recipient_email=recipient_email,
-                subject=subject,
-                content=content,
-                email_header=email_header,
-                scheduled_time=scheduled_time,
-                recurrence_type=recurrence_type,
-                next_send=scheduled_time
-            )
+        recipient_email = fields['recipient_email']
+        scheduled_time = fields['scheduled_time']
 
-            # Schedule task with Celery
-            send_scheduled_email.apply_async(
-                args=[email.id],
-                eta=scheduled_time
-            )
+        if missing_templates([fields['template_id']], request.user):
+            return Response({
+                'status': 'error',
+                'message': 'Template not found'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+
+        recipients = fields.pop('recipients')
+        try:
+            with transaction.atomic():
+                email = ScheduledEmail.objects.create(user=user, **fields)
+                EmailRecipient.objects.bulk_create(
+                    [EmailRecipient(schedule=email, email=address) for address in recipients]
+                )
+            if email.next_send <= within_horizon():
+                invalidate([email.id])
+            invalidate_lists([user.id])
 
             return Response({
                 'status': 'success',
                 'email_id': email.id,
                 'message': f'✅ Email scheduled for {scheduled_time.strftime("%A, %B %d at %I:%M %p %Z")}',
-                'recipient': recipient_email
+                'recipient': recipient_email,
+                'recipient_count': len(recipients) or 1
             }, status=status.HTTP_201_CREATED)
 
         except Exception as e:
@@ -256,34 +338,224 @@ class ScheduleEmailView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BulkScheduleEmailView(APIView):
+    """
+    Schedule many emails in one request.
+
+    Body: {"emails": [<ScheduleEmailView payload>, ...]}
+    Every item is validated up front and owned by the caller, rows are
+    inserted with bulk_create and items that are already due are handed
+    to the batch sender straight away. The response carries one result
+    per item, in request order. A request holds at most
+    EMAIL_BULK_MAX_ITEMS items and EMAIL_BULK_MAX_RECIPIENTS addresses.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @instrument('schedule_bulk')
+    @idempotent('schedule-bulk', request_body_parts)
+    def post(self, request):
+        items = request.data.get('emails') if isinstance(request.data, dict) else None
+
+        if not isinstance(items, list) or not items:
+            return Response({
+                'status': 'error',
+                'message': 'Provide a non-empty "emails" list'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(items) > settings.EMAIL_BULK_MAX_ITEMS:
+            return Response({
+                'status': 'error',
+                'message': f'At most {settings.EMAIL_BULK_MAX_ITEMS} emails per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Counted before any item is validated, so an oversized request costs
+        # nothing; every item sends to at least one address
+        total_recipients = sum(
+            max(len(item['recipients']) if isinstance(item.get('recipients'), list) else 0, 1)
+            for item in items if isinstance(item, dict)
+        )
+        if total_recipients > settings.EMAIL_BULK_MAX_RECIPIENTS:
+            return Response({
+                'status': 'error',
+                'message': f'At most {settings.EMAIL_BULK_MAX_RECIPIENTS} recipients per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            if isinstance(item, dict):
+                fields, error = parse_schedule_item(item, bulk=True)
+            else:
+                fields, error = None, 'Each item must be an object'
+
+            if error:
+                results[index] = {'index': index, 'status': 'error', 'message': error}
+            else:
+                valid.append((index, fields))
+
+        unknown_templates = missing_templates((fields['template_id'] for _, fields in valid), request.user)
+        if unknown_templates:
+            still_valid = []
+            for index, fields in valid:
+                if fields['template_id'] in unknown_templates:
+                    results[index] = {'index': index, 'status': 'error', 'message': 'Template not found'}
+                else:
+                    still_valid.append((index, fields))
+            valid = still_valid
+
+        now = timezone.now()
+        lease_until = now + timedelta(seconds=settings.EMAIL_DISPATCH_LEASE_SECONDS)
+        pending = []
+        pending_recipients = []
+        for index, fields in valid:
+            # Due items are leased here and sent below, so the dispatcher skips them
+            due = fields['next_send'] <= now
+            recipients = fields.pop('recipients')
+            email = ScheduledEmail(user=request.user, locked_until=lease_until if due else None, **fields)
+            pending.append((index, email))
+            if recipients:
+                pending_recipients.append((email, recipients))
+
+        try:
+            with transaction.atomic():
+                ScheduledEmail.objects.bulk_create(
+                    [email for _, email in pending],
+                    batch_size=settings.EMAIL_BULK_INSERT_BATCH_SIZE
+                )
+                EmailRecipient.objects.bulk_create(
+                    [
+                        EmailRecipient(schedule=email, email=address)
+                        for email, addresses in pending_recipients for address in addresses
+                    ],
+                    batch_size=settings.EMAIL_BULK_INSERT_BATCH_SIZE
+                )
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': f'Error scheduling emails: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        for index, email in pending:
+            results[index] = {'index': index, 'status': 'success', 'email_id': email.id}
+
+        enqueue_send_batches([email.id for _, email in pending if email.locked_until])
+        horizon = within_horizon(now)
+        invalidate(
+            email.id for _, email in pending
+            if not email.locked_until and email.next_send <= horizon
+        )
+        invalidate_lists(email.user_id for _, email in pending)
+
+        return Response({
+            'status': 'success' if pending else 'error',
+            'scheduled': len(pending),
+            'failed': len(items) - len(pending),
+            'results': results
+        }, status=status.HTTP_201_CREATED if pending else status.HTTP_400_BAD_REQUEST)
+
+
+def encode_cursor(next_send, email_id):
+    """Opaque keyset cursor pointing just after this row in (next_send, id) order"""
+    raw = f"{next_send.isoformat()}|{email_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        next_send, email_id = raw.split('|')
+        return datetime.fromisoformat(next_send), int(email_id)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+
+
 class ListScheduledEmailsView(APIView):
-    """List all scheduled emails"""
+    """
+    List the caller's scheduled emails, one keyset page at a time.
 
+    Query params:
+        recipient_email - only emails to this recipient
+        cursor - `next_cursor` from the previous page
+        page_size - rows per page (capped at EMAIL_LIST_MAX_PAGE_SIZE)
+        fields - comma separated subset of serializer fields
+        count - "true" to include the total number of matching emails
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @instrument('list')
     def get(self, request):
         # Get recipient_email from query params or request data
         recipient_email = request.query_params.get('recipient_email') or request.data.get('recipient_email')
-        
+
+        emails = ScheduledEmail.objects.filter(user=request.user, is_active=True, next_send__isnull=False)
         if recipient_email:
-            emails = ScheduledEmail.objects.filter(recipient_email=recipient_email, is_active=True)
-        else:
-            emails = ScheduledEmail.objects.filter(is_active=True)
+            emails = emails.filter(recipient_email=recipient_email)
 
-        serializer = ScheduledEmailSerializer(emails, many=True)
-        return Response({
-            'status': 'success',
-            'count': emails.count(),
-            'emails': serializer.data
-        }, status=status.HTTP_200_OK)
+        try:
+            page_size = int(request.query_params.get('page_size', settings.EMAIL_LIST_PAGE_SIZE))
+        except ValueError:
+            return Response({
+                'status': 'error',
+                'message': 'page_size must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        page_size = max(1, min(page_size, settings.EMAIL_LIST_MAX_PAGE_SIZE))
+
+        fields = ScheduledEmailSerializer.Meta.fields
+        if request.query_params.get('fields'):
+            fields = [f.strip() for f in request.query_params['fields'].split(',') if f.strip()]
+            unknown = set(fields) - set(ScheduledEmailSerializer.Meta.fields)
+            if unknown:
+                return Response({
+                    'status': 'error',
+                    'message': f'Unknown fields: {", ".join(sorted(unknown))}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        response = {'status': 'success'}
+        if request.query_params.get('count', '').lower() in ['true', '1', 'yes']:
+            response['count'] = emails.count()
+
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                after_time, after_id = decode_cursor(cursor)
+            except ValueError:
+                return Response({
+                    'status': 'error',
+                    'message': 'Invalid cursor'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            emails = emails.filter(
+                Q(next_send__gt=after_time) | Q(next_send=after_time, id__gt=after_id)
+            )
+
+        # Rows are read as tuples and rendered like the serializer would,
+        # with the keyset columns appended; one extra row tells whether
+        # another page exists
+        fields, columns = value_fields(fields)
+        page = list(
+            emails.order_by('next_send', 'id')
+            .values_list(*columns, 'next_send', 'id')[:page_size + 1]
+        )
+        has_more = len(page) > page_size
+        page = page[:page_size]
+
+        response['emails'] = serialize_values((row[:-2] for row in page), fields)
+        response['next_cursor'] = encode_cursor(*page[-1][-2:]) if has_more else None
+        return Response(response, status=status.HTTP_200_OK)
 
 
 class CancelScheduledEmailView(APIView):
-    """Cancel a scheduled email"""
+    """Cancel one of the caller's scheduled emails"""
 
+    permission_classes = [IsAuthenticated]
+
+    @instrument('cancel')
     def delete(self, request, email_id):
         try:
-            email = ScheduledEmail.objects.get(id=email_id)
-            email.is_active = False
-            email.save()
+            email = ScheduledEmail.objects.only('id', 'subject').get(id=email_id, user=request.user)
+            cancel_emails(ScheduledEmail.objects.filter(id=email.id))
             return Response({
                 'status': 'success',
                 'message': f'✅ Email "{email.subject}" has been cancelled'
@@ -297,4 +569,120 @@ class CancelScheduledEmailView(APIView):
             return Response({
                 'status': 'error',
                 'message': f'Error cancelling email: {str(e)}'
-            }, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BulkCancelScheduledEmailsView(APIView):
+    """
+    Cancel many of the caller's scheduled emails at once.
+
+    Body: exactly one of {"ids": [...]}, {"recipient_email": "..."} or
+    {"user_id": ...}. Runs a single UPDATE and one batched revoke; emails
+    owned by other users are never matched.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @instrument('cancel_bulk')
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            return Response({
+                'status': 'error',
+                'message': 'Expected a JSON object'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        selectors = [key for key in ('ids', 'recipient_email', 'user_id') if request.data.get(key)]
+        if len(selectors) != 1:
+            return Response({
+                'status': 'error',
+                'message': 'Provide exactly one of: ids, recipient_email, user_id'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        selector = selectors[0]
+        value = request.data[selector]
+        if selector == 'ids' and not isinstance(value, list):
+            return Response({
+                'status': 'error',
+                'message': 'ids must be a list'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        lookup = {'ids': 'id__in', 'recipient_email': 'recipient_email', 'user_id': 'user_id'}[selector]
+        try:
+            cancelled = cancel_emails(ScheduledEmail.objects.filter(user=request.user, **{lookup: value}))
+        except (TypeError, ValueError):
+            return Response({
+                'status': 'error',
+                'message': f'Invalid {selector}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'success',
+            'cancelled': cancelled,
+            'message': f'✅ {cancelled} email(s) cancelled'
+        }, status=status.HTTP_200_OK)
+
+
+class ExportScheduledEmailsView(APIView):
+    """
+    Stream every schedule of a user and/or recipient domain (admins only).
+
+    Query params:
+        user_id - only this user's schedules
+        domain - only schedules to recipients at this domain
+        type - "ndjson" (default) or "csv" (`format` is taken by DRF's
+               renderer override)
+        gzip - "true" to gzip the stream
+        active - "true" to skip cancelled and finished schedules
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        fmt = request.query_params.get('type', 'ndjson')
+        if fmt not in CONTENT_TYPES:
+            return Response({
+                'status': 'error',
+                'message': f'type must be one of: {", ".join(CONTENT_TYPES)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.query_params.get('user_id')
+        domain = request.query_params.get('domain')
+        if not user_id and not domain:
+            return Response({
+                'status': 'error',
+                'message': 'Provide user_id and/or domain'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            user_id = int(user_id) if user_id else None
+        except ValueError:
+            return Response({
+                'status': 'error',
+                'message': 'user_id must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        compress = request.query_params.get('gzip', '').lower() in ['true', '1', 'yes']
+        active_only = request.query_params.get('active', '').lower() in ['true', '1', 'yes']
+        emails = export_queryset(user_id=user_id, domain=domain, active_only=active_only)
+
+        filename = f'schedules.{fmt}' + ('.gz' if compress else '')
+        response = StreamingHttpResponse(
+            export_chunks(emails, fmt, compress=compress),
+            content_type='application/gzip' if compress else f'{CONTENT_TYPES[fmt]}; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class MetricsView(APIView):
+    """
+    Prometheus metrics for the send pipeline and the API.
+
+    They name the sending account and the domains it mails, so only staff
+    users and scrapers holding METRICS_TOKEN may read them.
+    """
+
+    authentication_classes = [MetricsTokenAuthentication, SignedTokenAuthentication]
+    permission_classes = [IsAdminUser | HasMetricsToken]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')